@@ -0,0 +1,91 @@
+"""Chunking throughput microbenchmark.
+
+Run from the repository root: python -m benchmarks.bench_chunking [--mb 8]
+"""
+
+import argparse
+import random
+import time
+
+from ragoo.services.chunking import TextChunker
+
+WORDS = "the pump valve pressure manual error code E-1042 reset filter unit".split()
+
+
+def synthetic_text(size_mb: float, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    target = int(size_mb * 1024 * 1024)
+    paragraphs, size = [], 0
+    while size < target:
+        sentences = [
+            " ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 24))) + "."
+            for _ in range(rng.randint(2, 8))
+        ]
+        paragraph = " ".join(sentences)
+        if rng.random() < 0.05:
+            paragraph = f"## Section {len(paragraphs)}\n\n{paragraph}"
+        paragraphs.append(paragraph)
+        size += len(paragraph) + 2
+    return "\n\n".join(paragraphs)
+
+
+def legacy_split(text: str, chunk_size: int) -> list[str]:
+    """The backward character scan previously used by pdfs/chunking.py
+    (with a bounds check it lacked at the end of the text)"""
+    chunks, start = [], 0
+    while start < len(text):
+        end = min(start + chunk_size, len(text))
+        split_point = -1
+        for i in range(end - 1, start, -1):
+            if text[i] in [".", "?", "!"] and i + 1 < len(text) and text[i + 1] == " ":
+                split_point = i + 1
+                break
+        if split_point != -1:
+            end = split_point
+        chunks.append(text[start:end])
+        start = end
+    return chunks
+
+
+def measure(label: str, func, text: str, repeat: int):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        chunks = func(text)
+        best = min(best, time.perf_counter() - started)
+    mb = len(text.encode("utf-8")) / (1024 * 1024)
+    print(f"{label:<32} {len(chunks):>8} chunks {mb / best:>9.1f} MB/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--mb", type=float, default=8.0, help="input size in MB")
+    parser.add_argument("--chunk-size", type=int, default=2048)
+    parser.add_argument("--overlap", type=int, default=256)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    text = synthetic_text(args.mb)
+    measure(
+        "legacy backward scan",
+        lambda t: legacy_split(t, args.chunk_size),
+        text,
+        args.repeat,
+    )
+    for unit, size, overlap in (
+        ("chars", args.chunk_size, args.overlap),
+        ("tokens", args.chunk_size // 4, args.overlap // 4),
+    ):
+        chunker = TextChunker(chunk_size=size, overlap=overlap, unit=unit)
+        measure(f"TextChunker ({unit}={size})", chunker.split, text, args.repeat)
+        pages = [(n, page) for n, page in enumerate(text.split("\n\n"), start=1)]
+        measure(
+            f"TextChunker pages ({unit})",
+            lambda _: list(chunker.chunk_pages(pages)),
+            text,
+            args.repeat,
+        )
+
+
+if __name__ == "__main__":
+    main()
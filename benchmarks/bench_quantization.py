@@ -0,0 +1,163 @@
+"""Compressed vector tier: resident memory per million chunks against recall@k.
+
+Run from the repository root: python -m benchmarks.bench_quantization [--chunks 100000]
+
+Embeddings are synthetic, 768-dimensional like nomic-embed-text, with
+variance decaying across dimensions so that leading dimensions carry most
+of the signal, as in Matryoshka-trained models. Queries are perturbed
+copies of stored vectors. Recall@k is measured against exact float32
+search.
+
+Each store is written to disk first, laid out as ChromaHandler does: the
+plain collection holds float32 vectors and its HNSW graph; with the tier,
+the collection holds placeholder vectors and the tier owns the real ones.
+Each configuration is then opened and searched in a fresh process, and
+"memory" is the growth of that process's resident set (Chroma plus the
+tier), read from /proc, so this benchmark runs on Linux only. MB/M scales
+it to a million chunks after taking off what serving an empty collection
+costs.
+"""
+
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import chromadb
+import numpy as np
+
+from ragoo.vectorestore.chroma_handler import PLACEHOLDER_EMBEDDING
+from ragoo.vectorestore.quantized_index import QuantizedIndex
+
+COLLECTION = "bench"
+CONFIGS = [
+    # (quantization, truncated dimensions, rescore factor)
+    ("int8", 0, 4),
+    ("int8", 256, 8),
+    ("binary", 0, 8),
+    ("binary", 0, 32),
+    ("binary", 512, 32),
+]
+
+
+def synthetic_embeddings(n: int, dim: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    decay = 1 / np.sqrt(1 + np.arange(dim) / 64)
+    centers = rng.normal(size=(max(1, n // 250), dim)) * decay
+    labels = rng.integers(len(centers), size=n)
+    vectors = centers[labels] + 0.5 * rng.normal(size=(n, dim)) * decay
+    return vectors.astype(np.float32)
+
+
+def resident_mb() -> float:
+    with open("/proc/self/statm") as f:
+        pages = int(f.read().split()[1])
+    return pages * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+def write_collection(directory: str, ids: list[str], vectors=None):
+    """A Chroma collection of the chunks, with their vectors or placeholders"""
+    client = chromadb.PersistentClient(path=directory)
+    collection = client.create_collection(COLLECTION, metadata={"hnsw:space": "cosine"})
+    batch = client.get_max_batch_size()
+    for start in range(0, len(ids), batch):
+        chunk_ids = ids[start : start + batch]
+        collection.add(
+            ids=chunk_ids,
+            documents=[f"chunk {i}" for i in chunk_ids],
+            metadatas=[{"source": "bench.pdf"}] * len(chunk_ids),
+            embeddings=(
+                vectors[start : start + batch]
+                if vectors is not None
+                else [PLACEHOLDER_EMBEDDING] * len(chunk_ids)
+            ),
+        )
+
+
+def serve(chroma_dir: str, tier: dict | None, queries: np.ndarray, k: int):
+    """Opens a store and answers the queries, as a server process would;
+    returns the resident memory it grew by, the IDs found and latencies"""
+    before = resident_mb()
+    collection = chromadb.PersistentClient(path=chroma_dir).get_collection(COLLECTION)
+    index = QuantizedIndex(**tier) if tier else None
+    found, latencies = [], []
+    for query in queries:
+        started = time.perf_counter()
+        if index is None:
+            ids = collection.query(query_embeddings=[query], n_results=k)["ids"][0]
+        else:
+            ids = [chunk_id for chunk_id, _ in index.search([query], k)[0]]
+            collection.get(ids=ids, include=["documents", "metadatas"])
+        latencies.append((time.perf_counter() - started) * 1000)
+        found.append([int(chunk_id) for chunk_id in ids])
+    return resident_mb() - before, found, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--chunks", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    vectors = synthetic_embeddings(args.chunks, args.dim)
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.choice(args.chunks, args.queries)]
+    queries = queries + 0.3 * rng.normal(size=queries.shape).astype(np.float32)
+    normed = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    truth = np.argsort(-(queries @ normed.T), axis=1)[:, : args.k]
+    ids = [str(i) for i in range(args.chunks)]
+
+    def report(label, resident, found, latencies, fixed=0.0):
+        recall = np.mean(
+            [
+                len(set(hits) & set(expected.tolist())) / args.k
+                for hits, expected in zip(found, truth)
+            ]
+        )
+        print(
+            f"{label:<28} {resident:>8.0f} MB"
+            f" {(resident - fixed) * 1e6 / args.chunks:>8.0f} MB/M"
+            f"   recall@{args.k} {recall:.3f}"
+            f"   p50 {np.percentile(latencies, 50):.2f}ms"
+        )
+
+    spawn = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as directory:
+        empty_dir = os.path.join(directory, "empty")
+        plain_dir = os.path.join(directory, "plain")
+        tiered_dir = os.path.join(directory, "tiered")
+        write_collection(empty_dir, [])
+        write_collection(plain_dir, ids, vectors)
+        write_collection(tiered_dir, ids)
+
+        with ProcessPoolExecutor(1, mp_context=spawn) as process:
+            fixed = process.submit(serve, empty_dir, None, queries, args.k).result()[0]
+        print(f"{'empty collection':<28} {fixed:>8.0f} MB")
+        with ProcessPoolExecutor(1, mp_context=spawn) as process:
+            result = process.submit(serve, plain_dir, None, queries, args.k)
+            report("chroma float32 (HNSW)", *result.result(), fixed)
+
+        for quantization, dimensions, factor in CONFIGS:
+            tier = {
+                "path": os.path.join(directory, f"{quantization}-{dimensions}"),
+                "quantization": quantization,
+                "dimensions": dimensions,
+                "rescore_factor": factor,
+            }
+            index = QuantizedIndex(**tier)
+            for start in range(0, args.chunks, 10_000):
+                index.add(ids[start : start + 10_000], vectors[start : start + 10_000])
+            del index
+
+            with ProcessPoolExecutor(1, mp_context=spawn) as process:
+                result = process.submit(serve, tiered_dir, tier, queries, args.k)
+                label = f"{quantization}@{dimensions or args.dim} x{factor} rescore"
+                report(label, *result.result(), fixed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""Vector store backends compared on recall and latency.
+
+Run from the repository root: python -m benchmarks.bench_vectorstore [--chunks 50000]
+
+Embeddings are synthetic (clustered Gaussian vectors), so no Ollama is
+needed. Recall@k is measured against exact float32 search.
+"""
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from ragoo.core.config import settings
+from ragoo.vectorestore.chroma_handler import ChromaHandler
+from ragoo.vectorestore.memmap_store import MemmapVectorStore
+
+
+class LookupEmbeddingClient:
+    """Returns the precomputed vector of each synthetic document"""
+
+    def __init__(self, vectors: dict[str, list[float]]):
+        self.vectors = vectors
+
+    def embed(self, texts):
+        return [self.vectors[text] for text in texts]
+
+
+def synthetic_embeddings(n: int, dim: int, clusters: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim))
+    labels = rng.integers(clusters, size=n)
+    vectors = centers[labels] + 0.6 * rng.normal(size=(n, dim))
+    return vectors.astype(np.float32)
+
+
+def exact_top_k(vectors: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    normed = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    q = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+    return np.argsort(-(q @ normed.T), axis=1)[:, :k]
+
+
+def measure(label, store, documents, vectors, queries, truth, k, directory):
+    store.embedding_function.client = LookupEmbeddingClient(
+        {doc: vec.tolist() for doc, vec in zip(documents, vectors)}
+    )
+    started = time.perf_counter()
+    for start in range(0, len(documents), 1000):
+        batch = documents[start : start + 1000]
+        store.add_documents(batch, [{"source": "bench"}] * len(batch))
+    ingest = time.perf_counter() - started
+
+    latencies, recalls = [], []
+    for query, expected in zip(queries, truth):
+        started = time.perf_counter()
+        results = store.query("", k=k, mode="vector", query_embedding=query.tolist())
+        latencies.append((time.perf_counter() - started) * 1000)
+        found = {int(r["content"].split("-")[1]) for r in results}
+        recalls.append(len(found & set(expected.tolist())) / k)
+
+    size = sum(f.stat().st_size for f in Path(directory).rglob("*") if f.is_file())
+    print(
+        f"{label:<24} ingest {ingest:>7.1f}s  p50 {np.percentile(latencies, 50):>7.2f}ms"
+        f"  p95 {np.percentile(latencies, 95):>7.2f}ms"
+        f"  recall@{k} {np.mean(recalls):.3f}  disk {size / 2**20:>7.1f} MB"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--chunks", type=int, default=50_000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--skip-chroma", action="store_true")
+    args = parser.parse_args()
+
+    settings.MMR_ENABLED = False
+    settings.LEXICAL_INDEX_ENABLED = False
+    settings.EMBEDDING_CACHE_ENABLED = False
+    settings.MEMMAP_IVF_MIN_TRAIN = min(settings.MEMMAP_IVF_MIN_TRAIN, args.chunks)
+
+    vectors = synthetic_embeddings(args.chunks, args.dim, args.clusters)
+    queries = synthetic_embeddings(args.queries, args.dim, args.clusters, seed=1)
+    truth = exact_top_k(vectors, queries, args.k)
+    documents = [f"chunk-{i}" for i in range(args.chunks)]
+
+    backends = [
+        ("memmap float16 exact", dict(dtype="float16", index="exact")),
+        ("memmap int8 exact", dict(dtype="int8", index="exact")),
+        ("memmap float16 ivf", dict(dtype="float16", index="ivf")),
+        ("memmap int8 ivf", dict(dtype="int8", index="ivf")),
+    ]
+    for label, options in backends:
+        with tempfile.TemporaryDirectory() as directory:
+            store = MemmapVectorStore(directory=directory, **options)
+            measure(label, store, documents, vectors, queries, truth, args.k, directory)
+
+    if not args.skip_chroma:
+        with tempfile.TemporaryDirectory() as directory:
+            settings.CHROMA_PERSIST_DIR = directory
+            store = ChromaHandler()
+            measure(
+                "chroma hnsw",
+                store,
+                documents,
+                vectors,
+                queries,
+                truth,
+                args.k,
+                directory,
+            )
+
+
+if __name__ == "__main__":
+    main()
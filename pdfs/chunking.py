@@ -1,16 +1,17 @@
 import os
 import re
-import hashlib
-import requests
-import json
 from chromadb import PersistentClient
 import chromadb.utils.embedding_functions as embedding_functions
 
+# Shared with the API; run from the repository root: python -m pdfs.chunking
+from ragoo.services.chunking import TextChunker, iter_markdown_pages
+from ragoo.services.ollama_service import OllamaEmbeddingClient
+from ragoo.vectorestore.base import generate_chunk_id
+from ragoo.vectorestore.embedding_cache import content_hash, get_embedding_cache
+
 # Configuration
 CHROMA_DB_PATH = "chroma_db"  # Directory to store the ChromaDB database
-OLLAMA_API_URL = (
-    "http://localhost:11434/api/embeddings"  # Or wherever your ollama is running
-)
+OLLAMA_HOST = "http://localhost:11434"  # Or wherever your ollama is running
 MODEL_NAME = (
     "nomic-embed-text"  # The ollama model you want to use (ensure it's installed)
 )
@@ -29,12 +30,7 @@ def read_md_file(filepath):
 
 def split_into_pages(text, page_separator="-----"):
     """Splits a Markdown document into pages based on the specified separator."""
-    pages = text.split(page_separator)
-    # Remove leading/trailing whitespace from each page
-    pages = [page.strip() for page in pages]
-    # Filter out empty pages
-    pages = [page for page in pages if page]
-    return pages
+    return [page for _, page in iter_markdown_pages(text, page_separator)]
 
 
 def clean_page_content(text):
@@ -54,119 +50,69 @@ def clean_page_content(text):
 
 
 def create_chunks_with_overlap(
-    pages, overlap=0.2
-):  # Overlap as a fraction of page content
-    """Creates chunks from pages, with overlap between them."""
-    chunks = []
-    num_pages = len(pages)
-
-    for i in range(num_pages):
-        page = pages[i]
-        cleaned_page = clean_page_content(page)
-
-        if cleaned_page:  # Only add the chunk, if the chunk is not empty
-            chunks.append(
-                {"page_number": i + 1, "content": cleaned_page}  # Number of page
-            )
+    pages, overlap=0.2, source="unknown"
+):  # Overlap as a fraction of MAX_CHUNK_SIZE
+    """Creates boundary-aware chunks from pages, with overlap between them.
+
+    The overlap used to be a fraction of the previous page, with every page
+    chunked on its own. Chunks now run across pages, so boundaries and IDs
+    differ from files ingested before the change; re-ingest those into a
+    fresh collection rather than adding to the old one.
+
+    Chunk IDs are built from the source like the API's, so a file ingested
+    here is recognised as unchanged when it is uploaded again.
+    """
+    chunker = TextChunker(
+        chunk_size=MAX_CHUNK_SIZE, overlap=int(MAX_CHUNK_SIZE * overlap), unit="chars"
+    )
+    cleaned_pages = (
+        (i + 1, clean_page_content(page)) for i, page in enumerate(pages)
+    )  # Number of page
 
     overlapped_chunks = []
-
-    for i in range(len(chunks)):
-        current_chunk = chunks[i]
-        content = current_chunk["content"]
-        page_number = current_chunk["page_number"]
-
-        if i > 0:
-            previous_chunk = chunks[i - 1]
-            previous_content = previous_chunk["content"]
-
-            overlap_length = int(
-                len(previous_content) * overlap
-            )  # Length to use from previous page
-
-            overlap_text = previous_content[
-                -overlap_length:
-            ]  # Extract content from back
-
-            combined_content = f"{overlap_text}\n{content}"  # Combine both
-        else:
-            combined_content = content
-
-        # Split the combined content into chunks of MAX_CHUNK_SIZE, if necessary
-        if len(combined_content) > MAX_CHUNK_SIZE:
-            split_chunks = split_text_into_chunks(combined_content, MAX_CHUNK_SIZE)
-            for j, split_chunk in enumerate(split_chunks):
-                chunk_id = generate_chunk_id(split_chunk)
-                overlapped_chunks.append(
-                    {
-                        "id": f"{chunk_id}_{j}",  # Add index to avoid duplicate IDs
-                        "page_number": page_number,
-                        "content": split_chunk,
-                    }
-                )
-        else:
-            chunk_id = generate_chunk_id(combined_content)
-            overlapped_chunks.append(
-                {
-                    "id": chunk_id,
-                    "page_number": page_number,
-                    "content": combined_content,
-                }
-            )
+    seen_ids = set()
+    for content, metadata in chunker.chunk_pages(cleaned_pages):
+        chunk_hash = content_hash(content)
+        chunk_id = generate_chunk_id(source, chunk_hash)
+        if chunk_id in seen_ids:  # Identical chunks are stored once
+            continue
+        seen_ids.add(chunk_id)
+        overlapped_chunks.append(
+            {
+                "id": chunk_id,
+                "page_number": metadata["page"],
+                "content": content,
+                "content_hash": chunk_hash,
+            }
+        )
 
     return overlapped_chunks
 
 
 def split_text_into_chunks(text, chunk_size):
     """Splits text into chunks of a specified size. Tries to split on sentences."""
-    chunks = []
-    start = 0
-    while start < len(text):
-        end = min(start + chunk_size, len(text))
-        # Try to split the chunk on a sentence boundary (., ?, !)
-        split_point = -1
-        for i in range(end - 1, start, -1):
-            if text[i] in [".", "?", "!"] and text[i + 1] == " ":
-                split_point = i + 1
-                break
-
-        if split_point != -1:
-            end = split_point
-
-        chunks.append(text[start:end])
-        start = end
-    return chunks
-
-
-def generate_chunk_id(chunk_content):
-    """Generates a unique ID for a chunk."""
-    hash_object = hashlib.sha256(chunk_content.encode("utf-8"))
-    return hash_object.hexdigest()
-
-
-def ollama_embedding(text, ollama_api_url=OLLAMA_API_URL, model_name=MODEL_NAME):
-    """Generates embeddings using an Ollama instance via HTTP request. No library dependencies."""
-    # print(text) # Commented out to prevent excessive printing.
-    try:
-        payload = json.dumps({"prompt": text, "model": model_name})
-        headers = {"Content-Type": "application/json"}
-        response = requests.post(
-            ollama_api_url, headers=headers, data=payload, stream=False
-        )  # Important: stream=False
+    return TextChunker(chunk_size=chunk_size, overlap=0, unit="chars").split(text)
 
-        response.raise_for_status()  # Raise HTTPError for bad responses (4xx or 5xx)
-        json_response = response.json()
 
-        return json_response["embedding"]  # Extract embedding from JSON
-    except requests.exceptions.RequestException as e:
-        print(f"Error during Ollama request: {e}")
-        return None
-    except KeyError:
-        print(f"Unexpected JSON response from Ollama: {json_response}")
-        return None
+def ollama_embeddings(texts, ollama_host=OLLAMA_HOST, model_name=MODEL_NAME):
+    """Embeds texts in batches through Ollama's /api/embed endpoint, using the
+    API's client and embedding cache. Returns None if Ollama fails."""
+    client = OllamaEmbeddingClient(
+        host=ollama_host, model=model_name, cache=get_embedding_cache()
+    )
+    try:
+        return client.embed(texts)
     except Exception as e:
-        print(f"General Error during embedding: {e}")
+        print(f"Error during Ollama request: {e}")
         return None
+    finally:
+        client.close()
+
+
+def ollama_embedding(text, ollama_host=OLLAMA_HOST, model_name=MODEL_NAME):
+    """Generates the embedding of a single text, or None if Ollama fails."""
+    embeddings = ollama_embeddings([text], ollama_host, model_name)
+    return embeddings[0] if embeddings else None
 
 
 def process_md_file(filepath, overlap=0.2, collection_name="my_collection"):
@@ -176,7 +122,7 @@ def process_md_file(filepath, overlap=0.2, collection_name="my_collection"):
         return
 
     pages = split_into_pages(content)
-    overlapped_chunks = create_chunks_with_overlap(pages, overlap)
+    overlapped_chunks = create_chunks_with_overlap(pages, overlap, source=filepath)
 
     client = PersistentClient(path=CHROMA_DB_PATH)  # Chroma client
 
@@ -194,15 +140,15 @@ def process_md_file(filepath, overlap=0.2, collection_name="my_collection"):
         chunk_ids.append(chunk_id)
         chunk_contents.append(chunk["content"])
         chunk_metadatas.append(
-            {"page_number": chunk["page_number"], "source": filepath}
+            {
+                "page_number": chunk["page_number"],
+                "source": filepath,
+                "content_hash": chunk["content_hash"],
+            }
         )
 
-    chunk_embeddings = [
-        ollama_embedding(text) for text in chunk_contents
-    ]  # Get it from ollama api call.
-    chunk_embeddings = [
-        emb for emb in chunk_embeddings if emb is not None
-    ]  # Cleaning if there are nones, maybe due to a timeout
+    # One batched call for the whole file; empty if Ollama failed
+    chunk_embeddings = ollama_embeddings(chunk_contents) or []
 
     # Ensure that the lengths of ids, embeddings, and metadatas match.
     ids_to_add = chunk_ids[: len(chunk_embeddings)]
@@ -4,14 +4,82 @@ from pydantic_settings import BaseSettings, SettingsConfigDict
 class Settings(BaseSettings):
 
     database_url: str = "sqlite:///./rag.db"
+    ASYNC_DATABASE_URL: str = ""  # defaults to database_url with an async driver
+    DATABASE_POOL_SIZE: int = 5
+    DATABASE_MAX_OVERFLOW: int = 10
+    DATABASE_POOL_TIMEOUT: float = 30.0  # seconds to wait for a connection
+    DATABASE_POOL_RECYCLE: int = 1800  # seconds, server databases only
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000  # how long a writer waits for the lock
     secret_key: str = "your-secret-key-here"
     algorithm: str = "HS256"
     access_token_expire_minutes: int = 30
+    TOKEN_CACHE_MAX_ENTRIES: int = 10_000  # verified tokens, 0 disables
+    USER_CACHE_MAX_ENTRIES: int = 10_000  # user records for login, 0 disables
+    USER_CACHE_TTL_SECONDS: float = 300
+    PASSWORD_HASH_WORKERS: int = 2  # bcrypt threads, apart from the threadpool
+    PASSWORD_HASH_MAX_QUEUE: int = 64  # waiting password checks before 503
     OLLAMA_HOST: str = "http://localhost:11434"
+    OLLAMA_TIMEOUT: float = 120.0
+    OLLAMA_MAX_CONNECTIONS: int = 32
+    OLLAMA_KEEP_ALIVE: str = "30m"  # idle time before Ollama unloads a model
+    WARMUP_MODELS: bool = True  # load the models at startup, before /ready passes
     EMBEDDING_MODEL: str = "nomic-embed-text"
+    EMBEDDING_BATCH_SIZE: int = 64
+    EMBEDDING_MAX_WORKERS: int = 4
+    EMBEDDING_MAX_RETRIES: int = 3
+    EMBEDDING_RETRY_BACKOFF: float = 0.5
+    EMBEDDING_BATCH_WAIT_MS: float = 5.0  # how long a batch waits to fill up
+    EMBEDDING_CACHE_ENABLED: bool = True
+    EMBEDDING_CACHE_PATH: str = (
+        ""  # defaults to CHROMA_PERSIST_DIR/embedding_cache.sqlite3
+    )
+    EMBEDDING_CACHE_MAX_ENTRIES: int = 500_000
+    EMBEDDING_CACHE_MEMORY_SIZE: int = 10_000
     COMPLETION_MODEL: str = "qwen2.5:0.5b"
+    ANSWER_CACHE_ENABLED: bool = False  # single-process only, see AnswerCache
+    ANSWER_CACHE_MAX_ENTRIES: int = 1024
+    ANSWER_CACHE_TTL_SECONDS: float = 3600
+    ANSWER_CACHE_SEMANTIC_DISTANCE: float = 0.0  # cosine distance, 0 disables
+    VECTORSTORE_BACKEND: str = "chroma"  # or "memmap"
     CHROMA_PERSIST_DIR: str = "./chroma_db"
-    CHROMA_COLLECTION_NAME: str = "rag_documents"
+    CHROMA_COLLECTION_NAME: str = "rag_documents"  # used by every backend
+    CHROMA_MAX_WORKERS: int = 8
+    QUANTIZED_TIER: str = ""  # "int8" or "binary" codes for dense search
+    QUANTIZED_DIMENSIONS: int = 0  # leading dimensions kept, 0 keeps all
+    QUANTIZED_RESCORE_FACTOR: int = 0  # shortlist per result; 0: 4 int8, 32 binary
+    MEMMAP_PERSIST_DIR: str = ""  # defaults to CHROMA_PERSIST_DIR; one process only
+    MEMMAP_DTYPE: str = "float16"  # or "int8"
+    MEMMAP_INDEX: str = "exact"  # or "ivf"
+    MEMMAP_IVF_LISTS: int = 0  # 0 uses sqrt(chunks)
+    MEMMAP_IVF_PROBES: int = 8  # lists scanned per query
+    MEMMAP_IVF_MIN_TRAIN: int = 20_000  # exact search below this many chunks
+    RETRIEVAL_MODE: str = "vector"  # "vector", "lexical" or "hybrid"
+    LEXICAL_INDEX_ENABLED: bool = True
+    HYBRID_CANDIDATES: int = 20  # per retriever, before rank fusion
+    RRF_K: int = 60
+    MMR_ENABLED: bool = False
+    MMR_DIVERSITY: float = 0.3  # 0 ranks by relevance only
+    RETRIEVAL_FETCH_FACTOR: int = 4  # candidates fetched per returned chunk
+    DEDUP_SIMILARITY: float = 0.97  # cosine similarity of near-copies
+    DEDUP_TEXT_OVERLAP: float = 0.5  # share of word trigrams in common
+    CONTEXT_TOKEN_BUDGET: int = 0  # 0 disables the limit
+    BATCH_QUERY_MAX_QUERIES: int = 1000
+    BATCH_QUERY_CONCURRENCY: int = 4  # generations in flight per batch
+    GENERATION_MAX_CONCURRENCY: int = 4  # generations running against Ollama
+    GENERATION_MAX_QUEUE: int = 64  # waiting generations before 429
+    GENERATION_MAX_QUEUE_WAIT: float = 30.0  # seconds
+    GENERATION_USER_MAX_CONCURRENCY: int = 0  # per user, 0 disables
+    GENERATION_USER_MAX_QUEUED: int = 0  # per user, 0 disables
+    INGESTION_MAX_WORKERS: int = 2
+    INGESTION_BATCH_SIZE: int = 64
+    INGESTION_SPOOL_DIR: str = "./uploads"
+    INGESTION_LEASE_SECONDS: float = 60  # running jobs not renewed are requeued
+    MAX_UPLOAD_BYTES: int = 512 * 1024 * 1024
+    CHUNK_SIZE: int = 2048
+    CHUNK_OVERLAP: int = 256
+    CHUNK_UNIT: str = "chars"  # or "tokens"
+    PDF_EXTRACT_WORKERS: int = 0  # 0 uses every core
+    PDF_PAGES_PER_TASK: int = 16
 
     model_config = SettingsConfigDict(env_file=".env")
 
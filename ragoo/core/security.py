@@ -1,3 +1,9 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
 import bcrypt
 from fastapi import Depends, HTTPException
 from fastapi.security import OAuth2PasswordBearer
@@ -5,10 +11,123 @@ from jose import JWTError, jwt
 from datetime import datetime, timedelta
 from ragoo.core.config import settings
 
-
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="users/login")
 
 
+class TokenCache:
+    """Bounded LRU of verified token payloads.
+
+    A token is only cached once its signature and claims have been checked,
+    and its entry expires with the token's ``exp`` claim, so a hit is as
+    good as a fresh ``jwt.decode``. Tokens without an expiry are not cached.
+    """
+
+    def __init__(self, max_entries: int = 10_000):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+
+    def get(self, token: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, payload = entry
+            if time.time() >= expires_at:
+                del self._entries[token]
+                self.expired += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return dict(payload)
+
+    def put(self, token: str, payload: dict):
+        expires_at = payload.get("exp")
+        if self.max_entries <= 0 or not isinstance(expires_at, (int, float)):
+            return
+        with self._lock:
+            self._entries[token] = (expires_at, dict(payload))
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "expired": self.expired,
+            }
+
+
+class PasswordHasher:
+    """Runs bcrypt on its own small thread pool.
+
+    bcrypt is deliberately slow and releases the GIL, so hashing on
+    dedicated threads keeps a burst of logins from occupying the threadpool
+    shared by every sync endpoint. At most ``max_workers`` hashes run and
+    ``max_queue`` wait; beyond that requests get a 503 with Retry-After.
+    """
+
+    def __init__(self, max_workers: int = 2, max_queue: int = 64):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="bcrypt"
+        )
+        self._pending = 0
+        self._lock = threading.Lock()
+        self.completed = 0
+        self.rejected = 0
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(verify_password, plain_password, hashed_password)
+
+    async def hash(self, password: str) -> str:
+        return await self._run(get_password_hash, password)
+
+    async def _run(self, func, *args):
+        with self._lock:
+            if self._pending >= self.max_workers + self.max_queue:
+                self.rejected += 1
+                raise HTTPException(
+                    status_code=503,
+                    detail="Too many password checks in progress",
+                    headers={"Retry-After": "1"},
+                )
+            self._pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, func, *args)
+        finally:
+            with self._lock:
+                self._pending -= 1
+                self.completed += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.max_workers,
+                "pending": self._pending,
+                "completed": self.completed,
+                "rejected": self.rejected,
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     # Convert hashed_password from string to bytes
     return bcrypt.checkpw(
@@ -31,13 +150,17 @@ def create_access_token(data: dict):
 
 
 def decode_token(token: str):
+    payload = token_cache.get(token)
+    if payload is not None:
+        return payload
     try:
         payload = jwt.decode(
             token, settings.secret_key, algorithms=[settings.algorithm]
         )
-        return payload
     except JWTError:
         return None
+    token_cache.put(token, payload)
+    return payload
 
 
 async def get_current_user(token: str = Depends(oauth2_scheme)):
@@ -48,3 +171,10 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
     if not payload:
         raise credentials_exception
     return payload
+
+
+token_cache = TokenCache(settings.TOKEN_CACHE_MAX_ENTRIES)
+password_hasher = PasswordHasher(
+    max_workers=settings.PASSWORD_HASH_WORKERS,
+    max_queue=settings.PASSWORD_HASH_MAX_QUEUE,
+)
@@ -1,10 +1,98 @@
-from sqlalchemy import create_engine
+# Database engines and sessions, configured from settings
+from functools import lru_cache
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import declarative_base, sessionmaker
+from ragoo.core.config import settings
 
+# Async drivers used when ASYNC_DATABASE_URL is not set
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "mysql": "mysql+aiomysql",
+}
 
-engine = create_engine("sqlite:///./rag.db")
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """WAL lets readers run alongside a writer, and the busy timeout makes
+    writers from other processes wait for the lock instead of failing with
+    "database is locked". synchronous=NORMAL is durable under WAL except
+    for the last commits on power loss."""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_MS)}")
+    cursor.close()
+
+
+def engine_options(url: URL) -> dict:
+    """Connection and pool options for an engine on the given URL"""
+    if url.get_backend_name() != "sqlite":
+        return {
+            "pool_size": settings.DATABASE_POOL_SIZE,
+            "max_overflow": settings.DATABASE_MAX_OVERFLOW,
+            "pool_timeout": settings.DATABASE_POOL_TIMEOUT,
+            "pool_recycle": settings.DATABASE_POOL_RECYCLE,
+            "pool_pre_ping": True,
+        }
+    options = {
+        # Sessions are used from threadpool threads, never concurrently
+        "connect_args": {
+            "check_same_thread": False,
+            "timeout": settings.SQLITE_BUSY_TIMEOUT_MS / 1000,
+        }
+    }
+    if url.database and url.database != ":memory:":
+        options["pool_size"] = settings.DATABASE_POOL_SIZE
+        options["max_overflow"] = settings.DATABASE_MAX_OVERFLOW
+        options["pool_timeout"] = settings.DATABASE_POOL_TIMEOUT
+    return options
+
+
+def create_db_engine(url: str):
+    """Sync engine for a database URL, with SQLite pragmas applied on connect"""
+    url = make_url(url)
+    engine = create_engine(url, **engine_options(url))
+    if url.get_backend_name() == "sqlite":
+        event.listen(engine, "connect", set_sqlite_pragmas)
+    return engine
+
+
+def async_database_url(url: str) -> URL:
+    """The async-driver form of a database URL"""
+    url = make_url(url)
+    driver = ASYNC_DRIVERS.get(url.get_backend_name())
+    if driver is None:
+        raise ValueError(f"No async driver known for {url.get_backend_name()}")
+    return url.set(drivername=driver)
+
+
+def create_async_db_engine(url: str | URL):
+    """Async engine for an async-driver URL, with SQLite pragmas applied on
+    connect"""
+    url = make_url(url)
+    engine = create_async_engine(url, **engine_options(url))
+    if url.get_backend_name() == "sqlite":
+        event.listen(engine.sync_engine, "connect", set_sqlite_pragmas)
+    return engine
+
+
+engine = create_db_engine(settings.database_url)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+
+@lru_cache(maxsize=None)
+def get_async_sessionmaker() -> async_sessionmaker[AsyncSession]:
+    """Returns the process-wide async session factory, creating its engine on
+    first use so that importing this module needs no async driver"""
+    async_engine = create_async_db_engine(
+        settings.ASYNC_DATABASE_URL or async_database_url(settings.database_url)
+    )
+    # Objects stay usable after commit without an implicit, awaitable refresh
+    return async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+
 Base = declarative_base()
 
 
@@ -14,3 +102,8 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    async with get_async_sessionmaker()() as db:
+        yield db
@@ -1,5 +1,6 @@
 # SQLAlchemy models
-from sqlalchemy import Column, Integer, String
+from datetime import datetime
+from sqlalchemy import Boolean, Column, DateTime, Integer, String, Text
 from .database import Base
 
 
@@ -9,3 +10,49 @@ class User(Base):
     username = Column(String, unique=True, index=True)
     email = Column(String, unique=True, index=True)
     hashed_password = Column(String)
+
+
+class IngestionJob(Base):
+    __tablename__ = "ingestion_jobs"
+    id = Column(String, primary_key=True)
+    kind = Column(String, nullable=False)  # "pdf" or "documents"
+    source = Column(String)
+    owner = Column(String, index=True)  # "sub" of the user who submitted it
+    path = Column(String)  # spooled payload, removed once the job finishes
+    status = Column(String, nullable=False, default="queued", index=True)
+    # Worker running the job, and until when; renewed while it runs
+    lease_owner = Column(String)
+    lease_expires = Column(DateTime)
+    replace = Column(Boolean, nullable=False, default=False)
+    chunks_done = Column(Integer, nullable=False, default=0)
+    chunks_total = Column(Integer)
+    pages_done = Column(Integer, nullable=False, default=0)
+    pages_total = Column(Integer)  # PDF jobs only
+    new_count = Column(Integer, nullable=False, default=0)
+    skipped_count = Column(Integer, nullable=False, default=0)
+    removed_count = Column(Integer, nullable=False, default=0)
+    error = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class Source(Base):
+    """Catalog entry for an ingested source, maintained on every write"""
+
+    __tablename__ = "sources"
+    collection = Column(String, primary_key=True)  # catalog the source is in
+    name = Column(String, primary_key=True)
+    chunk_count = Column(Integer, nullable=False, default=0)
+    # XOR of the chunk content hashes: order-independent, so it can be kept
+    # current chunk by chunk
+    content_hash = Column(String(64), nullable=False)
+    ingested_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class CollectionState(Base):
+    """Persisted write counter of a vector collection"""
+
+    __tablename__ = "collection_state"
+    name = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
@@ -1,13 +1,71 @@
 # FastAPI application initialization
+import asyncio
+import logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from starlette.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from ragoo.routes import user_routes, rag_routes, health
+from ragoo.core.config import settings
 from ragoo.database import models
 from ragoo.database.database import engine
+from ragoo.core.security import password_hasher
+from ragoo.services.rag_service import get_rag_service
+from ragoo.services.ingestion_service import get_ingestion_queue
+from ragoo.services.pdf_extraction import shutdown_pool
+from ragoo.services.startup import StartupProgress
 
-models.Base.metadata.create_all(bind=engine)
+logger = logging.getLogger(__name__)
 
-app = FastAPI()
+
+async def start_services(startup: StartupProgress, services: dict):
+    """Builds the services and warms up the models, off the request path.
+
+    Runs as a background task so the server accepts connections at once;
+    /ready reports the progress
+    """
+    async with startup.step("rag_service"):
+        services["rag_service"] = await run_in_threadpool(get_rag_service)
+    async with startup.step("source_catalog"):
+        # Backfill the source catalog for collections written without it
+        await run_in_threadpool(services["rag_service"].sync_source_catalog)
+    async with startup.step("ingestion_queue"):
+        services["ingestion_queue"] = await run_in_threadpool(get_ingestion_queue)
+        # Pick up ingestion jobs interrupted by a restart
+        await run_in_threadpool(services["ingestion_queue"].resume)
+    if settings.WARMUP_MODELS:
+        async with startup.step("models", required=False) as detail:
+            detail["load_ms"] = await services["rag_service"].async_llm.warm_up()
+    startup.finish()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.startup = StartupProgress()
+    # Every database route needs the tables, so they exist before the
+    # server accepts its first connection
+    async with app.state.startup.step("database"):
+        await run_in_threadpool(models.Base.metadata.create_all, bind=engine)
+    services = {}
+    task = asyncio.create_task(start_services(app.state.startup, services))
+    task.add_done_callback(_log_startup_failure)
+    yield
+    task.cancel()
+    if "ingestion_queue" in services:
+        services["ingestion_queue"].shutdown()
+    shutdown_pool()
+    password_hasher.shutdown()
+    if "rag_service" in services:
+        # Release the pooled Ollama connections on shutdown
+        await services["rag_service"].aclose()
+
+
+def _log_startup_failure(task: asyncio.Task):
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Startup failed", exc_info=task.exception())
+
+
+app = FastAPI(lifespan=lifespan)
 
 
 origins = [
@@ -1,4 +1,5 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse
 
 
 router = APIRouter()
@@ -10,3 +11,16 @@ async def health_check():
         "status": "OK",
         "service": "RAG API",
     }
+
+
+@router.get("/ready")
+async def readiness_check(request: Request):
+    """Whether startup has finished and the app can serve queries.
+
+    Unlike /health, which passes as soon as the process answers, this
+    responds 503 until the services are built and the models warmed up
+    """
+    startup = getattr(request.app.state, "startup", None)
+    if startup is None:
+        return JSONResponse({"status": "starting", "steps": {}}, status_code=503)
+    return JSONResponse(startup.status(), status_code=200 if startup.ready else 503)
@@ -1,43 +1,206 @@
 # RAG routes (API endpoints)
-from fastapi import APIRouter, Depends, HTTPException, UploadFile
+import json
+import os
+from typing import Literal
+from fastapi import (
+    APIRouter,
+    Depends,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+)
+from fastapi.responses import StreamingResponse
+from python_multipart.exceptions import MultipartParseError
+from python_multipart.multipart import MultipartParser, parse_options_header
+from starlette.concurrency import run_in_threadpool
 
-
-from ragoo.services.rag_service import rag_service
+from ragoo.services.admission import AdmissionRejected
+from ragoo.services.rag_service import RAGService, get_rag_service
+from ragoo.services.ingestion_service import IngestionQueue, get_ingestion_queue
+from ragoo.vectorestore.base import retrieval_filters
 from ragoo.schemas.document import DocumentBatch
-from ragoo.core.security import get_current_user
+from ragoo.schemas.job import JobResponse
+from ragoo.schemas.query import BatchQueryRequest, QueryFilters
+from ragoo.schemas.source import SourceResponse
+from ragoo.core.config import settings
+from ragoo.core.security import get_current_user, password_hasher, token_cache
+from ragoo.services.user_service import user_cache
 
 router = APIRouter()
 
 
+async def ndjson_response(events) -> StreamingResponse:
+    """Send an async iterator of event dicts as newline-delimited JSON.
+
+    The first event is produced before the response starts, so a request
+    refused by admission control still gets a 429 status
+    """
+    head = []
+    try:
+        head.append(await anext(events))
+    except StopAsyncIteration:
+        pass
+    except AdmissionRejected as e:
+        raise too_busy(e)
+    except Exception as e:
+        head.append({"event": "error", "detail": str(e)})
+        events = None
+
+    async def body():
+        for event in head:
+            yield json.dumps(event) + "\n"
+        if events is None:
+            return
+        try:
+            async for event in events:
+                yield json.dumps(event) + "\n"
+        except Exception as e:
+            # Headers are already sent, so report failures in-band
+            yield json.dumps({"event": "error", "detail": str(e)}) + "\n"
+
+    return StreamingResponse(body(), media_type="application/x-ndjson")
+
+
+def too_busy(e: AdmissionRejected) -> HTTPException:
+    return HTTPException(
+        status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)}
+    )
+
+
+def build_filters(filters: QueryFilters | None) -> dict:
+    """Retrieval filters for the vectorstore; 400 when malformed"""
+    if filters is None:
+        return {}
+    try:
+        return retrieval_filters(**filters.model_dump())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid filter: {str(e)}")
+
+
+def query_filters(
+    source: list[str] | None = Query(None),
+    page_from: int | None = Query(None, ge=0),
+    page_to: int | None = Query(None, ge=0),
+    where: str | None = Query(None, description="JSON metadata filter"),
+    where_document: str | None = Query(None, description="JSON text filter"),
+) -> dict:
+    """Retrieval filters from query parameters"""
+    try:
+        filters = QueryFilters(
+            sources=source,
+            page_from=page_from,
+            page_to=page_to,
+            where=json.loads(where) if where else None,
+            where_document=json.loads(where_document) if where_document else None,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid filter: {str(e)}")
+    return build_filters(filters)
+
+
 @router.post("/query")
-async def query_endpoint(query: str, user: dict = Depends(get_current_user)):
-    return rag_service.process_query(query)
+async def query_endpoint(
+    query: str,
+    stream: bool = False,
+    mode: Literal["vector", "lexical", "hybrid"] | None = None,
+    filters: dict = Depends(query_filters),
+    user: dict = Depends(get_current_user),
+    rag_service: RAGService = Depends(get_rag_service),
+):
+    """Answer a question from the vectorstore.
+
+    ``mode`` picks dense, BM25 or fused retrieval (default RETRIEVAL_MODE).
+    ``source`` (repeatable), ``page_from``/``page_to`` and the JSON
+    ``where``/``where_document`` filters restrict the search to matching
+    chunks. Responds 429 with Retry-After when generation capacity is
+    exhausted
+    """
+    if stream:
+        return await ndjson_response(
+            rag_service.astream_query(query, mode, user.get("sub"), filters)
+        )
+    try:
+        return await rag_service.aprocess_query(query, mode, user.get("sub"), filters)
+    except AdmissionRejected as e:
+        raise too_busy(e)
+
+
+@router.post("/query/batch")
+async def batch_query_endpoint(
+    batch: BatchQueryRequest,
+    user: dict = Depends(get_current_user),
+    rag_service: RAGService = Depends(get_rag_service),
+):
+    """Answer many questions in one pass, streamed back as NDJSON.
+
+    One line per question, in completion order, tagged with its index
+    """
+    return await ndjson_response(
+        rag_service.abatch_query(
+            batch.queries, batch.mode, user.get("sub"), build_filters(batch.filters)
+        )
+    )
 
 
 @router.post("/chat")
-async def query_endpoint(query: str, user: dict = Depends(get_current_user)):
-    return rag_service.chat(query)
+async def chat(
+    query: str,
+    stream: bool = False,
+    user: dict = Depends(get_current_user),
+    rag_service: RAGService = Depends(get_rag_service),
+):
+    if stream:
+        return await ndjson_response(rag_service.astream_chat(query, user.get("sub")))
+    try:
+        return await rag_service.achat(query, user.get("sub"))
+    except AdmissionRejected as e:
+        raise too_busy(e)
 
 
 @router.post("/documents")
 async def add_documents(
     document_batch: DocumentBatch,
+    response: Response,
+    background: bool = False,
+    replace: bool = False,
     user: dict = Depends(get_current_user),
+    rag_service: RAGService = Depends(get_rag_service),
+    ingestion_queue: IngestionQueue = Depends(get_ingestion_queue),
 ):
     """
     Add documents to the vector store with embeddings
+    With background=true the batch is queued and a job ID is returned
+    With replace=true the batch replaces the stored chunks of its sources
     Requires authentication
     """
     try:
         # Convert Pydantic model to list of (content, metadata) tuples
         documents = [(doc.content, doc.metadata) for doc in document_batch.documents]
 
+        if background:
+            job_id = await run_in_threadpool(
+                ingestion_queue.submit_documents,
+                documents,
+                replace,
+                user.get("sub"),
+            )
+            response.status_code = 202
+            return {
+                "message": "Documents queued for ingestion",
+                "job_id": job_id,
+                "status_url": f"/rag/jobs/{job_id}",
+            }
+
         # Add to vector store through service
-        result = rag_service.add_documents(documents)
+        result = await run_in_threadpool(rag_service.add_documents, documents, replace)
 
         return {
             "message": "Documents added successfully",
             "count": result["count"],
+            "new_count": result["new"],
+            "skipped_count": result["skipped"],
+            "removed_count": result["removed"],
             "document_ids": result["ids"],
         }
     except Exception as e:
@@ -46,40 +209,254 @@ async def add_documents(
         )
 
 
-@router.post("/upload")
-async def upload_pdf(file: UploadFile, user: dict = Depends(get_current_user)):
-    try:
-        if file.content_type != "application/pdf":
-            raise HTTPException(status_code=400, detail="Invalid file type")
+# The upload is read from the request stream, so describe its body by hand
+UPLOAD_REQUEST_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["file"],
+                    "properties": {"file": {"type": "string", "format": "binary"}},
+                }
+            }
+        },
+    }
+}
+# Room for the multipart boundaries and part headers around the file
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
 
-        # Read file content
-        pdf_content = await file.read()
 
-        # Process and chunk PDF (using service)
-        chunks = rag_service.process_pdf(pdf_content)
+@router.post("/upload", status_code=202, openapi_extra=UPLOAD_REQUEST_BODY)
+async def upload_pdf(
+    request: Request,
+    replace: bool = False,
+    user: dict = Depends(get_current_user),
+    ingestion_queue: IngestionQueue = Depends(get_ingestion_queue),
+):
+    """Queue a PDF for background parsing, chunking and embedding
 
-        # Add documents (chunks) to vector store
-        result = rag_service.add_documents(
-            [(chunk, {"source": file.filename}) for chunk in chunks]
+    With replace=true the upload replaces the stored version of the file;
+    only its changed chunks are embedded
+    """
+    path, filename = await spool_upload(
+        request, settings.MAX_UPLOAD_BYTES, ingestion_queue
+    )
+    try:
+        job_id = await run_in_threadpool(
+            ingestion_queue.submit_pdf, path, filename, replace, user.get("sub")
         )
 
         return {
-            "message": "PDF uploaded and processed",
-            "chunks_count": len(chunks),
-            "document_ids": result["ids"],
+            "message": "PDF queued for processing",
+            "job_id": job_id,
+            "status_url": f"/rag/jobs/{job_id}",
         }
 
     except Exception as e:
+        os.remove(path)
         raise HTTPException(status_code=500, detail=f"PDF processing failed: {str(e)}")
 
 
+async def spool_upload(
+    request: Request, max_bytes: int, ingestion_queue: IngestionQueue
+) -> tuple[str, str]:
+    """Streams the PDF in the "file" field of a multipart request into the
+    spool directory; returns the spooled path and the file's name.
+
+    The body is parsed straight from the request stream, so the file is
+    written to disk once, and an upload over max_bytes is refused from its
+    Content-Length before anything is read, or as soon as that many bytes
+    have arrived.
+    """
+    length = request.headers.get("content-length", "")
+    if length.isdigit() and int(length) > max_bytes + MULTIPART_OVERHEAD_BYTES:
+        raise HTTPException(status_code=413, detail="File too large")
+    content_type, params = parse_options_header(request.headers.get("content-type"))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise HTTPException(status_code=400, detail="Expected a multipart upload")
+
+    part = FilePart()
+    spool = await run_in_threadpool(ingestion_queue.new_spool_file, ".pdf")
+    try:
+        with spool:
+            parser = MultipartParser(params[b"boundary"], part.callbacks())
+            async for chunk in request.stream():
+                parser.write(chunk)
+                if (
+                    part.filename is not None
+                    and part.content_type != b"application/pdf"
+                ):
+                    raise HTTPException(status_code=400, detail="Invalid file type")
+                if part.size > max_bytes:
+                    raise HTTPException(status_code=413, detail="File too large")
+                if part.data:
+                    await run_in_threadpool(spool.write, b"".join(part.data))
+                    part.data.clear()
+            parser.finalize()
+        if part.filename is None:
+            raise HTTPException(status_code=422, detail="No file uploaded")
+    except MultipartParseError as e:
+        os.remove(spool.name)
+        raise HTTPException(status_code=400, detail=f"Malformed upload: {str(e)}")
+    except BaseException:
+        os.remove(spool.name)
+        raise
+    return spool.name, part.filename
+
+
+class FilePart:
+    """Multipart parser callbacks keeping the first part of the "file" field.
+
+    Its data is collected in ``data`` as it is parsed, for the caller to
+    write out after each chunk of the request body
+    """
+
+    def __init__(self):
+        self.filename: str | None = None
+        self.content_type: bytes | None = None
+        self.size = 0
+        self.data: list[bytes] = []
+        self._headers: dict[bytes, bytes] = {}
+        self._header = [b"", b""]
+        self._receiving = False
+
+    def callbacks(self) -> dict:
+        return {
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+        }
+
+    def on_header_field(self, data: bytes, start: int, end: int):
+        self._header[0] += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int):
+        self._header[1] += data[start:end]
+
+    def on_header_end(self):
+        name, value = self._header
+        self._headers[name.lower()] = value
+        self._header = [b"", b""]
+
+    def on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition"))
+        if (
+            self.filename is None
+            and options.get(b"name") == b"file"
+            and b"filename" in options
+        ):
+            self.filename = options[b"filename"].decode("utf-8", "replace")
+            self.content_type, _ = parse_options_header(
+                self._headers.get(b"content-type")
+            )
+            self._receiving = True
+
+    def on_part_data(self, data: bytes, start: int, end: int):
+        if self._receiving:
+            self.size += end - start
+            self.data.append(data[start:end])
+
+    def on_part_end(self):
+        self._receiving = False
+        self._headers = {}
+
+
+@router.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job(
+    job_id: str,
+    user: dict = Depends(get_current_user),
+    ingestion_queue: IngestionQueue = Depends(get_ingestion_queue),
+):
+    """Report the progress of an ingestion job submitted by the caller"""
+    job = await run_in_threadpool(ingestion_queue.get, job_id)
+    # Other users' jobs are reported as missing, not as forbidden
+    if job is None or job.owner != user.get("sub"):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
 @router.get("/sources")
-async def get_sources(user: dict = Depends(get_current_user)):
-    """Retrieve all sources from the vectorstore"""
+async def get_sources(
+    request: Request,
+    response: Response,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    detail: bool = False,
+    user: dict = Depends(get_current_user),
+    rag_service: RAGService = Depends(get_rag_service),
+):
+    """List ingested sources, one page at a time.
+
+    The ETag is the collection version, so clients can revalidate with
+    If-None-Match and get a 304 until the next write
+    """
+    catalog = rag_service.source_catalog
     try:
-        sources = rag_service.get_unique_sources()
-        return {"sources": sources}
+        version = await run_in_threadpool(catalog.version)
+        etag = f'"sources-{version}"'
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers={"ETag": etag})
+
+        total, rows = await run_in_threadpool(catalog.page, offset, limit)
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Failed to retrieve sources: {str(e)}"
         )
+
+    response.headers["ETag"] = etag
+    return {
+        "sources": [
+            SourceResponse.model_validate(row) if detail else row.name for row in rows
+        ],
+        "total": total,
+        "offset": offset,
+        "limit": limit,
+        "version": version,
+    }
+
+
+def etag_matches(header: str | None, etag: str) -> bool:
+    """Whether an If-None-Match header names the given ETag"""
+    if not header:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in header.split(",")]
+    return "*" in tags or etag in tags
+
+
+@router.delete("/sources/{source:path}")
+async def delete_source(
+    source: str,
+    user: dict = Depends(get_current_user),
+    rag_service: RAGService = Depends(get_rag_service),
+):
+    """Delete every chunk of a source"""
+    try:
+        deleted = await run_in_threadpool(rag_service.delete_source, source)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if not deleted:
+        raise HTTPException(status_code=404, detail="Source not found")
+    return {"source": source, "deleted_count": deleted}
+
+
+@router.get("/stats")
+async def get_stats(
+    user: dict = Depends(get_current_user),
+    rag_service: RAGService = Depends(get_rag_service),
+):
+    """Cache and queue counters for tuning"""
+    # Counting the vectorstore blocks (Chroma count, memmap lock)
+    stats = await run_in_threadpool(rag_service.get_stats)
+    return {
+        **stats,
+        "auth": {
+            "token_cache": token_cache.stats(),
+            "user_cache": user_cache.stats(),
+            "password_hasher": password_hasher.stats(),
+        },
+    }
@@ -1,30 +1,41 @@
 # User routes (API endpoints)
 from fastapi import APIRouter, Depends, HTTPException
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
-from ragoo.database.database import get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from ragoo.database.database import get_async_db
 from ragoo.schemas.user import UserCreate, UserResponse, Token
-from ragoo.services.user_service import create_user, get_user_by_username
-from ragoo.core.security import create_access_token, verify_password
+from ragoo.services.user_service import (
+    create_user,
+    get_user_by_username,
+    load_user_record,
+    user_cache,
+)
+from ragoo.core.security import create_access_token, password_hasher
 
 router = APIRouter()
 
 
 @router.post("/register", response_model=UserResponse)
-def register(user: UserCreate, db: Session = Depends(get_db)):
-    db_user = get_user_by_username(db, user.username)
+async def register(user: UserCreate, db: AsyncSession = Depends(get_async_db)):
+    db_user = await get_user_by_username(db, user.username)
     if db_user:
         raise HTTPException(status_code=400, detail="Username already registered")
-    return create_user(db, user)
+    # bcrypt runs on the password hasher's threads, not the shared threadpool
+    return await create_user(db, user)
 
 
 @router.post("/login", response_model=Token)
-def login(
+async def login(
     form_data: OAuth2PasswordRequestForm = Depends(),  # <-- Use OAuth2 form
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    user = get_user_by_username(db, form_data.username)  # <-- Access via form_data
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    # Repeated logins are served from the user cache without a query
+    user = user_cache.get(form_data.username)
+    if user is None:
+        user = await load_user_record(db, form_data.username)
+    if not user or not await password_hasher.verify(
+        form_data.password, user["hashed_password"]
+    ):
         raise HTTPException(status_code=401, detail="Invalid credentials")
-    access_token = create_access_token(data={"sub": user.username})
+    access_token = create_access_token(data={"sub": user["username"]})
     return {"access_token": access_token, "token_type": "bearer"}
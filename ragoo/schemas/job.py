@@ -0,0 +1,24 @@
+# Ingestion job schemas (Pydantic)
+from datetime import datetime
+from typing import Optional
+from pydantic import BaseModel, ConfigDict
+
+
+class JobResponse(BaseModel):
+    id: str
+    kind: str
+    source: Optional[str] = None
+    status: str
+    replace: bool = False
+    chunks_done: int
+    chunks_total: Optional[int] = None  # unknown while a PDF is still streaming
+    pages_done: int = 0
+    pages_total: Optional[int] = None  # PDF jobs only
+    new_count: int
+    skipped_count: int
+    removed_count: int = 0
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+
+    model_config = ConfigDict(from_attributes=True)
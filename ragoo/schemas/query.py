@@ -1 +1,33 @@
-# Query schemas for LLM
\ No newline at end of file
+# Query schemas for LLM
+from typing import Any, Literal, Optional
+from pydantic import BaseModel, ConfigDict, Field
+from ragoo.core.config import settings
+
+
+class QueryFilters(BaseModel):
+    """Restricts retrieval to matching chunks; ``where`` and
+    ``where_document`` use Chroma filter syntax"""
+
+    sources: Optional[list[str]] = None
+    page_from: Optional[int] = Field(default=None, ge=0)
+    page_to: Optional[int] = Field(default=None, ge=0)
+    where: Optional[dict[str, Any]] = None
+    where_document: Optional[dict[str, Any]] = None
+
+
+class BatchQueryRequest(BaseModel):
+    queries: list[str] = Field(
+        min_length=1, max_length=settings.BATCH_QUERY_MAX_QUERIES
+    )
+    mode: Optional[Literal["vector", "lexical", "hybrid"]] = None
+    filters: Optional[QueryFilters] = None
+
+    model_config = ConfigDict(
+        json_schema_extra={
+            "example": {
+                "queries": ["How do I reset the pump?", "What does E-1043 mean?"],
+                "mode": "hybrid",
+                "filters": {"sources": ["pump-manual.pdf"], "page_from": 10},
+            }
+        }
+    )
@@ -0,0 +1,13 @@
+# Source catalog schemas (Pydantic)
+from datetime import datetime
+from pydantic import BaseModel, ConfigDict
+
+
+class SourceResponse(BaseModel):
+    name: str
+    chunk_count: int
+    content_hash: str
+    ingested_at: datetime
+    updated_at: datetime
+
+    model_config = ConfigDict(from_attributes=True)
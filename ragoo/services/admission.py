@@ -0,0 +1,172 @@
+# Admission control for LLM generation: bounded concurrency, fair queueing
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+
+from ragoo.services.embedding_batcher import Histogram
+
+
+class AdmissionRejected(Exception):
+    """A generation was refused; the caller may retry after ``retry_after``
+    seconds"""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(f"Generation capacity exceeded ({reason})")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Bounds how many generations run at once and queues the excess.
+
+    At most ``max_concurrency`` generations hold a slot. Further requests
+    wait, at most ``max_queue`` of them and each for at most ``max_wait``
+    seconds; beyond that they are rejected straight away. Waiters are kept
+    per user and freed slots are handed out round-robin across users, so
+    one user's burst does not starve the others. With
+    ``user_max_concurrency`` set a user never holds more slots than that,
+    and with ``user_max_queued`` set their extra waiting requests are
+    rejected.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        max_queue: int,
+        max_wait: float,
+        user_max_concurrency: int = 0,
+        user_max_queued: int = 0,
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.user_max_concurrency = user_max_concurrency
+        self.user_max_queued = user_max_queued
+        self.active = 0
+        self.queued = 0
+        self._active_by_user: dict[str, int] = {}
+        self._waiters: OrderedDict[str, deque[asyncio.Future]] = OrderedDict()
+        self._service_time: float | None = None  # moving average, seconds
+        self.admitted = 0
+        self.rejected = {"queue_full": 0, "user_quota": 0, "timeout": 0}
+        self.wait_ms = Histogram(max(1, int(max_wait * 1000)))
+
+    @asynccontextmanager
+    async def slot(self, user: str | None = None):
+        """Holds a generation slot for the duration of the block"""
+        user = user or "anonymous"
+        await self.acquire(user)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._observe_service(time.perf_counter() - started)
+            self.release(user)
+
+    async def acquire(self, user: str):
+        queued_at = time.perf_counter()
+        if self._can_start(user):
+            # Free slots only remain while every waiter is over its quota
+            self._start(user)
+            self._admit(queued_at)
+            return
+
+        if self.queued >= self.max_queue:
+            self._reject("queue_full")
+        waiting = self._waiters.get(user)
+        if self.user_max_queued and waiting and len(waiting) >= self.user_max_queued:
+            self._reject("user_quota")
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(user, deque()).append(future)
+        self.queued += 1
+        try:
+            await asyncio.wait((future,), timeout=self.max_wait)
+        except asyncio.CancelledError:
+            self._abandon(user, future)
+            raise
+        if not future.done():
+            self._abandon(user, future)
+            self._reject("timeout")
+        self._admit(queued_at)
+
+    def release(self, user: str):
+        self.active -= 1
+        self._active_by_user[user] -= 1
+        if not self._active_by_user[user]:
+            del self._active_by_user[user]
+        self._dispatch()
+
+    def _can_start(self, user: str) -> bool:
+        if self.active >= self.max_concurrency:
+            return False
+        return (
+            not self.user_max_concurrency
+            or self._active_by_user.get(user, 0) < self.user_max_concurrency
+        )
+
+    def _start(self, user: str):
+        self.active += 1
+        self._active_by_user[user] = self._active_by_user.get(user, 0) + 1
+
+    def _dispatch(self):
+        """Hands free slots to waiters, taking users in turn"""
+        while self.active < self.max_concurrency:
+            user = next((u for u in self._waiters if self._can_start(u)), None)
+            if user is None:
+                return
+            waiting = self._waiters.pop(user)
+            future = waiting.popleft()
+            if waiting:
+                self._waiters[user] = waiting  # back of the line
+            self.queued -= 1
+            self._start(user)
+            future.set_result(None)
+
+    def _abandon(self, user: str, future: asyncio.Future):
+        if future.done():
+            # The slot was granted just as the caller gave up
+            self.release(user)
+            return
+        waiting = self._waiters[user]
+        waiting.remove(future)
+        if not waiting:
+            del self._waiters[user]
+        self.queued -= 1
+
+    def _admit(self, queued_at: float):
+        self.admitted += 1
+        self.wait_ms.observe(round((time.perf_counter() - queued_at) * 1000))
+
+    def _reject(self, reason: str):
+        self.rejected[reason] += 1
+        raise AdmissionRejected(reason, self.retry_after())
+
+    def _observe_service(self, seconds: float):
+        if self._service_time is None:
+            self._service_time = seconds
+        else:
+            self._service_time = 0.8 * self._service_time + 0.2 * seconds
+
+    def retry_after(self) -> int:
+        """Seconds until the current queue should have drained"""
+        service_time = self._service_time or 1.0
+        return max(
+            1, math.ceil(service_time * (self.queued + 1) / self.max_concurrency)
+        )
+
+    def stats(self) -> dict:
+        return {
+            "active": self.active,
+            "queued": self.queued,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+            "wait_ms": self.wait_ms.stats(),
+            "mean_generation_ms": (
+                round(self._service_time * 1000, 1) if self._service_time else None
+            ),
+        }
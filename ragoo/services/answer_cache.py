@@ -0,0 +1,165 @@
+# Answer cache for repeated RAG queries
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+import numpy as np
+
+
+def normalize_query(query: str) -> str:
+    """Case- and whitespace-insensitive form of a query used as cache key"""
+    return " ".join(query.lower().split())
+
+
+class AnswerCache:
+    """Bounded TTL cache of query answers.
+
+    Lookups first try the normalized query text. When ``semantic_distance``
+    is positive, an exact miss can fall back to the cached query whose
+    embedding is closest by cosine distance, if it is within that distance.
+    Both only match entries stored under the same ``scope``, such as the
+    retrieval mode the answer was grounded with.
+
+    Every entry belongs to a collection version; once the vectorstore
+    reports a new version the whole cache is dropped.
+
+    That version is counted in process, so the cache is single-process
+    only: writes made by another worker or by the batch scripts are not
+    seen, and stale answers are served until they expire after ``ttl``.
+    Run one worker, or keep the TTL short, when the cache is enabled.
+    """
+
+    def __init__(
+        self, max_entries: int = 1024, ttl: float = 3600, semantic_distance: float = 0.0
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.semantic_distance = semantic_distance
+        self._entries: OrderedDict[
+            tuple[str, str], tuple[float, dict, Optional[np.ndarray]]
+        ] = OrderedDict()
+        self._matrix: Optional[np.ndarray] = None
+        self._matrix_keys: list[tuple[str, str]] = []
+        self._version = None
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.invalidations = 0
+
+    def get(self, query: str, version: int, scope: str = "") -> Optional[dict]:
+        """Returns the cached response for the normalized query text"""
+        key = (normalize_query(query), scope)
+        with self._lock:
+            self.lookups += 1
+            if not self._check_version(version):
+                return None
+            entry = self._live_entry(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            self.exact_hits += 1
+            return dict(entry[1])
+
+    def get_similar(
+        self, embedding: list[float], version: int, scope: str = ""
+    ) -> Optional[dict]:
+        """Returns the response cached for the nearest query embedding within
+        ``semantic_distance``, to be tried after an exact miss"""
+        if self.semantic_distance <= 0:
+            return None
+        with self._lock:
+            if not self._check_version(version):
+                return None
+            match = self._nearest(embedding, scope)
+            if match is None:
+                return None
+            self._entries.move_to_end(match)
+            self.semantic_hits += 1
+            return dict(self._entries[match][1])
+
+    def put(
+        self,
+        query: str,
+        version: int,
+        response: dict,
+        embedding: Optional[list[float]] = None,
+        scope: str = "",
+    ):
+        key = (normalize_query(query), scope)
+        vector = None
+        if embedding is not None and self.semantic_distance > 0:
+            vector = np.asarray(embedding, dtype=np.float32)
+            norm = np.linalg.norm(vector)
+            vector = vector / norm if norm else None
+
+        with self._lock:
+            if not self._check_version(version):
+                return  # computed against an outdated collection
+            self._entries[key] = (time.monotonic() + self.ttl, dict(response), vector)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._matrix = None
+
+    def invalidate(self):
+        with self._lock:
+            self._clear()
+
+    def _check_version(self, version: int) -> bool:
+        """Drops the cache on a newer collection version; False if stale"""
+        if self._version is not None and version < self._version:
+            return False
+        if version != self._version:
+            if self._entries:
+                self._clear()
+            self._version = version
+        return True
+
+    def _clear(self):
+        self._entries.clear()
+        self._matrix = None
+        self.invalidations += 1
+
+    def _live_entry(self, key: tuple[str, str]):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del self._entries[key]
+            self._matrix = None
+            return None
+        return entry
+
+    def _nearest(self, embedding: list[float], scope: str) -> Optional[tuple[str, str]]:
+        if self._matrix is None:
+            self._matrix_keys = [
+                k for k, (_, _, v) in self._entries.items() if v is not None
+            ]
+            if not self._matrix_keys:
+                return None
+            self._matrix = np.stack([self._entries[k][2] for k in self._matrix_keys])
+        if not self._matrix_keys:
+            return None
+
+        query = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if not norm:
+            return None
+        distances = 1.0 - self._matrix @ (query / norm)
+        for i in np.argsort(distances):
+            if distances[i] > self.semantic_distance:
+                return None
+            key = self._matrix_keys[i]
+            if key[1] == scope and self._live_entry(key) is not None:
+                return key
+        return None
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.lookups - self.exact_hits - self.semantic_hits,
+            "invalidations": self.invalidations,
+        }
@@ -0,0 +1,192 @@
+# Boundary-aware text chunking shared by the API and the batch scripts
+import re
+from bisect import bisect_left, bisect_right
+from typing import Iterable, Iterator
+from ragoo.core.config import settings
+
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+# Places a chunk may end, from strongest to weakest. Each needle is paired
+# with the offset, relative to where it is found, at which the chunk ends.
+_BOUNDARIES = (
+    (("\n#", 1),),  # before a Markdown heading
+    (("\n\n", 2),),  # paragraph break
+    tuple((mark + gap, 1) for mark in ".!?" for gap in " \n"),  # sentence end
+    (("\n", 1),),  # line break
+    ((" ", 1), ("\t", 1)),  # word gap
+)
+
+
+def count_tokens(text: str) -> int:
+    """Approximate token count: words and punctuation marks"""
+    return sum(1 for _ in TOKEN_PATTERN.finditer(text))
+
+
+def iter_markdown_pages(text: str, page_separator: str = "-----"):
+    """Yields (page_number, page) for the non-empty pages of a Markdown text"""
+    page_number = 0
+    for page in text.split(page_separator):
+        page = page.strip()
+        if page:
+            page_number += 1
+            yield page_number, page
+
+
+class TextChunker:
+    """Splits text into overlapping chunks that end on natural boundaries.
+
+    A chunk ends at the strongest boundary (heading, paragraph, sentence,
+    line, word) found in the second half of its size window, and is only cut
+    mid-word when the window holds no boundary at all. Sizes and overlap are
+    measured in characters or, with ``unit="tokens"``, in approximate tokens.
+
+    Each window is searched right-to-left once per boundary kind, so
+    chunking is linear in the length of the text.
+    """
+
+    def __init__(
+        self,
+        chunk_size: int | None = None,
+        overlap: int | None = None,
+        unit: str | None = None,
+    ):
+        self.chunk_size = chunk_size or settings.CHUNK_SIZE
+        self.overlap = settings.CHUNK_OVERLAP if overlap is None else overlap
+        self.unit = unit or settings.CHUNK_UNIT
+        if self.unit not in ("chars", "tokens"):
+            raise ValueError(f"Unknown chunk unit: {self.unit}")
+        if not 0 <= self.overlap < self.chunk_size:
+            raise ValueError("overlap must be smaller than chunk_size")
+        # Buffer this much text before chunking a page stream; any amount
+        # works, larger buffers just rescan the carried-over tail less often
+        self._flush_chars = 4 * self.chunk_size * (8 if self.unit == "tokens" else 1)
+
+    def split(self, text: str) -> list[str]:
+        """Chunks a single text"""
+        return [chunk for chunk, _ in self.chunk_pages([(1, text)])]
+
+    def chunk_pages(
+        self, pages: Iterable[tuple[int, str]]
+    ) -> Iterator[tuple[str, dict]]:
+        """Chunks a stream of (page_number, text) pages.
+
+        Yields (chunk, {"page": n}) where n is the page the chunk starts on.
+        Only a bounded tail of the stream is buffered.
+        """
+        parts: list[str] = []  # page texts not yet joined onto the buffer
+        size = 0
+        page_offsets: list[int] = []
+        page_numbers: list[int] = []
+
+        for page_number, text in pages:
+            if not text:
+                continue
+            if size:
+                parts.append("\n")
+                size += 1
+            page_offsets.append(size)
+            page_numbers.append(page_number)
+            parts.append(text)
+            size += len(text)
+            if size < self._flush_chars:
+                continue
+
+            buffer = "".join(parts)
+            consumed = 0
+            for start, end in self._spans(buffer, final=False):
+                consumed = start
+                if end is None:
+                    break
+                yield from self._emit(buffer, start, end, page_offsets, page_numbers)
+
+            parts = [buffer[consumed:]]
+            size = len(parts[0])
+            first = max(bisect_right(page_offsets, consumed) - 1, 0)
+            page_offsets = [max(o - consumed, 0) for o in page_offsets[first:]]
+            page_numbers = page_numbers[first:]
+
+        buffer = "".join(parts)
+        for start, end in self._spans(buffer, final=True):
+            yield from self._emit(buffer, start, end, page_offsets, page_numbers)
+
+    @staticmethod
+    def _emit(buffer, start, end, page_offsets, page_numbers):
+        chunk = buffer[start:end].strip()
+        if chunk:
+            page = page_numbers[max(bisect_right(page_offsets, start) - 1, 0)]
+            yield chunk, {"page": page}
+
+    def _spans(self, text: str, final: bool):
+        """Yields (start, end) chunk spans of text.
+
+        Unless final, stops with (start, None) at the first chunk that could
+        still grow with more text; start is then where chunking resumes.
+        """
+        token_starts = token_ends = None
+        if self.unit == "tokens":
+            token_starts, token_ends = [], []
+            for match in TOKEN_PATTERN.finditer(text):
+                token_starts.append(match.start())
+                token_ends.append(match.end())
+
+        start = len(text) - len(text.lstrip())
+        while start < len(text):
+            limit = self._limit(start, len(text), token_starts, token_ends)
+            if limit >= len(text):
+                if not final:
+                    yield start, None
+                    return
+                yield start, len(text)
+                return
+
+            end = _last_boundary(text, start + (limit - start) // 2, limit)
+            if end is None:
+                end = limit  # no boundary at all: cut mid-word
+
+            yield start, end
+            next_start = self._overlap_start(text, end, token_starts, token_ends)
+            start = next_start if next_start > start else end
+
+    def _limit(self, start, length, token_starts, token_ends) -> int:
+        """Furthest offset a chunk starting at start may end at"""
+        if token_starts is None:
+            return start + self.chunk_size
+        first = bisect_left(token_starts, start)
+        last = first + self.chunk_size
+        return token_ends[last - 1] if last <= len(token_ends) else length
+
+    def _overlap_start(self, text, end, token_starts, token_ends):
+        """Where the next chunk starts so it repeats ~overlap units of this one"""
+        if not self.overlap:
+            return end
+        if token_starts is not None:
+            inside = bisect_right(token_ends, end)  # tokens ending within the chunk
+            first = max(inside - self.overlap, 0)
+            return token_starts[first] if first < len(token_starts) else end
+
+        # Start the overlap on a word rather than in the middle of one
+        target = end - self.overlap
+        gaps = [
+            i
+            for i in (text.find(" ", target, end), text.find("\n", target, end))
+            if i >= 0
+        ]
+        return min(gaps) + 1 if gaps else target
+
+
+def _last_boundary(text: str, lo: int, hi: int):
+    """Offset after the strongest, then latest, boundary in text[lo:hi].
+
+    Every lookup is a right-to-left ``str.rfind`` bounded to the window, so
+    each window is scanned at most once per boundary kind and chunking stays
+    linear in the length of the text.
+    """
+    for needles in _BOUNDARIES:
+        best = -1
+        for needle, offset in needles:
+            found = text.rfind(needle, lo, hi)
+            if found >= 0:
+                best = max(best, found + offset)
+        if best > lo:
+            return best
+    return None
@@ -0,0 +1,89 @@
+# Fits retrieved chunks into a token budget for the prompt
+from ragoo.services.chunking import TOKEN_PATTERN, count_tokens
+
+# Shortest shared run of text treated as chunk overlap rather than chance
+MIN_OVERLAP_CHARS = 32
+
+
+def pack_context(results: list[dict], budget: int) -> dict:
+    """Selects retrieved chunks, in rank order, until ``budget`` tokens.
+
+    Text a chunk shares with an already packed chunk of the same source
+    (the overlap between adjacent chunks) is trimmed before counting. A
+    chunk that no longer fits is dropped and smaller, lower ranked ones
+    are still tried; only the top chunk is truncated rather than dropped,
+    so the context is never empty. A budget of 0 packs every chunk.
+
+    Returns the packed chunks, the joined context and token counts.
+    """
+    packed = []
+    by_source: dict[str, list[str]] = {}
+    used = dropped = trimmed = 0
+
+    for result in results:
+        source = (result.get("metadata") or {}).get("source")
+        content = result["content"]
+        text = content
+        for previous in by_source.get(source, ()):
+            text = _trim_shared(previous, text)
+        if not text.strip():
+            trimmed += count_tokens(content)
+            continue
+
+        tokens = count_tokens(text)
+        trimmed += count_tokens(content) - tokens
+        if budget and used + tokens > budget:
+            if packed:
+                dropped += tokens
+                continue
+            text = _truncate(text, budget)
+            dropped += tokens - budget
+            tokens = budget
+
+        packed.append({**result, "content": text})
+        by_source.setdefault(source, []).append(content)
+        used += tokens
+
+    return {
+        "chunks": packed,
+        "context": "\n".join(chunk["content"] for chunk in packed),
+        "tokens_used": used,
+        "tokens_dropped": dropped,
+        "tokens_trimmed": trimmed,
+        "chunks_dropped": len(results) - len(packed),
+    }
+
+
+def _trim_shared(previous: str, text: str) -> str:
+    """Removes the part of text that continues or precedes previous"""
+    # previous ends with the beginning of text
+    overlap = _suffix_prefix(previous, text)
+    if overlap:
+        return text[overlap:].lstrip()
+    # text ends with the beginning of previous
+    overlap = _suffix_prefix(text, previous)
+    if overlap:
+        return text[: len(text) - overlap].rstrip()
+    return text
+
+
+def _suffix_prefix(left: str, right: str) -> int:
+    """Length of the longest suffix of left that is a prefix of right"""
+    anchor = right[:MIN_OVERLAP_CHARS]
+    if len(anchor) < MIN_OVERLAP_CHARS:
+        return 0
+    start = left.find(anchor)
+    while start >= 0:
+        length = len(left) - start
+        if right.startswith(left[start:]) and length < len(right):
+            return length
+        start = left.find(anchor, start + 1)
+    return 0
+
+
+def _truncate(text: str, tokens: int) -> str:
+    """The leading ``tokens`` tokens of text"""
+    for i, match in enumerate(TOKEN_PATTERN.finditer(text)):
+        if i == tokens - 1:
+            return text[: match.end()]
+    return text
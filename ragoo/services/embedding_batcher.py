@@ -0,0 +1,141 @@
+# Dynamic micro-batching of embedding requests across concurrent callers
+import asyncio
+from typing import Awaitable, Callable, List
+
+
+class Histogram:
+    """Counts of observed values in power-of-two buckets"""
+
+    def __init__(self, max_value: int):
+        self.bounds = [1]
+        while self.bounds[-1] < max_value:
+            self.bounds.append(self.bounds[-1] * 2)
+        self.counts = [0] * (len(self.bounds) + 1)  # last bucket is overflow
+        self.count = 0
+        self.total = 0
+
+    def observe(self, value: int):
+        for i, bound in enumerate(self.bounds):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.count += 1
+        self.total += value
+
+    def stats(self) -> dict:
+        buckets = {f"<={bound}": n for bound, n in zip(self.bounds, self.counts)}
+        buckets[f">{self.bounds[-1]}"] = self.counts[-1]
+        return {
+            "buckets": buckets,
+            "count": self.count,
+            "mean": round(self.total / self.count, 2) if self.count else 0.0,
+        }
+
+
+class EmbeddingBatcher:
+    """Merges embedding requests from concurrent callers into shared batches.
+
+    Texts are queued with a future each. The queue is flushed once it holds
+    ``max_batch_size`` texts or ``max_wait`` seconds after the first text
+    arrived, whichever comes first; every batch is one ``embed_batch``
+    call, and its vectors are handed back to the waiting callers.
+    """
+
+    def __init__(
+        self,
+        embed_batch: Callable[[List[str]], Awaitable[List[List[float]]]],
+        max_batch_size: int,
+        max_wait: float,
+    ):
+        self.embed_batch = embed_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._pending: list[tuple[str, asyncio.Future]] = []
+        self._timer: asyncio.TimerHandle | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        # The loop only holds weak references to tasks
+        self._tasks: set[asyncio.Task] = set()
+        self.batch_sizes = Histogram(max_batch_size)
+        self.queue_depths = Histogram(max_batch_size)
+        self.batches = 0
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Futures belong to one loop; start afresh on a new one
+            self._pending, self._timer, self._loop = [], None, loop
+            self._tasks = set()
+
+        futures = []
+        for text in texts:
+            future = loop.create_future()
+            self._pending.append((text, future))
+            futures.append(future)
+            if len(self._pending) >= self.max_batch_size:
+                self._flush()
+        self.queue_depths.observe(len(self._pending))
+        if self._pending and self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return list(await asyncio.gather(*futures))
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while self._pending:
+            batch = self._pending[: self.max_batch_size]
+            self._pending = self._pending[self.max_batch_size :]
+            task = self._loop.create_task(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: list[tuple[str, asyncio.Future]]):
+        # Callers that gave up no longer need their text embedded
+        batch = [(text, future) for text, future in batch if not future.done()]
+        if not batch:
+            return
+        unique = list(dict.fromkeys(text for text, _ in batch))
+        self.batch_sizes.observe(len(unique))
+        self.batches += 1
+        try:
+            vectors = dict(zip(unique, await self.embed_batch(unique)))
+        except asyncio.CancelledError:
+            for _, future in batch:
+                future.cancel()
+            raise
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for text, future in batch:
+            if not future.done():
+                future.set_result(vectors[text])
+
+    async def aclose(self):
+        """Cancels queued texts and batches in flight, waiting for them"""
+        if self._loop is not asyncio.get_running_loop():
+            # Tasks of another loop cannot be awaited from this one
+            self._pending, self._timer, self._tasks = [], None, set()
+            return
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        for _, future in self._pending:
+            future.cancel()
+        self._pending = []
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": len(self._pending),
+            "in_flight": len(self._tasks),
+            "batches": self.batches,
+            "batch_size": self.batch_sizes.stats(),
+            "queue_depth_on_enqueue": self.queue_depths.stats(),
+        }
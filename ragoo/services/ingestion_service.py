@@ -0,0 +1,319 @@
+# Background ingestion jobs
+import json
+import logging
+import os
+import socket
+import tempfile
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from itertools import islice
+from typing import Iterable, Iterator, Optional
+from ragoo.core.config import settings
+from ragoo.database import models
+from ragoo.database.database import SessionLocal
+from ragoo.services.pdf_extraction import pdf_page_count
+from ragoo.services.rag_service import get_rag_service
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = ("queued", "running")
+
+
+class LeaseLost(Exception):
+    """Another worker took over a job whose lease had expired"""
+
+
+class IngestionQueue:
+    """Runs parse, chunk, embed and store for uploads on a bounded worker pool.
+
+    Payloads are spooled to disk and job state lives in the ``ingestion_jobs``
+    table, so jobs that were queued or running when the process stopped are
+    picked up again by ``resume``. Re-running a job is safe because chunk
+    IDs are content-addressed.
+
+    A running job is leased to the worker running it, which renews the
+    lease while the job runs. ``resume`` only takes over running jobs whose
+    lease has expired, so several workers can share the table.
+    """
+
+    def __init__(self, rag_service, session_factory=SessionLocal):
+        self.rag_service = rag_service
+        self.session_factory = session_factory
+        self.spool_dir = settings.INGESTION_SPOOL_DIR
+        self.batch_size = settings.INGESTION_BATCH_SIZE
+        self.lease_seconds = settings.INGESTION_LEASE_SECONDS
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._executor = ThreadPoolExecutor(
+            max_workers=settings.INGESTION_MAX_WORKERS, thread_name_prefix="ingest"
+        )
+        self._running: set[str] = set()
+        self._running_lock = threading.Lock()
+        self._stopped = threading.Event()
+        threading.Thread(
+            target=self._heartbeat, name="ingest-lease", daemon=True
+        ).start()
+
+    def new_spool_file(self, suffix: str):
+        """Opens a file in the spool directory for an incoming upload"""
+        os.makedirs(self.spool_dir, exist_ok=True)
+        return tempfile.NamedTemporaryFile(
+            dir=self.spool_dir, suffix=suffix, delete=False
+        )
+
+    def submit_pdf(
+        self,
+        path: str,
+        filename: str,
+        replace: bool = False,
+        owner: Optional[str] = None,
+    ) -> str:
+        """Queues a PDF already spooled to disk; returns the job ID.
+
+        The queue owns the file from here on and removes it once the job
+        finishes. With replace, chunks of an earlier version of the same
+        source that are not in this one are deleted when the job finishes.
+        """
+        return self._enqueue(uuid.uuid4().hex, "pdf", filename, path, replace, owner)
+
+    def submit_documents(
+        self,
+        documents: list[tuple[str, dict]],
+        replace: bool = False,
+        owner: Optional[str] = None,
+    ) -> str:
+        """Spools a batch of (content, metadata) pairs and queues it"""
+        job_id = uuid.uuid4().hex
+        path = self._spool_path(job_id, ".json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(documents, f)
+        return self._enqueue(job_id, "documents", None, path, replace, owner)
+
+    def get(self, job_id: str) -> Optional[models.IngestionJob]:
+        with self.session_factory() as db:
+            return db.get(models.IngestionJob, job_id)
+
+    def resume(self):
+        """Requeues jobs left unfinished by a stopped worker: queued jobs, and
+        running jobs whose lease has expired"""
+        job = models.IngestionJob
+        abandoned = (job.status == "queued") | (
+            (job.status == "running")
+            & (job.lease_expires.is_(None) | (job.lease_expires < datetime.utcnow()))
+        )
+        with self.session_factory() as db:
+            job_ids = [row.id for row in db.query(job.id).filter(abandoned)]
+            # Conditional, in case a live worker claimed one meanwhile
+            db.query(job).filter(job.id.in_(job_ids), abandoned).update(
+                {"status": "queued", "lease_owner": None, "lease_expires": None},
+                synchronize_session=False,
+            )
+            db.commit()
+
+        for job_id in job_ids:
+            self._executor.submit(self._run, job_id)
+        return job_ids
+
+    def shutdown(self):
+        self._stopped.set()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _spool_path(self, job_id: str, suffix: str) -> str:
+        os.makedirs(self.spool_dir, exist_ok=True)
+        return os.path.join(self.spool_dir, f"{job_id}{suffix}")
+
+    def _enqueue(
+        self,
+        job_id: str,
+        kind: str,
+        source: Optional[str],
+        path: str,
+        replace: bool = False,
+        owner: Optional[str] = None,
+    ):
+        with self.session_factory() as db:
+            db.add(
+                models.IngestionJob(
+                    id=job_id,
+                    kind=kind,
+                    source=source,
+                    owner=owner,
+                    path=path,
+                    status="queued",
+                    replace=replace,
+                )
+            )
+            db.commit()
+        self._executor.submit(self._run, job_id)
+        return job_id
+
+    def _claim(self, job_id: str) -> Optional[models.IngestionJob]:
+        """Atomically moves a queued job to running, leased to this worker,
+        so it only runs once"""
+        with self.session_factory() as db:
+            claimed = (
+                db.query(models.IngestionJob)
+                .filter(
+                    models.IngestionJob.id == job_id,
+                    models.IngestionJob.status == "queued",
+                )
+                .update({"status": "running", **self._lease()})
+            )
+            db.commit()
+            return db.get(models.IngestionJob, job_id) if claimed else None
+
+    def _lease(self) -> dict:
+        return {
+            "lease_owner": self.worker_id,
+            "lease_expires": datetime.utcnow() + timedelta(seconds=self.lease_seconds),
+        }
+
+    def _heartbeat(self):
+        """Renews the leases of this worker's running jobs"""
+        while not self._stopped.wait(self.lease_seconds / 3):
+            with self._running_lock:
+                job_ids = list(self._running)
+            if not job_ids:
+                continue
+            try:
+                with self.session_factory() as db:
+                    db.query(models.IngestionJob).filter(
+                        models.IngestionJob.id.in_(job_ids),
+                        models.IngestionJob.lease_owner == self.worker_id,
+                    ).update(self._lease(), synchronize_session=False)
+                    db.commit()
+            except Exception:
+                logger.exception("Renewing ingestion leases failed")
+
+    def _update(self, job_id: str, **fields):
+        """Updates a job this worker holds the lease of, renewing the lease;
+        raises LeaseLost if another worker has taken it over"""
+        with self.session_factory() as db:
+            updated = (
+                db.query(models.IngestionJob)
+                .filter(
+                    models.IngestionJob.id == job_id,
+                    models.IngestionJob.lease_owner == self.worker_id,
+                )
+                .update({**fields, **self._lease()})
+            )
+            db.commit()
+        if not updated:
+            raise LeaseLost(job_id)
+
+    def _run(self, job_id: str):
+        job = self._claim(job_id)
+        if job is None:
+            return
+
+        with self._running_lock:
+            self._running.add(job_id)
+        try:
+            documents, total, pages_total = self._load(job)
+            self._update(
+                job_id,
+                chunks_total=total,
+                chunks_done=0,
+                pages_total=pages_total,
+                pages_done=0,
+            )
+
+            done = new_count = skipped_count = 0
+            # source -> IDs of this job, for replace; a PDF that yields no
+            # chunks still replaces its earlier version
+            keep = {job.source: set()} if job.replace and job.source else {}
+            for batch in _batched(documents, self.batch_size):
+                result = self.rag_service.add_documents(batch)
+                done += len(batch)
+                new_count += result["new"]
+                skipped_count += result["skipped"]
+                if job.replace:
+                    grouped = self.rag_service.ids_by_source(batch, result["ids"])
+                    for source, ids in grouped.items():
+                        keep.setdefault(source, set()).update(ids)
+                progress = {}
+                if pages_total is not None:
+                    # Chunks arrive in page order; the last one's start page
+                    # is how far into the PDF the job has got
+                    progress["pages_done"] = batch[-1][1].get("page", 0)
+                self._update(
+                    job_id,
+                    chunks_done=done,
+                    new_count=new_count,
+                    skipped_count=skipped_count,
+                    **progress,
+                )
+
+            # Only prune once every chunk of the new version is stored
+            removed = self.rag_service.prune_sources(keep) if job.replace else 0
+            self._update(
+                job_id,
+                status="completed",
+                chunks_total=done,
+                pages_done=pages_total or 0,
+                removed_count=removed,
+            )
+            self._discard(job.path)
+        except LeaseLost:
+            # The payload now belongs to the worker that took the job over
+            logger.warning("Ingestion job %s was taken over by another worker", job_id)
+        except Exception as e:
+            logger.exception("Ingestion job %s failed", job_id)
+            try:
+                self._update(job_id, status="failed", error=str(e))
+            except LeaseLost:
+                logger.warning(
+                    "Ingestion job %s was taken over by another worker", job_id
+                )
+                return
+            # Failed jobs are not retried, so their payload is of no use
+            self._discard(job.path)
+        finally:
+            with self._running_lock:
+                self._running.discard(job_id)
+
+    def _load(self, job: models.IngestionJob):
+        """Returns the job's (content, metadata) pairs, their count if known
+        and the page count of a PDF.
+
+        PDF chunks are streamed while pages are extracted, so their total is
+        only known once the job completes; progress is reported in pages.
+        """
+        if job.kind == "pdf":
+            pages_total = pdf_page_count(job.path)
+            chunks = self.rag_service.iter_pdf_chunks(job.path)
+            documents = (
+                (chunk, {**metadata, "source": job.source})
+                for chunk, metadata in chunks
+            )
+            return documents, None, pages_total
+
+        with open(job.path, encoding="utf-8") as f:
+            documents = [(content, metadata) for content, metadata in json.load(f)]
+        return documents, len(documents), None
+
+    @staticmethod
+    def _discard(path: Optional[str]):
+        if path and os.path.exists(path):
+            os.remove(path)
+
+
+def _batched(items: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(items)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+_ingestion_queue: Optional[IngestionQueue] = None
+_ingestion_queue_lock = threading.Lock()
+
+
+def get_ingestion_queue() -> IngestionQueue:
+    """The shared ingestion queue, built on first use with the RAG service"""
+    global _ingestion_queue
+    if _ingestion_queue is None:
+        with _ingestion_queue_lock:
+            if _ingestion_queue is None:
+                _ingestion_queue = IngestionQueue(get_rag_service())
+    return _ingestion_queue
@@ -1,22 +1,52 @@
+import asyncio
+import time
+import httpx
 import requests
-from typing import List
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from typing import AsyncIterator, List
 import json
 from ragoo.core.config import settings
+from ragoo.services.embedding_batcher import EmbeddingBatcher
+from ragoo.services.single_flight import AsyncSingleFlight, SingleFlight
 
 
 class OllamaHandler:
     def __init__(self, base_url: str = "http://localhost:11434"):
         self.base_url = settings.OLLAMA_HOST or base_url
         self.model = settings.COMPLETION_MODEL
+        self.flight = SingleFlight()
 
     def generate_completion(self, prompt: str, **kwargs) -> str:
-        """Generate text completion using Ollama"""
+        """Generate text completion using Ollama.
+
+        Identical concurrent requests (same model, prompt and options) share
+        one generation.
+        """
+        options = _build_options(**kwargs)
+        return self.flight.do(
+            _completion_key(self.model, prompt, options),
+            lambda: self._generate_completion(prompt, options),
+        )
+
+    def _generate_completion(self, prompt: str, options: dict) -> str:
         try:
             url = f"{self.base_url}/api/generate"
             headers = {"Content-Type": "application/json"}
-            data = {"model": self.model, "prompt": prompt, "stream": False}
+            data = {
+                "model": self.model,
+                "prompt": prompt,
+                "stream": False,
+                "options": options,
+                **_keep_alive(),
+            }
 
-            response = requests.post(url, headers=headers, data=json.dumps(data))
+            response = requests.post(
+                url,
+                headers=headers,
+                data=json.dumps(data),
+                timeout=settings.OLLAMA_TIMEOUT,
+            )
 
             response.raise_for_status()
 
@@ -36,3 +66,407 @@ class OllamaHandler:
 
         except requests.exceptions.RequestException as e:
             raise RuntimeError(f"Ollama API error: {str(e)}")
+
+
+class OllamaEmbeddingClient:
+    """Batched embedding client for Ollama's /api/embed endpoint.
+
+    Texts are split into batches of ``batch_size`` which are sent over a
+    pooled keep-alive session, at most ``max_workers`` batches at a time.
+    Failed batches are retried with exponential backoff.
+    """
+
+    def __init__(
+        self,
+        host: str | None = None,
+        model: str | None = None,
+        batch_size: int | None = None,
+        max_workers: int | None = None,
+        max_retries: int | None = None,
+        retry_backoff: float | None = None,
+        timeout: float | None = None,
+        cache=None,
+    ):
+        self.host = host or settings.OLLAMA_HOST
+        self.model = model or settings.EMBEDDING_MODEL
+        self.cache = cache
+        self.batch_size = batch_size or settings.EMBEDDING_BATCH_SIZE
+        self.max_workers = max_workers or settings.EMBEDDING_MAX_WORKERS
+        self.max_retries = (
+            settings.EMBEDDING_MAX_RETRIES if max_retries is None else max_retries
+        )
+        self.retry_backoff = (
+            settings.EMBEDDING_RETRY_BACKOFF if retry_backoff is None else retry_backoff
+        )
+        self.timeout = timeout or settings.OLLAMA_TIMEOUT
+
+        # One keep-alive connection per worker so batches never wait on the pool
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="ollama-embed"
+        )
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts, returning one vector per text in input order"""
+        if not texts:
+            return []
+        if self.cache is None:
+            return self._embed_uncached(texts)
+
+        embeddings = self.cache.get_many(self.model, texts)
+        missing = _unique_misses(texts, embeddings)
+        if missing:
+            fresh = self._embed_uncached(missing)
+            self.cache.put_many(self.model, missing, fresh)
+            _fill_misses(texts, embeddings, dict(zip(missing, fresh)))
+        return embeddings
+
+    def _embed_uncached(self, texts: List[str]) -> List[List[float]]:
+        batches = [
+            texts[i : i + self.batch_size]
+            for i in range(0, len(texts), self.batch_size)
+        ]
+        if len(batches) == 1:
+            return self._embed_batch(batches[0])
+
+        # Executor.map yields results in submission order
+        embeddings = []
+        for batch_embeddings in self._executor.map(self._embed_batch, batches):
+            embeddings.extend(batch_embeddings)
+        return embeddings
+
+    def _embed_batch(self, batch: List[str]) -> List[List[float]]:
+        attempt = 0
+        while True:
+            try:
+                response = self.session.post(
+                    f"{self.host}/api/embed",
+                    json={"model": self.model, "input": batch, **_keep_alive()},
+                    timeout=self.timeout,
+                )
+                response.raise_for_status()
+                embeddings = response.json()["embeddings"]
+                if len(embeddings) != len(batch):
+                    raise RuntimeError(
+                        f"Ollama returned {len(embeddings)} embeddings "
+                        f"for a batch of {len(batch)}"
+                    )
+                return embeddings
+            except requests.exceptions.RequestException as e:
+                if attempt >= self.max_retries or not _is_retryable(e):
+                    raise RuntimeError(f"Ollama API error: {str(e)}")
+            time.sleep(self.retry_backoff * (2**attempt))
+            attempt += 1
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        self.session.close()
+
+
+class OllamaEmbedder:
+    """Embedding entry point of the vector stores, whatever their backend.
+
+    Wraps an ``OllamaEmbeddingClient``; concurrent requests for the same
+    texts share one embedding call.
+    """
+
+    def __init__(self, host: str, model: str, cache=None):
+        self.host = host
+        self.model = model
+        self.client = OllamaEmbeddingClient(host=host, model=model, cache=cache)
+        self.flight = SingleFlight()
+
+    def __call__(self, texts: List[str]) -> List[List[float]]:
+        # These vectors may be stored, so only identical texts share a call
+        texts = list(texts)
+        return self.flight.do(
+            embedding_key(self.model, texts, normalize=False),
+            lambda: self.client.embed(texts),
+        )
+
+    def embed_query(self, texts: List[str]) -> List[List[float]]:
+        """Embeds query texts, sharing a call with concurrent requests for
+        the same texts up to whitespace"""
+        texts = list(texts)
+        return self.flight.do(
+            embedding_key(self.model, texts), lambda: self.client.embed(texts)
+        )
+
+
+class AsyncOllamaHandler:
+    """Non-blocking Ollama client for use inside the event loop.
+
+    All calls share one pooled ``httpx.AsyncClient``. The client is bound to
+    the event loop it was created on and is recreated if a different loop
+    picks the handler up.
+    """
+
+    def __init__(
+        self,
+        base_url: str | None = None,
+        model: str | None = None,
+        embedding_model: str | None = None,
+        timeout: float | None = None,
+        max_connections: int | None = None,
+        embedding_cache=None,
+    ):
+        self.base_url = base_url or settings.OLLAMA_HOST
+        self.embedding_cache = embedding_cache
+        self.model = model or settings.COMPLETION_MODEL
+        self.embedding_model = embedding_model or settings.EMBEDDING_MODEL
+        self.timeout = timeout or settings.OLLAMA_TIMEOUT
+        self.max_connections = max_connections or settings.OLLAMA_MAX_CONNECTIONS
+        self.batch_size = settings.EMBEDDING_BATCH_SIZE
+        self.max_retries = settings.EMBEDDING_MAX_RETRIES
+        self.retry_backoff = settings.EMBEDDING_RETRY_BACKOFF
+        self._client: httpx.AsyncClient | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._closing: set[asyncio.Future] = set()
+        self.completion_flight = AsyncSingleFlight()
+        self.embedding_flight = AsyncSingleFlight()
+        self.batcher = EmbeddingBatcher(
+            self._embed_batch,
+            max_batch_size=self.batch_size,
+            max_wait=settings.EMBEDDING_BATCH_WAIT_MS / 1000,
+        )
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client.is_closed or self._loop is not loop:
+            self._retire_client(loop)
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+            )
+            self._loop = loop
+        return self._client
+
+    def _retire_client(self, loop: asyncio.AbstractEventLoop):
+        """Closes a client left on another event loop, releasing its pool"""
+        client, client_loop = self._client, self._loop
+        if client is None or client.is_closed:
+            return
+        if client_loop is not None and client_loop.is_running():
+            closing = asyncio.run_coroutine_threadsafe(client.aclose(), client_loop)
+        else:
+            # Its loop has stopped; close it from this one
+            closing = loop.create_task(_close_quietly(client))
+        self._closing.add(closing)
+        closing.add_done_callback(self._closing.discard)
+
+    async def generate_completion(self, prompt: str, **kwargs) -> str:
+        """Generate text completion using Ollama without blocking the loop.
+
+        Identical concurrent requests share one generation.
+        """
+        options = _build_options(**kwargs)
+        return await self.completion_flight.do(
+            _completion_key(self.model, prompt, options),
+            lambda: self._generate_completion(prompt, options),
+        )
+
+    async def _generate_completion(self, prompt: str, options: dict) -> str:
+        data = {
+            "model": self.model,
+            "prompt": prompt,
+            "stream": False,
+            "options": options,
+            **_keep_alive(),
+        }
+        try:
+            response = await self.client.post("/api/generate", json=data)
+            response.raise_for_status()
+            return response.json().get("response", "")
+        except httpx.HTTPError as e:
+            raise RuntimeError(f"Ollama API error: {str(e)}")
+
+    async def stream_completion(self, prompt: str, **kwargs) -> AsyncIterator[dict]:
+        """Yield Ollama's streamed generation chunks as they arrive.
+
+        Every chunk carries a ``response`` text fragment; the last one has
+        ``done`` set and includes Ollama's token counts and durations.
+        """
+        data = {
+            "model": self.model,
+            "prompt": prompt,
+            "stream": True,
+            "options": _build_options(**kwargs),
+            **_keep_alive(),
+        }
+        try:
+            async with self.client.stream(
+                "POST", "/api/generate", json=data
+            ) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if not line:
+                        continue
+                    chunk = json.loads(line)
+                    if "error" in chunk:
+                        raise RuntimeError(f"Ollama API error: {chunk['error']}")
+                    yield chunk
+                    if chunk.get("done"):
+                        break
+        except httpx.HTTPError as e:
+            raise RuntimeError(f"Ollama API error: {str(e)}")
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts concurrently in batches, keeping input order.
+
+        Concurrent requests for the same texts, up to whitespace, share one
+        embedding call.
+        """
+        if not texts:
+            return []
+        return await self.embedding_flight.do(
+            embedding_key(self.embedding_model, texts), lambda: self._embed(texts)
+        )
+
+    async def _embed(self, texts: List[str]) -> List[List[float]]:
+        if self.embedding_cache is None:
+            return await self._embed_uncached(texts)
+
+        # Only the in-memory tier is read on the loop; the disk tier runs
+        # SQLite under a lock shared with the ingestion threads
+        cache, model = self.embedding_cache, self.embedding_model
+        embeddings = cache.get_memory(model, texts)
+        cold = _unique_misses(texts, embeddings)
+        if cold:
+            stored = await asyncio.to_thread(cache.get_many, model, cold)
+            _fill_misses(texts, embeddings, dict(zip(cold, stored)))
+        missing = _unique_misses(texts, embeddings)
+        if missing:
+            fresh = await self._embed_uncached(missing)
+            await asyncio.to_thread(cache.put_many, model, missing, fresh)
+            _fill_misses(texts, embeddings, dict(zip(missing, fresh)))
+        return embeddings
+
+    async def _embed_uncached(self, texts: List[str]) -> List[List[float]]:
+        # Concurrent callers' texts are merged into shared batches
+        return await self.batcher.embed(texts)
+
+    async def _embed_batch(self, batch: List[str]) -> List[List[float]]:
+        attempt = 0
+        while True:
+            try:
+                response = await self.client.post(
+                    "/api/embed",
+                    json={
+                        "model": self.embedding_model,
+                        "input": batch,
+                        **_keep_alive(),
+                    },
+                )
+                response.raise_for_status()
+                embeddings = response.json()["embeddings"]
+                if len(embeddings) != len(batch):
+                    raise RuntimeError(
+                        f"Ollama returned {len(embeddings)} embeddings "
+                        f"for a batch of {len(batch)}"
+                    )
+                return embeddings
+            except httpx.HTTPError as e:
+                if attempt >= self.max_retries or not _is_retryable(e):
+                    raise RuntimeError(f"Ollama API error: {str(e)}")
+            await asyncio.sleep(self.retry_backoff * (2**attempt))
+            attempt += 1
+
+    async def warm_up(self) -> dict:
+        """Load the completion and embedding models into Ollama's memory.
+
+        Returns each model's load time in milliseconds, so the first real
+        query does not pay for it. Models stay loaded for OLLAMA_KEEP_ALIVE
+        """
+
+        async def load(model: str, path: str, data: dict) -> float:
+            started = time.perf_counter()
+            response = await self.client.post(
+                path, json={"model": model, **data, **_keep_alive()}
+            )
+            response.raise_for_status()
+            return round((time.perf_counter() - started) * 1000, 1)
+
+        try:
+            # A generate request without a prompt only loads the model
+            completion_ms, embedding_ms = await asyncio.gather(
+                load(self.model, "/api/generate", {"stream": False}),
+                load(self.embedding_model, "/api/embed", {"input": "warm-up"}),
+            )
+        except httpx.HTTPError as e:
+            raise RuntimeError(f"Ollama API error: {str(e)}")
+        return {self.model: completion_ms, self.embedding_model: embedding_ms}
+
+    async def aclose(self):
+        await self.batcher.aclose()
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+
+
+async def _close_quietly(client: httpx.AsyncClient):
+    try:
+        await client.aclose()
+    except Exception:
+        pass
+
+
+def _unique_misses(texts: List[str], embeddings: list) -> List[str]:
+    """Texts without a cached embedding, each listed once"""
+    return list(dict.fromkeys(t for t, e in zip(texts, embeddings) if e is None))
+
+
+def _fill_misses(texts: List[str], embeddings: list, found: dict):
+    for i, text in enumerate(texts):
+        if embeddings[i] is None:
+            embeddings[i] = found.get(text)
+
+
+def _keep_alive() -> dict:
+    """Request field asking Ollama to keep the model loaded between calls"""
+    return (
+        {"keep_alive": settings.OLLAMA_KEEP_ALIVE} if settings.OLLAMA_KEEP_ALIVE else {}
+    )
+
+
+def embedding_key(model: str, texts: List[str], normalize: bool = True) -> tuple:
+    """Coalescing key of an embedding request.
+
+    Query texts are compared with surrounding and repeated whitespace
+    collapsed, like answer cache keys. Texts to be stored are compared
+    exactly (``normalize=False``), as their vectors are filed under chunk
+    IDs hashed from the raw text. Case is kept, as embedding models are
+    case-sensitive.
+    """
+    if not normalize:
+        return model, tuple(texts)
+    return model, tuple(" ".join(text.split()) for text in texts)
+
+
+def _completion_key(model: str, prompt: str, options: dict) -> tuple:
+    return model, prompt, tuple(sorted(options.items()))
+
+
+def _build_options(temperature: float | None = None, max_tokens: int | None = None):
+    """Map our generation kwargs onto Ollama's request options"""
+    options = {}
+    if temperature is not None:
+        options["temperature"] = temperature
+    if max_tokens is not None:
+        options["num_predict"] = max_tokens
+    return options
+
+
+def _is_retryable(error: Exception) -> bool:
+    """Connection problems, timeouts, 429 and 5xx responses are worth retrying"""
+    response = getattr(error, "response", None)
+    if response is None:
+        return True
+    return response.status_code >= 500 or response.status_code == 429
@@ -0,0 +1,90 @@
+# Parallel, streaming PDF text extraction
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, Optional
+import pymupdf
+from ragoo.core.config import settings
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def _extract_range(path: str, start: int, stop: int) -> list[tuple[int, str]]:
+    """Extracts pages [start, stop) of a PDF as (page_number, text) pairs"""
+    with pymupdf.open(path) as pdf_document:
+        return [(n + 1, pdf_document[n].get_text()) for n in range(start, stop)]
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None:
+            _pool_workers = settings.PDF_EXTRACT_WORKERS or os.cpu_count() or 1
+            # spawn: forking a threaded server process is not safe
+            _pool = ProcessPoolExecutor(
+                max_workers=_pool_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _pool
+
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def pdf_page_count(path: str) -> int:
+    """Number of pages of a PDF file, read without extracting any text"""
+    with pymupdf.open(path) as pdf_document:
+        return pdf_document.page_count
+
+
+def iter_pdf_pages(
+    path: str, pages_per_task: Optional[int] = None
+) -> Iterator[tuple[int, str]]:
+    """Yields (page_number, text) for every page of a PDF file, in order.
+
+    Page ranges are extracted on a process pool. Only a small window of
+    ranges is in flight at a time, so memory stays bounded however long the
+    document is.
+    """
+    pages_per_task = pages_per_task or settings.PDF_PAGES_PER_TASK
+    with pymupdf.open(path) as pdf_document:
+        page_count = pdf_document.page_count
+        if page_count <= pages_per_task:
+            for n in range(page_count):
+                yield n + 1, pdf_document[n].get_text()
+            return
+
+    pool = _get_pool()
+    ranges = iter(
+        (start, min(start + pages_per_task, page_count))
+        for start in range(0, page_count, pages_per_task)
+    )
+    window = 2 * _pool_workers
+    pending = deque()
+    for start, stop in ranges:
+        pending.append(pool.submit(_extract_range, path, start, stop))
+        if len(pending) >= window:
+            break
+
+    while pending:
+        pages = pending.popleft().result()
+        next_range = next(ranges, None)
+        if next_range is not None:
+            pending.append(pool.submit(_extract_range, path, *next_range))
+        yield from pages
+
+
+def iter_pdf_stream_pages(pdf_content: bytes) -> Iterator[tuple[int, str]]:
+    """Yields (page_number, text) for an in-memory PDF, in-process"""
+    with pymupdf.open(stream=pdf_content, filetype="pdf") as pdf_document:
+        for n, page in enumerate(pdf_document):
+            yield n + 1, page.get_text()
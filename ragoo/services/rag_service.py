@@ -1,23 +1,485 @@
 # RAG service logic
-import uuid
-import pymupdf
-from ragoo.vectorestore.chroma_handler import ChromaHandler
-from ragoo.services.ollama_service import OllamaHandler
+import asyncio
+import json
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from ragoo.core.config import settings
+from ragoo.vectorestore.base import get_vectorstore
+from ragoo.vectorestore.embedding_cache import get_embedding_cache
+from ragoo.services.admission import AdmissionController, AdmissionRejected
+from ragoo.services.answer_cache import AnswerCache, normalize_query
+from ragoo.services.ollama_service import AsyncOllamaHandler, OllamaHandler
+from ragoo.services.chunking import TextChunker
+from ragoo.services.context_packing import pack_context
+from ragoo.services.pdf_extraction import iter_pdf_pages, iter_pdf_stream_pages
+from ragoo.services.source_catalog import SourceCatalog
+from ragoo.services.single_flight import (
+    AsyncSingleFlight,
+    SingleFlight,
+    combined_stats,
+)
 
 
 class RAGService:
-    def __init__(self):
-        self.vectorstore = ChromaHandler()
+    def __init__(self, vectorstore=None, source_catalog: SourceCatalog | None = None):
+        self.vectorstore = vectorstore or get_vectorstore()
+        self.source_catalog = source_catalog or SourceCatalog(catalog_name())
         self.llm = OllamaHandler()
+        self.async_llm = AsyncOllamaHandler(embedding_cache=get_embedding_cache())
+        self.answer_cache = (
+            AnswerCache(
+                max_entries=settings.ANSWER_CACHE_MAX_ENTRIES,
+                ttl=settings.ANSWER_CACHE_TTL_SECONDS,
+                semantic_distance=settings.ANSWER_CACHE_SEMANTIC_DISTANCE,
+            )
+            if settings.ANSWER_CACHE_ENABLED
+            else None
+        )
+        self._query_flight = SingleFlight()
+        self._aquery_flight = AsyncSingleFlight()
+        # Bounds the generations running against Ollama at once
+        self.admission = AdmissionController(
+            max_concurrency=settings.GENERATION_MAX_CONCURRENCY,
+            max_queue=settings.GENERATION_MAX_QUEUE,
+            max_wait=settings.GENERATION_MAX_QUEUE_WAIT,
+            user_max_concurrency=settings.GENERATION_USER_MAX_CONCURRENCY,
+            user_max_queued=settings.GENERATION_USER_MAX_QUEUED,
+        )
+        # Chroma is blocking; bound how many of its calls run off the event loop
+        self._executor = ThreadPoolExecutor(
+            max_workers=settings.CHROMA_MAX_WORKERS, thread_name_prefix="chroma"
+        )
+
+    def process_query(
+        self, query: str, mode: str | None = None, filters: dict | None = None
+    ):
+        """Answer a question from the vectorstore.
+
+        ``filters`` restricts retrieval, as built by ``retrieval_filters``
+        """
+        filters = filters or {}
+        # Identical questions asked concurrently share one answer
+        return dict(
+            self._query_flight.do(
+                self._query_key(query, mode, filters),
+                lambda: self._process_query(query, mode, filters),
+            )
+        )
+
+    def _process_query(self, query: str, mode: str | None, filters: dict):
+        version = self.vectorstore.version
+        cached = self._cached_answer(query, version, mode, filters=filters)
+        if cached:
+            return cached
 
-    def process_query(self, query: str):
         # Retrieve context
-        results = self.vectorstore.query(query)
+        query_embedding = None
+        if self._needs_query_embedding(mode, filters):
+            query_embedding = self.vectorstore.embed_queries([query])[0]
+            cached = self._cached_answer(query, version, mode, query_embedding, filters)
+            if cached:
+                return cached
+        results = self.vectorstore.query(
+            query, mode=mode, query_embedding=query_embedding, **filters
+        )
+        prompt, context, sources, usage = self._build_query_prompt(query, results)
+
+        # Generate completion
+        response = self.llm.generate_completion(
+            prompt=prompt, temperature=0.1, max_tokens=500
+        )
+
+        result = {
+            "answer": response,
+            "context": context,
+            "source": sources,
+            "context_tokens": usage,
+        }
+        return self._store_answer(
+            query, version, mode, result, query_embedding, filters
+        )
+
+    async def aprocess_query(
+        self,
+        query: str,
+        mode: str | None = None,
+        user: str | None = None,
+        filters: dict | None = None,
+    ):
+        """Async variant of process_query that never blocks the event loop.
+
+        Generation goes through admission control on behalf of ``user`` and
+        raises AdmissionRejected when there is no capacity. Only the same
+        user's identical questions share a flight, so each user is charged
+        for, and rejected on, their own quota.
+        """
+        filters = filters or {}
+        result = await self._aquery_flight.do(
+            (*self._query_key(query, mode, filters), user or "anonymous"),
+            lambda: self._aprocess_query(query, mode, user, filters),
+        )
+        return dict(result)
+
+    def _query_key(self, query: str, mode: str | None, filters: dict) -> tuple:
+        return (
+            normalize_query(query),
+            mode or settings.RETRIEVAL_MODE,
+            _filters_key(filters),
+            self.vectorstore.version,
+        )
+
+    async def _aprocess_query(
+        self, query: str, mode: str | None, user: str | None, filters: dict
+    ):
+        version = self.vectorstore.version
+        cached = self._cached_answer(query, version, mode, filters=filters)
+        if cached:
+            return cached
+
+        query_embedding = None
+        if self._needs_query_embedding(mode, filters):
+            query_embedding = (await self.async_llm.embed([query]))[0]
+            cached = self._cached_answer(query, version, mode, query_embedding, filters)
+            if cached:
+                return cached
+        results = await self._run_blocking(
+            self.vectorstore.query,
+            query,
+            mode=mode,
+            query_embedding=query_embedding,
+            **filters,
+        )
+        return await self._agenerate_answer(
+            query, version, mode, results, query_embedding, user, filters
+        )
+
+    async def _agenerate_answer(
+        self, query, version, mode, results, query_embedding, user, filters
+    ):
+        prompt, context, sources, usage = self._build_query_prompt(query, results)
+
+        async with self.admission.slot(user):
+            response = await self.async_llm.generate_completion(
+                prompt=prompt, temperature=0.1, max_tokens=500
+            )
+
+        result = {
+            "answer": response,
+            "context": context,
+            "source": sources,
+            "context_tokens": usage,
+        }
+        return self._store_answer(
+            query, version, mode, result, query_embedding, filters
+        )
+
+    async def abatch_query(
+        self,
+        queries: list[str],
+        mode: str | None = None,
+        user: str | None = None,
+        filters: dict | None = None,
+    ):
+        """Answer many questions with one embedding call and one search.
+
+        Cached answers are yielded first. The other questions are embedded
+        in a single batched call and searched in a single Chroma query, then
+        answered with at most ``BATCH_QUERY_CONCURRENCY`` generations at a
+        time, each through admission control. Each result is yielded as soon
+        as it completes and carries the index of its question; a failed or
+        rejected question yields an error instead. ``filters`` applies to
+        every question.
+        """
+        filters = filters or {}
+        version = self.vectorstore.version
+        pending = []
+        for index, query in enumerate(queries):
+            cached = self._cached_answer(query, version, mode, filters=filters)
+            if cached:
+                yield {"index": index, "query": query, **cached}
+            else:
+                pending.append(index)
+
+        embeddings = {}
+        if pending and self._needs_query_embedding(mode, filters):
+            vectors = await self.async_llm.embed([queries[i] for i in pending])
+            misses = []
+            for index, embedding in zip(pending, vectors):
+                cached = self._cached_answer(
+                    queries[index], version, mode, embedding, filters
+                )
+                if cached:
+                    yield {"index": index, "query": queries[index], **cached}
+                else:
+                    misses.append(index)
+                    embeddings[index] = embedding
+            pending = misses
+        if not pending:
+            return
+
+        retrieved = await self._run_blocking(
+            self.vectorstore.query_many,
+            [queries[i] for i in pending],
+            mode=mode,
+            query_embeddings=[embeddings[i] for i in pending] if embeddings else None,
+            **filters,
+        )
+
+        semaphore = asyncio.Semaphore(settings.BATCH_QUERY_CONCURRENCY)
+
+        async def answer(index: int, results: list[dict]):
+            query = queries[index]
+            async with semaphore:
+                try:
+                    result = await self._agenerate_answer(
+                        query,
+                        version,
+                        mode,
+                        results,
+                        embeddings.get(index),
+                        user,
+                        filters,
+                    )
+                except AdmissionRejected as e:
+                    return {
+                        "index": index,
+                        "query": query,
+                        "error": str(e),
+                        "retry_after": e.retry_after,
+                    }
+                except Exception as e:
+                    return {"index": index, "query": query, "error": str(e)}
+            return {"index": index, "query": query, **result}
+
+        tasks = [
+            asyncio.ensure_future(answer(index, results))
+            for index, results in zip(pending, retrieved)
+        ]
+        try:
+            for completed in asyncio.as_completed(tasks):
+                yield await completed
+        finally:
+            # The client may stop reading early
+            for task in tasks:
+                task.cancel()
+
+    async def astream_query(
+        self,
+        query: str,
+        mode: str | None = None,
+        user: str | None = None,
+        filters: dict | None = None,
+    ):
+        """Stream a RAG answer as events.
+
+        The first event carries the retrieved sources, followed by one event
+        per generated token fragment and a final event with timings and
+        token counts. Cached answers are sent as a single token event.
+
+        The sources event is only sent once generation has been admitted,
+        so a rejection surfaces before any output.
+        """
+        filters = filters or {}
+        started = time.perf_counter()
+        version = self.vectorstore.version
+        cached = self._cached_answer(query, version, mode, filters=filters)
+        query_embedding = None
+        if not cached and self._needs_query_embedding(mode, filters):
+            query_embedding = (await self.async_llm.embed([query]))[0]
+            cached = self._cached_answer(query, version, mode, query_embedding, filters)
+        if cached:
+            yield {
+                "event": "sources",
+                "source": cached["source"],
+                "context": cached["context"],
+            }
+            yield {"event": "token", "token": cached["answer"]}
+            yield {
+                "event": "done",
+                "cached": True,
+                "cache_match": cached["cache_match"],
+                "timings": {
+                    "total_ms": round((time.perf_counter() - started) * 1000, 1)
+                },
+            }
+            return
+
+        results = await self._run_blocking(
+            self.vectorstore.query,
+            query,
+            mode=mode,
+            query_embedding=query_embedding,
+            **filters,
+        )
+        prompt, context, sources, usage = self._build_query_prompt(query, results)
+        retrieval_ms = (time.perf_counter() - started) * 1000
+
+        async with self.admission.slot(user):
+            yield {
+                "event": "sources",
+                "source": sources,
+                "context": context,
+                "context_tokens": usage,
+            }
+            answer = []
+            async for event in self._stream_generation(
+                prompt, started, temperature=0.1, max_tokens=500
+            ):
+                if event["event"] == "token":
+                    answer.append(event["token"])
+                elif event["event"] == "done":
+                    event["cached"] = False
+                    event["timings"]["retrieval_ms"] = round(retrieval_ms, 1)
+                    self._store_answer(
+                        query,
+                        version,
+                        mode,
+                        {
+                            "answer": "".join(answer),
+                            "context": context,
+                            "source": sources,
+                            "context_tokens": usage,
+                        },
+                        query_embedding,
+                        filters,
+                    )
+                yield event
+
+    def _needs_query_embedding(self, mode: str | None, filters: dict) -> bool:
+        """Lexical retrieval only needs the embedding for the semantic cache,
+        which filtered questions do not use"""
+        if (mode or settings.RETRIEVAL_MODE) != "lexical":
+            return True
+        return (
+            not filters
+            and self.answer_cache is not None
+            and self.answer_cache.semantic_distance > 0
+        )
+
+    def _cached_answer(
+        self,
+        query: str,
+        version: int,
+        mode: str | None,
+        embedding=None,
+        filters: dict | None = None,
+    ):
+        """Exact lookup without an embedding, semantic lookup with one.
+
+        Answers are only reused for the retrieval mode they were grounded
+        with. Answers to filtered questions are cached under the question
+        and its filters, and only matched exactly.
+        """
+        if self.answer_cache is None:
+            return None
+        if filters and embedding is not None:
+            return None
+        scope = _answer_scope(mode, filters)
+        if embedding is None:
+            response, match = self.answer_cache.get(query, version, scope), "exact"
+        else:
+            response, match = (
+                self.answer_cache.get_similar(embedding, version, scope),
+                "semantic",
+            )
+        if response is None:
+            return None
+        response.update(cached=True, cache_match=match)
+        return response
+
+    def _store_answer(
+        self,
+        query: str,
+        version: int,
+        mode: str | None,
+        result: dict,
+        embedding,
+        filters: dict | None = None,
+    ):
+        if self.answer_cache is not None:
+            if filters:
+                embedding = None
+            scope = _answer_scope(mode, filters)
+            self.answer_cache.put(query, version, result, embedding, scope)
+        return {**result, "cached": False}
+
+    async def astream_chat(self, query: str, user: str | None = None):
+        """Stream a chat answer as token events followed by a final event"""
+        started = time.perf_counter()
+        prompt = f"""Context: {query}"""
+        async with self.admission.slot(user):
+            async for event in self._stream_generation(
+                prompt, started, temperature=0.7, max_tokens=500
+            ):
+                yield event
+
+    async def _stream_generation(self, prompt: str, started: float, **kwargs):
+        first_token_at = None
+        final = {}
+        async for chunk in self.async_llm.stream_completion(prompt, **kwargs):
+            if chunk.get("done"):
+                final = chunk
+                break
+            token = chunk.get("response", "")
+            if not token:
+                continue
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+            yield {"event": "token", "token": token}
+
+        finished = time.perf_counter()
+        yield {
+            "event": "done",
+            "prompt_tokens": final.get("prompt_eval_count"),
+            "completion_tokens": final.get("eval_count"),
+            "timings": {
+                "time_to_first_token_ms": (
+                    round((first_token_at - started) * 1000, 1)
+                    if first_token_at
+                    else None
+                ),
+                "total_ms": round((finished - started) * 1000, 1),
+                # Ollama reports durations in nanoseconds
+                "load_ms": _ns_to_ms(final.get("load_duration")),
+                "prompt_eval_ms": _ns_to_ms(final.get("prompt_eval_duration")),
+                "eval_ms": _ns_to_ms(final.get("eval_duration")),
+            },
+        }
+
+    def chat(self, query: str):
+        prompt = f"""Context: {query}"""
+        response = self.llm.generate_completion(
+            prompt=prompt, temperature=0.7, max_tokens=500
+        )
+        return {"answer": response, "context": query}
+
+    async def achat(self, query: str, user: str | None = None):
+        """Async variant of chat, subject to admission control"""
+        prompt = f"""Context: {query}"""
+        async with self.admission.slot(user):
+            response = await self.async_llm.generate_completion(
+                prompt=prompt, temperature=0.7, max_tokens=500
+            )
+        return {"answer": response, "context": query}
+
+    @staticmethod
+    def _build_query_prompt(query: str, results: list[dict]):
+        # Keep the prompt within the token budget, best ranked chunks first
+        packed = pack_context(results, settings.CONTEXT_TOKEN_BUDGET)
         sources = [
-            result["metadata"]["source"] for result in results
+            chunk["metadata"]["source"] for chunk in packed["chunks"]
         ]  # get the sources
 
-        context = "\n".join([result["content"] for result in results])
+        context = packed["context"]
+        usage = {
+            "used": packed["tokens_used"],
+            "dropped": packed["tokens_dropped"],
+            "trimmed": packed["tokens_trimmed"],
+            "chunks_dropped": packed["chunks_dropped"],
+        }
 
         # Format prompt with context
         prompt = f"""Context: {context}
@@ -28,70 +490,192 @@ class RAGService:
         
         Answer:"""
 
-        # Generate completion
-        response = self.llm.generate_completion(
-            prompt=prompt, temperature=0.1, max_tokens=500
+        return prompt, context, sources, usage
+
+    async def _run_blocking(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, partial(func, *args, **kwargs)
         )
 
-        return {"answer": response, "context": context, "source": sources}
+    async def aclose(self):
+        await self.async_llm.aclose()
 
-    def chat(self, query: str):
-        prompt = f"""Context: {query}"""
-        response = self.llm.generate_completion(
-            prompt=prompt, temperature=0.7, max_tokens=500
-        )
-        return {"answer": response, "context": query}
+    def add_documents(self, documents: list[tuple[str, dict]], replace: bool = False):
+        """Process and store documents with embeddings.
 
-    def add_documents(self, documents: list[tuple[str, dict]]):
-        """Process and store documents with embeddings"""
+        With replace, each source in the batch ends up with exactly the given
+        chunks: unchanged ones are kept as they are, stale ones are deleted.
+        """
         try:
             # Split documents into content and metadata
             contents, metadatas = zip(*documents)
 
-            # Add to vector store
-            self.vectorstore.add_documents(
+            # Add to vector store; unchanged chunks are skipped
+            result = self.vectorstore.add_documents(
                 documents=list(contents), metadata=list(metadatas)
             )
+            if result["added"]:
+                self.source_catalog.record(result["added"])
+            removed = 0
+            if replace:
+                removed = self.prune_sources(
+                    self.ids_by_source(documents, result["ids"])
+                )
 
-            # In a real implementation, return actual IDs from Chroma
             return {
                 "count": len(documents),
-                "ids": [str(uuid.uuid4()) for _ in documents],  # Mock IDs
+                "ids": result["ids"],
+                "new": result["new"],
+                "skipped": result["skipped"],
+                "removed": removed,
             }
         except Exception as e:
             raise RuntimeError(f"Document storage failed: {str(e)}")
 
+    @staticmethod
+    def ids_by_source(documents: list[tuple[str, dict]], ids: list[str]):
+        """Groups the stored chunk IDs of a batch by their source"""
+        grouped: dict[str, set[str]] = defaultdict(set)
+        for (_, metadata), chunk_id in zip(documents, ids):
+            grouped[(metadata or {}).get("source", "unknown")].add(chunk_id)
+        return grouped
+
+    def prune_sources(self, keep: dict[str, set[str]]) -> int:
+        """Deletes every chunk of each source that is not in its keep set.
+
+        This completes a replace: chunks that did not change kept their
+        content-addressed IDs, so they were neither re-embedded nor stored
+        again. Returns the number of chunks deleted.
+        """
+        removed = 0
+        for source, ids in keep.items():
+            stale = {
+                chunk_id: chunk_hash
+                for chunk_id, chunk_hash in self.vectorstore.source_chunks(
+                    source
+                ).items()
+                if chunk_id not in ids
+            }
+            removed += self._delete_chunks(source, stale)
+        return removed
+
+    def delete_source(self, source: str) -> int:
+        """Deletes every chunk of a source; returns how many were deleted"""
+        try:
+            return self._delete_chunks(source, self.vectorstore.source_chunks(source))
+        except Exception as e:
+            raise RuntimeError(f"Source deletion failed: {str(e)}")
+
+    def _delete_chunks(self, source: str, chunks: dict[str, str]) -> int:
+        if not chunks:
+            return 0
+        self.vectorstore.delete(list(chunks))
+        self.source_catalog.discard(
+            (source, chunk_hash) for chunk_hash in chunks.values()
+        )
+        return len(chunks)
+
     def process_pdf(
-        self, pdf_content: bytes, chunk_size: int = 2048, overlap: int = 256
+        self,
+        pdf_content: bytes | str,
+        chunk_size: int | None = None,
+        overlap: int | None = None,
     ):
+        """Chunks a PDF given as bytes or as a file path"""
+        return [
+            chunk for chunk, _ in self.iter_pdf_chunks(pdf_content, chunk_size, overlap)
+        ]
 
-        # Read PDF from bytes
-        pdf_document = pymupdf.open(stream=pdf_content, filetype="pdf")
-
-        text = ""
-        for page in pdf_document:
-            text += page.get_text()
+    def iter_pdf_chunks(
+        self,
+        pdf: bytes | str,
+        chunk_size: int | None = None,
+        overlap: int | None = None,
+    ):
+        """Yields (chunk, {"page": n}) as pages are extracted.
 
-        # Simple character-based splitting
-        chunks = []
-        start = 0
-        while start < len(text):
-            end = min(start + chunk_size, len(text))
-            chunks.append(text[start:end])
-            start += (
-                chunk_size - overlap
-            )  # Move start position with overlap consideration
+        Files on disk are extracted in parallel page ranges; in-memory PDFs
+        are read in-process.
+        """
+        if isinstance(pdf, (bytes, bytearray)):
+            pages = iter_pdf_stream_pages(pdf)
+        else:
+            pages = iter_pdf_pages(pdf)
+        return TextChunker(chunk_size, overlap).chunk_pages(pages)
 
-        return chunks
+    def get_stats(self) -> dict:
+        """Runtime counters for the caches and queues behind the service"""
+        cache = self.async_llm.embedding_cache
+        lexical_index = self.vectorstore.lexical_index
+        return {
+            "embedding_cache": cache.stats() if cache else None,
+            "answer_cache": self.answer_cache.stats() if self.answer_cache else None,
+            "embedding_batcher": self.async_llm.batcher.stats(),
+            "generation": self.admission.stats(),
+            "vectorstore": self.vectorstore.stats(),
+            "lexical_index": lexical_index.stats() if lexical_index else None,
+            "coalescing": {
+                "queries": combined_stats(self._query_flight, self._aquery_flight),
+                "embeddings": combined_stats(
+                    self.vectorstore.embedding_function.flight,
+                    self.async_llm.embedding_flight,
+                ),
+                "completions": combined_stats(
+                    self.llm.flight, self.async_llm.completion_flight
+                ),
+            },
+        }
 
     def get_unique_sources(self) -> list[str]:
-        """Retrieves all unique sources from the vectorstore"""
-        metadatas = self.vectorstore.get_all_metadata()
-        if not metadatas:
-            return []
+        """Retrieves all unique sources from the source catalog"""
+        return self.source_catalog.names()
+
+    def sync_source_catalog(self) -> bool:
+        """Rebuilds the source catalog if it disagrees with the vectorstore,
+        e.g. for a collection filled before the catalog existed or by the
+        batch scripts. Returns whether a rebuild was needed."""
+        if self.source_catalog.chunk_total() == self.vectorstore.count():
+            return False
+        self.source_catalog.rebuild(self.vectorstore.iter_source_hashes())
+        return True
+
+
+def catalog_name() -> str:
+    """Catalog of the configured collection. Chroma keeps the bare collection
+    name it has always used; other backends get their own catalog"""
+    if settings.VECTORSTORE_BACKEND == "chroma":
+        return settings.CHROMA_COLLECTION_NAME
+    return f"{settings.VECTORSTORE_BACKEND}:{settings.CHROMA_COLLECTION_NAME}"
+
+
+def _filters_key(filters: dict) -> str:
+    return json.dumps(filters, sort_keys=True) if filters else ""
+
+
+def _answer_scope(mode: str | None, filters: dict | None) -> str:
+    """Answer cache scope: the retrieval mode and the filters, kept exact
+    (only the question itself is normalised)"""
+    return f"{mode or settings.RETRIEVAL_MODE}\n{_filters_key(filters)}"
+
+
+def _ns_to_ms(value):
+    return round(value / 1_000_000, 1) if value is not None else None
+
+
+_rag_service: RAGService | None = None
+_rag_service_lock = threading.Lock()
 
-        sources = [metadata.get("source", "unknown") for metadata in metadatas]
-        return list(set(sources))
 
+def get_rag_service() -> RAGService:
+    """The shared RAG service, built on first use.
 
-rag_service = RAGService()
+    Building it opens the vectorstore, so importing this module stays cheap;
+    the app builds it during startup and routes receive it through Depends
+    """
+    global _rag_service
+    if _rag_service is None:
+        with _rag_service_lock:
+            if _rag_service is None:
+                _rag_service = RAGService()
+    return _rag_service
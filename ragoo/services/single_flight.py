@@ -0,0 +1,85 @@
+# Request coalescing: concurrent identical calls share one execution
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Hashable
+
+
+class SingleFlight:
+    """Runs ``fn`` once per key among concurrent callers in threads.
+
+    The first caller for a key executes it; callers arriving while it is in
+    flight wait for and share its result or exception. Nothing is kept once
+    the call completes, so this never serves stale results.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: dict[Hashable, Future] = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+                self.executed += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    def stats(self) -> dict:
+        return {"executed": self.executed, "coalesced": self.coalesced}
+
+
+class AsyncSingleFlight:
+    """Event-loop counterpart of ``SingleFlight`` for coroutines.
+
+    The shared call runs as its own task, so a caller that gives up does
+    not cancel it for the others still waiting.
+    """
+
+    def __init__(self):
+        self._calls: dict[tuple, asyncio.Task] = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        loop = asyncio.get_running_loop()
+        # Tasks cannot be awaited from another loop, so never share across loops
+        call_key = (id(loop), key)
+        task = self._calls.get(call_key)
+        if task is None:
+            task = loop.create_task(fn())
+            self._calls[call_key] = task
+            task.add_done_callback(lambda _: self._calls.pop(call_key, None))
+            self.executed += 1
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        return {"executed": self.executed, "coalesced": self.coalesced}
+
+
+def combined_stats(*flights) -> dict:
+    """Sums the counters of several flight groups"""
+    return {
+        "executed": sum(flight.executed for flight in flights),
+        "coalesced": sum(flight.coalesced for flight in flights),
+    }
@@ -0,0 +1,149 @@
+# Catalog of ingested sources, kept current on every write
+import threading
+from collections import defaultdict
+from typing import Iterable
+from sqlalchemy import func, select, update
+from sqlalchemy.exc import IntegrityError
+from ragoo.database import models
+from ragoo.database.database import SessionLocal
+
+EMPTY_HASH = "0" * 64
+
+
+class SourceCatalog:
+    """Per-source chunk counts and content hashes plus a persisted version.
+
+    The catalog is updated in the same call that stores chunks, so listing
+    sources is an indexed table read instead of a scan over the metadata of
+    every chunk. The version is bumped on every write to the collection and
+    is shared by all processes using the database: each write starts by
+    incrementing it in the database, which locks the collection (its state
+    row, or the whole database on SQLite) until the write commits, so
+    writers in other processes queue instead of losing updates. Rows are
+    keyed by collection, so catalogs of other collections in the same
+    database are left alone.
+    """
+
+    def __init__(self, collection: str, session_factory=SessionLocal):
+        self.collection = collection
+        self.session_factory = session_factory
+        # Saves threads of one process from queueing on the database lock
+        self._lock = threading.Lock()
+
+    def record(self, chunks: Iterable[tuple[str, str]]) -> int:
+        """Adds newly stored (source, content_hash) chunks; returns the version"""
+        return self._apply(chunks, 1)
+
+    def discard(self, chunks: Iterable[tuple[str, str]]) -> int:
+        """Subtracts deleted (source, content_hash) chunks; sources left
+        without chunks are removed. Returns the version"""
+        return self._apply(chunks, -1)
+
+    def _apply(
+        self, chunks: Iterable[tuple[str, str]], sign: int, replace: bool = False
+    ) -> int:
+        totals = defaultdict(lambda: [0, 0])
+        for source, chunk_hash in chunks:
+            totals[source][0] += 1
+            # XOR is its own inverse, so removing a chunk undoes adding it
+            totals[source][1] ^= int(chunk_hash, 16)
+
+        self._create_state()
+        with self._lock, self.session_factory() as db:
+            # Bumped first, so the counts below are read under its lock
+            version = self._bump(db)
+            if replace:
+                self._sources(db).delete()
+            for source, (count, digest) in totals.items():
+                row = db.get(
+                    models.Source, (self.collection, source), with_for_update=True
+                )
+                if row is None:
+                    if sign < 0:
+                        continue
+                    row = models.Source(
+                        collection=self.collection,
+                        name=source,
+                        chunk_count=0,
+                        content_hash=EMPTY_HASH,
+                    )
+                    db.add(row)
+                row.chunk_count += sign * count
+                row.content_hash = _xor(row.content_hash, digest)
+                if row.chunk_count <= 0:
+                    db.delete(row)
+            db.commit()
+        return version
+
+    def rebuild(self, chunks: Iterable[tuple[str, str]]) -> int:
+        """Replaces the catalog with the given (source, content_hash) chunks"""
+        return self._apply(chunks, 1, replace=True)
+
+    def version(self) -> int:
+        with self.session_factory() as db:
+            state = db.get(models.CollectionState, self.collection)
+            return state.version if state else 0
+
+    def page(self, offset: int = 0, limit: int = 100):
+        """Returns (total, sources) for one page of sources ordered by name"""
+        with self.session_factory() as db:
+            total = (
+                db.query(func.count(models.Source.name))
+                .filter(models.Source.collection == self.collection)
+                .scalar()
+            )
+            rows = (
+                self._sources(db)
+                .order_by(models.Source.name)
+                .offset(offset)
+                .limit(limit)
+                .all()
+            )
+            return total, rows
+
+    def names(self) -> list[str]:
+        with self.session_factory() as db:
+            return [
+                name
+                for (name,) in db.query(models.Source.name)
+                .filter(models.Source.collection == self.collection)
+                .order_by(models.Source.name)
+            ]
+
+    def chunk_total(self) -> int:
+        with self.session_factory() as db:
+            return (
+                db.query(func.sum(models.Source.chunk_count))
+                .filter(models.Source.collection == self.collection)
+                .scalar()
+                or 0
+            )
+
+    def _sources(self, db):
+        return db.query(models.Source).filter(
+            models.Source.collection == self.collection
+        )
+
+    def _create_state(self):
+        """Inserts the version row on first use, so it can be locked"""
+        with self.session_factory() as db:
+            if db.get(models.CollectionState, self.collection) is not None:
+                return
+            db.add(models.CollectionState(name=self.collection, version=0))
+            try:
+                db.commit()
+            except IntegrityError:
+                db.rollback()  # another process inserted it first
+
+    def _bump(self, db) -> int:
+        state = models.CollectionState
+        db.execute(
+            update(state)
+            .where(state.name == self.collection)
+            .values(version=state.version + 1)
+        )
+        return db.scalar(select(state.version).where(state.name == self.collection))
+
+
+def _xor(hex_digest: str, value: int) -> str:
+    return format(int(hex_digest, 16) ^ value, "064x")
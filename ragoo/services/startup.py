@@ -0,0 +1,57 @@
+# Startup progress, reported by the readiness endpoint
+import logging
+import time
+from contextlib import asynccontextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class StartupProgress:
+    """Records the app's startup steps: the schema before the server
+    accepts connections, the rest in the background.
+
+    The app is ready once every step has finished; a failed step that is
+    not required (such as the model warm-up) is reported but does not hold
+    readiness back
+    """
+
+    def __init__(self):
+        self.steps: dict[str, dict] = {}
+        self.ready = False
+        self.failed = False
+        self._started = time.perf_counter()
+        self._ready_ms: float | None = None
+
+    @asynccontextmanager
+    async def step(self, name: str, required: bool = True):
+        """Times the enclosed block; the yielded dict is reported with it"""
+        detail = {"status": "running"}
+        self.steps[name] = detail
+        started = time.perf_counter()
+        try:
+            yield detail
+        except Exception as e:
+            detail.update(status="failed", error=str(e))
+            if required:
+                self.failed = True
+                raise
+            logger.warning("Startup step %s failed: %s", name, e)
+        else:
+            detail["status"] = "done"
+        finally:
+            detail["ms"] = _elapsed_ms(started)
+
+    def finish(self):
+        self.ready = True
+        self._ready_ms = _elapsed_ms(self._started)
+
+    def status(self) -> dict:
+        if self.ready:
+            state = "ready"
+        else:
+            state = "failed" if self.failed else "starting"
+        return {"status": state, "ready_ms": self._ready_ms, "steps": self.steps}
+
+
+def _elapsed_ms(started: float) -> float:
+    return round((time.perf_counter() - started) * 1000, 1)
@@ -1,20 +1,109 @@
 # User service logic
-from sqlalchemy.orm import Session
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from ragoo.core.config import settings
 from ragoo.database import models
 from ragoo.schemas.user import UserCreate
-from ragoo.core.security import get_password_hash
+from ragoo.core.security import password_hasher
 
 
-def create_user(db: Session, user: UserCreate):
-    hashed_password = get_password_hash(user.password)
+class UserCache:
+    """Bounded LRU of user records by username, for the login path.
+
+    Records are plain dicts, independent of any session. Entries expire
+    after ``ttl`` seconds and are invalidated by writes made through this
+    module; unknown usernames are not cached.
+    """
+
+    def __init__(self, max_entries: int = 10_000, ttl: float = 300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, username: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is None or time.monotonic() - entry[0] > self.ttl:
+                self._entries.pop(username, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(username)
+            self.hits += 1
+            return dict(entry[1])
+
+    def put(self, username: str, record: dict):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[username] = (time.monotonic(), dict(record))
+            self._entries.move_to_end(username)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, username: str):
+        with self._lock:
+            self._entries.pop(username, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+user_cache = UserCache(
+    max_entries=settings.USER_CACHE_MAX_ENTRIES, ttl=settings.USER_CACHE_TTL_SECONDS
+)
+
+
+async def create_user(
+    db: AsyncSession, user: UserCreate, hashed_password: str | None = None
+):
+    """Stores a new user; the password is hashed on the password hasher's
+    threads unless ``hashed_password`` is given"""
+    hashed_password = hashed_password or await password_hasher.hash(user.password)
     db_user = models.User(
         username=user.username, email=user.email, hashed_password=hashed_password
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
+    user_cache.invalidate(db_user.username)
     return db_user
 
 
-def get_user_by_username(db: Session, username: str):
-    return db.query(models.User).filter(models.User.username == username).first()
+async def get_user_by_username(db: AsyncSession, username: str):
+    result = await db.execute(
+        select(models.User).where(models.User.username == username)
+    )
+    return result.scalars().first()
+
+
+async def load_user_record(db: AsyncSession, username: str) -> Optional[dict]:
+    """Reads the user's login record and adds it to the user cache; check
+    ``user_cache`` first"""
+    user = await get_user_by_username(db, username)
+    if user is None:
+        return None
+    record = {
+        "id": user.id,
+        "username": user.username,
+        "email": user.email,
+        "hashed_password": user.hashed_password,
+    }
+    user_cache.put(username, record)
+    return record
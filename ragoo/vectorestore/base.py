@@ -0,0 +1,477 @@
+# Backend-independent vector store logic shared by every storage engine
+import os
+from abc import ABC, abstractmethod
+from typing import Iterator, Optional
+from ragoo.core.config import settings
+from ragoo.vectorestore.embedding_cache import content_hash
+from ragoo.vectorestore.lexical_index import LexicalIndex, reciprocal_rank_fusion
+from ragoo.vectorestore.reranking import select_diverse
+
+RETRIEVAL_MODES = ("vector", "lexical", "hybrid")
+WHERE_OPERATORS = ("$eq", "$ne", "$gt", "$gte", "$lt", "$lte", "$in", "$nin")
+WHERE_DOCUMENT_OPERATORS = ("$contains", "$not_contains")
+WHERE_VALUE_TYPES = (str, int, float)  # bool is an int
+
+
+def retrieval_filters(
+    sources: Optional[list[str]] = None,
+    page_from: Optional[int] = None,
+    page_to: Optional[int] = None,
+    where: Optional[dict] = None,
+    where_document: Optional[dict] = None,
+) -> dict:
+    """Keyword arguments of ``VectorStore.query`` restricting a search.
+
+    Sources, an inclusive page range and any other metadata conditions are
+    combined into one Chroma-style ``where`` clause; ``where_document``
+    filters on the chunk text. Raises ValueError for malformed filters.
+    """
+    clauses = []
+    if sources:
+        clauses.append(
+            {"source": sources[0]}
+            if len(sources) == 1
+            else {"source": {"$in": list(sources)}}
+        )
+    if page_from is not None:
+        clauses.append({"page": {"$gte": page_from}})
+    if page_to is not None:
+        clauses.append({"page": {"$lte": page_to}})
+    if where:
+        check_where(where)
+        clauses.append(where)
+    filters = {}
+    if clauses:
+        filters["where"] = clauses[0] if len(clauses) == 1 else {"$and": clauses}
+    if where_document:
+        check_where_document(where_document)
+        filters["where_document"] = where_document
+    return filters
+
+
+def check_where(where: dict):
+    """Validates a metadata filter by Chroma's rules, so every backend
+    accepts the same filters: each dict holds one field or one of
+    ``$and``/``$or``, which combine at least two filters, and a field maps
+    to a scalar or to one operator"""
+    if not isinstance(where, dict) or len(where) != 1:
+        raise ValueError(
+            f"Invalid where filter, expected one field or $and/$or: {where!r}"
+        )
+    key, condition = next(iter(where.items()))
+    if key in ("$and", "$or"):
+        if not isinstance(condition, list) or len(condition) < 2:
+            raise ValueError(f"{key} expects a list of at least two filters")
+        for clause in condition:
+            check_where(clause)
+    elif key.startswith("$"):
+        raise ValueError(f"Unknown where operator: {key}")
+    elif isinstance(condition, dict):
+        if len(condition) != 1 or next(iter(condition)) not in WHERE_OPERATORS:
+            raise ValueError(f"Invalid condition on {key}: {condition!r}")
+        operator, value = next(iter(condition.items()))
+        if operator in ("$in", "$nin"):
+            if (
+                not isinstance(value, list)
+                or not value
+                or not all(isinstance(v, WHERE_VALUE_TYPES) for v in value)
+                or not all(isinstance(v, type(value[0])) for v in value)
+            ):
+                raise ValueError(
+                    f"{operator} on {key} expects a non-empty list of values "
+                    "of one type"
+                )
+        elif operator in ("$gt", "$gte", "$lt", "$lte"):
+            if not isinstance(value, (int, float)):
+                raise ValueError(f"{operator} on {key} expects a number")
+        elif not isinstance(value, WHERE_VALUE_TYPES):
+            raise ValueError(f"Invalid condition on {key}: {condition!r}")
+    elif not isinstance(condition, WHERE_VALUE_TYPES):
+        raise ValueError(f"Invalid condition on {key}: {condition!r}")
+
+
+def check_where_document(where_document: dict):
+    """Validates a document text filter, by Chroma's rules like
+    ``check_where``"""
+    if not isinstance(where_document, dict) or len(where_document) != 1:
+        raise ValueError(f"Invalid where_document filter: {where_document!r}")
+    operator, value = next(iter(where_document.items()))
+    if operator in ("$and", "$or"):
+        if not isinstance(value, list) or len(value) < 2:
+            raise ValueError(f"{operator} expects a list of at least two filters")
+        for clause in value:
+            check_where_document(clause)
+    elif (
+        operator not in WHERE_DOCUMENT_OPERATORS
+        or not isinstance(value, str)
+        or not value
+    ):
+        raise ValueError(f"Invalid where_document filter: {where_document!r}")
+
+
+def generate_chunk_id(source: str, chunk_hash: str) -> str:
+    """Content-addressed chunk ID: a short source digest plus the chunk hash"""
+    return f"{content_hash(source)[:16]}-{chunk_hash}"
+
+
+class VectorStore(ABC):
+    """Chunk store with dense, lexical and hybrid retrieval.
+
+    Content-addressed adds, the BM25 index, retrieval modes, rank fusion
+    and reranking live here. Backends supply storage and nearest-neighbour
+    search by implementing ``count``, ``source_chunks``, ``iter_stored``,
+    ``_existing_ids``, ``_store``, ``_remove``, ``_vector_candidates``,
+    ``_filtered_ids`` and ``_get_by_ids``, and set ``embedding_function``
+    and ``max_batch_size``.
+    """
+
+    max_batch_size = 4096
+
+    def __init__(self):
+        # Bumped on every write so caches built on query results can expire
+        self.version = 0
+        self.lexical_index = None
+
+    def _open_lexical_index(self, directory: str, name: str):
+        """Loads the BM25 index, rebuilding it if it disagrees with the store"""
+        if not settings.LEXICAL_INDEX_ENABLED:
+            return
+        self.lexical_index = LexicalIndex(os.path.join(directory, f"{name}.bm25"))
+        if len(self.lexical_index) != self.count():
+            self._rebuild_lexical_index()
+
+    def add_documents(self, documents: list[str], metadata: list[dict]) -> dict:
+        """Store documents with automatic embedding generation.
+
+        Chunks get content-addressed IDs, so re-adding an unchanged chunk is
+        a no-op: it is neither embedded nor stored again.
+
+        Returns the ID of every document plus counts of new and skipped ones.
+        """
+        """Handle empty metadata gracefully"""
+        # Ensure metadata has same length as documents
+        processed_metadata = []
+        for meta in metadata:
+            # Add default values if metadata is empty
+            if not meta:
+                processed_metadata.append({"source": "unknown"})
+            else:
+                processed_metadata.append(dict(meta))
+
+        ids = []
+        pending = {}  # id -> (document, metadata), first occurrence wins
+        for document, meta in zip(documents, processed_metadata):
+            chunk_hash = content_hash(document)
+            chunk_id = generate_chunk_id(meta.get("source", "unknown"), chunk_hash)
+            meta["content_hash"] = chunk_hash
+            ids.append(chunk_id)
+            pending.setdefault(chunk_id, (document, meta))
+
+        existing = self._existing_ids(list(pending))
+        candidates = [chunk_id for chunk_id in pending if chunk_id not in existing]
+        new_ids = []
+        for start in range(0, len(candidates), self.max_batch_size):
+            batch = candidates[start : start + self.max_batch_size]
+            stored = self._store(
+                batch, [pending[i][0] for i in batch], [pending[i][1] for i in batch]
+            )
+            if self.lexical_index is not None:
+                self.lexical_index.add(stored, [pending[i][0] for i in stored])
+            new_ids.extend(stored)
+        if new_ids:
+            self.version += 1
+
+        return {
+            "ids": ids,
+            "new": len(new_ids),
+            "skipped": len(ids) - len(new_ids),
+            # (source, content_hash) of every chunk actually stored
+            "added": [
+                (pending[i][1].get("source", "unknown"), pending[i][1]["content_hash"])
+                for i in new_ids
+            ],
+        }
+
+    def delete(self, ids: list[str]):
+        """Removes chunks by ID, in batches"""
+        for start in range(0, len(ids), self.max_batch_size):
+            batch = ids[start : start + self.max_batch_size]
+            self._remove(batch)
+            if self.lexical_index is not None:
+                self.lexical_index.remove(batch)
+        if ids:
+            self.version += 1
+
+    def embed(self, texts: list[str]) -> list[list[float]]:
+        """Embed texts with the store's embedding function"""
+        return self.embedding_function(texts)
+
+    def embed_queries(self, texts: list[str]) -> list[list[float]]:
+        """Embed query texts, which are never stored"""
+        return self.embedding_function.embed_query(texts)
+
+    def query(
+        self,
+        query_text: str,
+        k: int = 4,
+        mode: Optional[str] = None,
+        query_embedding: Optional[list[float]] = None,
+        where: Optional[dict] = None,
+        where_document: Optional[dict] = None,
+    ) -> list[dict]:
+        """Retrieve the k best chunks for a query.
+
+        ``mode`` is "vector" (dense search), "lexical" (BM25 only, no
+        embedding call) or "hybrid" (both, merged by reciprocal rank
+        fusion); it defaults to ``RETRIEVAL_MODE``. A precomputed
+        ``query_embedding`` saves the embedding call of the vector search.
+
+        ``where`` (metadata) and ``where_document`` (chunk text) take Chroma
+        filter syntax, see ``retrieval_filters``. They restrict the search
+        itself rather than its results, so a filtered query still returns
+        k chunks when that many match.
+
+        With ``MMR_ENABLED``, ``RETRIEVAL_FETCH_FACTOR * k`` candidates are
+        fetched and narrowed to k diverse ones without near-duplicates.
+        """
+        embeddings = None if query_embedding is None else [query_embedding]
+        return self.query_many(
+            [query_text], k, mode, embeddings, where, where_document
+        )[0]
+
+    def query_many(
+        self,
+        query_texts: list[str],
+        k: int = 4,
+        mode: Optional[str] = None,
+        query_embeddings: Optional[list[list[float]]] = None,
+        where: Optional[dict] = None,
+        where_document: Optional[dict] = None,
+    ) -> list[list[dict]]:
+        """Retrieve the k best chunks for each of several queries.
+
+        Missing embeddings are computed in one batched call and the dense
+        search for all queries is a single backend search. See ``query``.
+        """
+        mode = mode or settings.RETRIEVAL_MODE
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode: {mode}")
+        if mode != "vector" and self.lexical_index is None:
+            if mode == "lexical":
+                raise ValueError("Lexical retrieval needs LEXICAL_INDEX_ENABLED")
+            mode = "vector"
+        if mode != "lexical" and query_embeddings is None:
+            query_embeddings = self.embed_queries(query_texts)
+
+        filters = {"where": where, "where_document": where_document}
+        # BM25 scores every chunk, so it is restricted to the matching IDs
+        allowed = None
+        if mode != "vector" and (where or where_document):
+            allowed = self._filtered_ids(where, where_document)
+
+        rerank = settings.MMR_ENABLED
+        fetch = k * settings.RETRIEVAL_FETCH_FACTOR if rerank else k
+        if mode == "lexical":
+            per_query = [
+                self._lexical_candidates(text, fetch, rerank, allowed)
+                for text in query_texts
+            ]
+        elif mode == "vector":
+            per_query = self._vector_candidates(
+                query_embeddings, fetch, rerank, **filters
+            )
+        else:
+            pool = max(fetch, settings.HYBRID_CANDIDATES)
+            dense = self._vector_candidates(query_embeddings, pool, rerank, **filters)
+            per_query = [
+                self._hybrid_candidates(text, candidates, fetch, rerank, allowed)
+                for text, candidates in zip(query_texts, dense)
+            ]
+
+        results = []
+        for candidates in per_query:
+            if rerank:
+                candidates = select_diverse(
+                    candidates,
+                    k,
+                    diversity=settings.MMR_DIVERSITY,
+                    duplicate_similarity=settings.DEDUP_SIMILARITY,
+                    text_overlap=settings.DEDUP_TEXT_OVERLAP,
+                )
+            results.append(
+                [
+                    {
+                        "id": c["id"],
+                        "content": c["content"],
+                        "metadata": c["metadata"],
+                        "distance": c["distance"],
+                    }
+                    for c in candidates[:k]
+                ]
+            )
+        return results
+
+    def lexical_query(self, query_text: str, k: int = 4) -> list[dict]:
+        """BM25 search over the lexical index; needs no embedding"""
+        return self.query(query_text, k, mode="lexical")
+
+    def query_by_embedding(
+        self, query_embedding: list[float], k: int = 4
+    ) -> list[dict]:
+        """Query with a precomputed embedding, skipping the embedding function"""
+        return [
+            {"content": c["content"], "metadata": c["metadata"]}
+            for c in self._vector_candidates([query_embedding], k, False)[0]
+        ]
+
+    def _lexical_candidates(
+        self,
+        query_text: str,
+        n: int,
+        with_embeddings: bool,
+        allowed: Optional[set[str]] = None,
+    ) -> list[dict]:
+        """BM25 matches; relevance is the score relative to the best match"""
+        return self._ranked_candidates(
+            self.lexical_index.search(query_text, n, allowed), {}, with_embeddings
+        )
+
+    def _hybrid_candidates(
+        self,
+        query_text: str,
+        dense: list[dict],
+        n: int,
+        with_embeddings: bool,
+        allowed: Optional[set[str]] = None,
+    ) -> list[dict]:
+        """Dense candidates and BM25 results merged by reciprocal rank fusion"""
+        lexical = self.lexical_index.search(
+            query_text, max(n, settings.HYBRID_CANDIDATES), allowed
+        )
+        fused = reciprocal_rank_fusion(
+            [[c["id"] for c in dense], [chunk_id for chunk_id, _ in lexical]],
+            k=settings.RRF_K,
+        )[:n]
+        return self._ranked_candidates(
+            fused, {c["id"]: c for c in dense}, with_embeddings
+        )
+
+    def _ranked_candidates(
+        self, ranked: list[tuple[str, float]], known: dict, with_embeddings: bool
+    ) -> list[dict]:
+        """Candidates for (id, score) pairs, best first, fetching unknown ones"""
+        missing = [chunk_id for chunk_id, _ in ranked if chunk_id not in known]
+        fetched = self._get_by_ids(missing, with_embeddings)
+        top = ranked[0][1] if ranked else 1.0
+        candidates = []
+        for chunk_id, score in ranked:
+            found = known.get(chunk_id) or fetched.get(chunk_id)
+            if found is not None:
+                candidates.append({**found, "relevance": score / top})
+        return candidates
+
+    def _rebuild_lexical_index(self):
+        """Re-indexes every stored chunk, e.g. for a collection that predates
+        the lexical index"""
+        self.lexical_index.rebuild(self.iter_stored("documents"))
+
+    def iter_source_hashes(self) -> Iterator[tuple[str, str]]:
+        """Yields (source, content hash) for every stored chunk.
+
+        Chunks stored without a content_hash, e.g. by the batch scripts, are
+        hashed from their stored text, as they would be at ingest
+        """
+        legacy = {}
+        for chunk_id, metadata in self.iter_stored("metadatas"):
+            metadata = metadata or {}
+            source = metadata.get("source", "unknown")
+            if metadata.get("content_hash"):
+                yield source, metadata["content_hash"]
+            else:
+                legacy[chunk_id] = source
+        if not legacy:
+            return
+        for chunk_id, document in self.iter_stored("documents"):
+            if chunk_id in legacy:
+                yield legacy[chunk_id], content_hash(document or "")
+
+    def get_all_metadata(self) -> list[dict]:
+        """Retrieve all metadatas contained in the vectorstore"""
+        return [metadata for _, metadata in self.iter_stored("metadatas")]
+
+    def stats(self) -> dict:
+        return {"backend": settings.VECTORSTORE_BACKEND, "chunks": self.count()}
+
+    # Storage primitives provided by each backend
+
+    @abstractmethod
+    def count(self) -> int:
+        """Number of stored chunks"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def source_chunks(self, source: str) -> dict[str, str]:
+        """Maps the ID of every chunk of a source to its content hash"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def iter_stored(self, field: str = "metadatas") -> Iterator[tuple[str, object]]:
+        """Yields (id, document or metadata) for every stored chunk"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def _existing_ids(self, ids: list[str]) -> set[str]:
+        """IDs from the given list that are already stored"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def _store(
+        self, ids: list[str], documents: list[str], metadatas: list[dict]
+    ) -> list[str]:
+        """Embeds and stores one batch of new chunks; returns the IDs it
+        stored, leaving out any a concurrent writer stored first"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def _remove(self, ids: list[str]):
+        """Deletes one batch of chunks"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def _vector_candidates(
+        self,
+        query_embeddings: list[list[float]],
+        n: int,
+        with_embeddings: bool,
+        where: Optional[dict] = None,
+        where_document: Optional[dict] = None,
+    ) -> list[list[dict]]:
+        """Nearest chunks of each query among those matching the filters;
+        relevance is cosine similarity"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def _filtered_ids(
+        self, where: Optional[dict], where_document: Optional[dict]
+    ) -> set[str]:
+        """IDs of the chunks matching the filters"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def _get_by_ids(self, ids: list[str], with_embeddings: bool = False) -> dict:
+        """Maps each found ID to its candidate dict"""
+        raise NotImplementedError
+
+
+def get_vectorstore() -> VectorStore:
+    """Creates the vector store selected by ``VECTORSTORE_BACKEND``"""
+    backend = settings.VECTORSTORE_BACKEND
+    if backend == "chroma":
+        from ragoo.vectorestore.chroma_handler import ChromaHandler
+
+        return ChromaHandler()
+    if backend == "memmap":
+        from ragoo.vectorestore.memmap_store import MemmapVectorStore
+
+        return MemmapVectorStore()
+    raise ValueError(f"Unknown vectorstore backend: {backend}")
@@ -1,66 +1,353 @@
 # Logic to implement vector database using chroma
-import uuid
-from typing import List
+import os
+import shutil
+import threading
+from typing import List, Optional
 import chromadb
+from chromadb.errors import NotFoundError
 from chromadb.utils.embedding_functions import EmbeddingFunction
-import requests
 from ragoo.core.config import settings
+from ragoo.services.ollama_service import OllamaEmbedder
+from ragoo.vectorestore.base import VectorStore
+from ragoo.vectorestore.embedding_cache import content_hash, get_embedding_cache
+from ragoo.vectorestore.quantized_index import QuantizedIndex
 
+# Stored in Chroma in place of the real vectors when the quantized tier
+# holds them, so Chroma's HNSW index costs next to nothing
+PLACEHOLDER_EMBEDDING = [1.0]
+TIERED_SUFFIX = "_tiered"
+
+
+class ChromaHandler(VectorStore):
+    """Chroma collection, optionally with a quantized tier for dense search.
+
+    With ``QUANTIZED_TIER`` set, the tier owns the vectors: Chroma keeps
+    documents, metadata and filtering in a collection of its own (the
+    collection name plus ``_tiered``) whose embeddings are one-dimensional
+    placeholders. Switching the tier on or off moves the chunks between
+    the two collections at startup, without re-embedding them.
+    """
 
-class ChromaHandler:
     def __init__(self):
+        super().__init__()
+        # Serialises writes, so a chunk stored by a concurrent writer since
+        # the unlocked _existing_ids check is not reported as new twice
+        self._write_lock = threading.Lock()
         self.client = chromadb.PersistentClient(path=settings.CHROMA_PERSIST_DIR)
-        self.embedding_function = OllamaEmbeddingFunction(
-            host=settings.OLLAMA_HOST, model=settings.EMBEDDING_MODEL
+        self.embedding_function = OllamaEmbedder(
+            host=settings.OLLAMA_HOST,
+            model=settings.EMBEDDING_MODEL,
+            cache=get_embedding_cache(),
         )
 
+        name = settings.CHROMA_COLLECTION_NAME
+        tier_path = os.path.join(settings.CHROMA_PERSIST_DIR, f"{name}.quantized")
+        self.quantized_index = None
+        if settings.QUANTIZED_TIER:
+            self.quantized_index = QuantizedIndex(
+                tier_path,
+                quantization=settings.QUANTIZED_TIER,
+                dimensions=settings.QUANTIZED_DIMENSIONS,
+                rescore_factor=settings.QUANTIZED_RESCORE_FACTOR,
+            )
+        tiered = self.quantized_index is not None
+
         self.collection = self.client.get_or_create_collection(
-            name=settings.CHROMA_COLLECTION_NAME,
-            embedding_function=self.embedding_function,
+            name=name + TIERED_SUFFIX if tiered else name,
+            embedding_function=OllamaEmbeddingFunction(self.embedding_function),
             metadata={"hnsw:space": "cosine"},
         )
+        self.max_batch_size = self.client.get_max_batch_size()
+        if tiered:
+            self._adopt_collection(name)
+        elif os.path.exists(os.path.join(tier_path, "CURRENT")):
+            self._adopt_collection(
+                name + TIERED_SUFFIX, QuantizedIndex.from_path(tier_path)
+            )
+            shutil.rmtree(tier_path)
+        if tiered and len(self.quantized_index) != self.count():
+            self._reconcile_tier()
+        self._open_lexical_index(settings.CHROMA_PERSIST_DIR, name)
 
-    def add_documents(self, documents: list[str], metadata: list[dict]):
-        """Store documents with automatic embedding generation"""
-        """Handle empty metadata gracefully"""
-        # Ensure metadata has same length as documents
-        processed_metadata = []
-        for meta in metadata:
-            # Add default values if metadata is empty
-            if not meta:
-                processed_metadata.append({"source": "unknown"})
+    def _adopt_collection(self, name: str, tier: QuantizedIndex | None = None):
+        """Moves the chunks of the collection kept for the other tier
+        setting into this one, then drops it. Their vectors are read from
+        that collection, or from ``tier`` if it held them. Each page is
+        deleted once copied, so an interrupted move resumes."""
+        try:
+            source = self.client.get_collection(name)
+        except NotFoundError:
+            return
+        include = ["documents", "metadatas"]
+        if tier is None:
+            include.append("embeddings")
+        while True:
+            page = source.get(include=include, limit=self.max_batch_size)
+            if not page["ids"]:
+                break
+            if tier is None:
+                embeddings = page["embeddings"]
             else:
-                processed_metadata.append(meta)
+                vectors = tier.vectors(page["ids"])
+                missing = [
+                    (chunk_id, document)
+                    for chunk_id, document in zip(page["ids"], page["documents"])
+                    if chunk_id not in vectors
+                ]
+                if missing:
+                    ids, documents = zip(*missing)
+                    vectors.update(zip(ids, self.embed(list(documents))))
+                embeddings = [vectors[i] for i in page["ids"]]
+            self._write(page["ids"], page["documents"], page["metadatas"], embeddings)
+            source.delete(ids=page["ids"])
+        self.client.delete_collection(name)
+
+    def _reconcile_tier(self):
+        """Brings the tier in line with the collection, re-embedding chunks
+        whose vectors are missing and dropping vectors of deleted chunks"""
+        stored = set()
+        batch = []
+        for chunk_id, document in self.iter_stored("documents"):
+            stored.add(chunk_id)
+            if chunk_id not in self.quantized_index:
+                batch.append((chunk_id, document))
+            if len(batch) >= self.max_batch_size:
+                self._reembed(batch)
+                batch = []
+        self._reembed(batch)
+        self.quantized_index.remove(
+            [i for i in self.quantized_index.ids() if i not in stored]
+        )
+
+    def _reembed(self, chunks: list[tuple[str, str]]):
+        if chunks:
+            ids, documents = zip(*chunks)
+            self.quantized_index.add(list(ids), self.embed(list(documents)))
 
-        ids = [str(uuid.uuid4()) for _ in documents]
-        self.collection.add(ids=ids, documents=documents, metadatas=processed_metadata)
+    def count(self) -> int:
+        return self.collection.count()
+
+    def stats(self) -> dict:
+        return {
+            **super().stats(),
+            "quantized_tier": (
+                self.quantized_index.stats() if self.quantized_index else None
+            ),
+        }
+
+    def source_chunks(self, source: str) -> dict[str, str]:
+        """Maps the ID of every chunk of a source to its content hash.
+
+        Uses a metadata filter, so only that source's chunks are read.
+        """
+        chunks = {}
+        offset = 0
+        while True:
+            page = self.collection.get(
+                where={"source": source},
+                include=["metadatas", "documents"],
+                limit=self.max_batch_size,
+                offset=offset,
+            )
+            if not page["ids"]:
+                return chunks
+            for chunk_id, meta, document in zip(
+                page["ids"], page["metadatas"], page["documents"]
+            ):
+                # Chunks stored without a hash are hashed as at ingest
+                chunks[chunk_id] = (meta or {}).get("content_hash") or content_hash(
+                    document or ""
+                )
+            offset += len(page["ids"])
+
+    def _store(
+        self, ids: list[str], documents: list[str], metadatas: list[dict]
+    ) -> list[str]:
+        embeddings = self.embed(documents)
+        with self._write_lock:
+            existing = self._existing_ids(ids)
+            keep = [i for i, chunk_id in enumerate(ids) if chunk_id not in existing]
+            if not keep:
+                return []
+            ids = [ids[i] for i in keep]
+            self._write(
+                ids,
+                [documents[i] for i in keep],
+                [metadatas[i] for i in keep],
+                [embeddings[i] for i in keep],
+            )
         return ids
 
-    def query(self, query_text: str, k: int = 4) -> list[dict]:
-        results = self.collection.query(query_texts=[query_text], n_results=k)
+    def _write(self, ids: list[str], documents: list[str], metadatas, embeddings):
+        if self.quantized_index is not None:
+            # Written first, so a crash leaves vectors without a chunk,
+            # which searches skip, rather than chunks without a vector
+            self.quantized_index.add(ids, embeddings)
+            embeddings = [PLACEHOLDER_EMBEDDING] * len(ids)
+        self.collection.upsert(
+            ids=ids, documents=documents, metadatas=metadatas, embeddings=embeddings
+        )
+
+    def _remove(self, ids: list[str]):
+        with self._write_lock:
+            self.collection.delete(ids=ids)
+            if self.quantized_index is not None:
+                self.quantized_index.remove(ids)
 
+    def _existing_ids(self, ids: list[str]) -> set[str]:
+        """IDs from the given list that are already stored"""
+        existing = set()
+        for start in range(0, len(ids), self.max_batch_size):
+            batch = ids[start : start + self.max_batch_size]
+            existing.update(self.collection.get(ids=batch, include=[])["ids"])
+        return existing
+
+    def _vector_candidates(
+        self,
+        query_embeddings: list[list[float]],
+        n: int,
+        with_embeddings: bool,
+        where: Optional[dict] = None,
+        where_document: Optional[dict] = None,
+    ) -> list[list[dict]]:
+        """Nearest chunks of each query; relevance is cosine similarity.
+
+        Filters are passed to Chroma, which pre-filters on its metadata
+        index before the vector search.
+        """
+        if self.quantized_index is not None:
+            allowed = None
+            if where or where_document:
+                allowed = self._filtered_ids(where, where_document)
+            return self._quantized_candidates(
+                query_embeddings, n, with_embeddings, allowed
+            )
+        include = ["documents", "metadatas", "distances"]
+        if with_embeddings:
+            include.append("embeddings")
+        results = self.collection.query(
+            query_embeddings=query_embeddings,
+            n_results=n,
+            where=where,
+            where_document=where_document,
+            include=include,
+        )
+        per_query = []
+        for i, ids in enumerate(results["ids"]):
+            embeddings = (
+                results["embeddings"][i] if with_embeddings else [None] * len(ids)
+            )
+            per_query.append(
+                [
+                    {
+                        "id": chunk_id,
+                        "content": doc,
+                        "metadata": meta,
+                        "distance": distance,
+                        "embedding": embedding,
+                        "relevance": 1 - distance,
+                    }
+                    for chunk_id, doc, meta, distance, embedding in zip(
+                        ids,
+                        results["documents"][i],
+                        results["metadatas"][i],
+                        results["distances"][i],
+                        embeddings,
+                    )
+                ]
+            )
+        return per_query
+
+    def _quantized_candidates(
+        self,
+        query_embeddings: list[list[float]],
+        n: int,
+        with_embeddings: bool,
+        allowed: Optional[set[str]] = None,
+    ) -> list[list[dict]]:
+        """Candidates from the compressed tier, rescored at full precision"""
+        per_query = self.quantized_index.search(query_embeddings, n, allowed)
+        found = self._get_by_ids(
+            list(dict.fromkeys(i for ranked in per_query for i, _ in ranked)),
+            with_embeddings,
+        )
         return [
-            {"content": doc, "metadata": meta}
-            for doc, meta in zip(results["documents"][0], results["metadatas"][0])
+            [
+                {**found[chunk_id], "distance": 1 - similarity, "relevance": similarity}
+                for chunk_id, similarity in ranked
+                if chunk_id in found
+            ]
+            for ranked in per_query
         ]
 
-    def get_all_metadata(self) -> list[dict]:
-        """Retrieve all metadatas contained in the vectorstore"""
-        return self.collection.get(include=["metadatas"])["metadatas"]
+    def _filtered_ids(
+        self, where: Optional[dict], where_document: Optional[dict]
+    ) -> set[str]:
+        """IDs of the chunks matching the filters, read one page at a time"""
+        ids = set()
+        offset = 0
+        while True:
+            page = self.collection.get(
+                where=where,
+                where_document=where_document,
+                include=[],
+                limit=self.max_batch_size,
+                offset=offset,
+            )
+            if not page["ids"]:
+                return ids
+            ids.update(page["ids"])
+            offset += len(page["ids"])
+
+    def _get_by_ids(self, ids: list[str], with_embeddings: bool = False) -> dict:
+        if not ids:
+            return {}
+        include = ["documents", "metadatas"]
+        if with_embeddings and self.quantized_index is None:
+            include.append("embeddings")
+        results = self.collection.get(ids=ids, include=include)
+        if not with_embeddings:
+            embeddings = [None] * len(results["ids"])
+        elif self.quantized_index is not None:
+            vectors = self.quantized_index.vectors(results["ids"])
+            embeddings = [vectors.get(i) for i in results["ids"]]
+        else:
+            embeddings = results["embeddings"]
+        return {
+            chunk_id: {
+                "id": chunk_id,
+                "content": doc,
+                "metadata": meta,
+                "distance": None,
+                "embedding": embedding,
+            }
+            for chunk_id, doc, meta, embedding in zip(
+                results["ids"], results["documents"], results["metadatas"], embeddings
+            )
+        }
+
+    def iter_stored(self, field: str = "metadatas"):
+        """Yields (id, document or metadata) for every stored chunk, one page
+        at a time"""
+        offset = 0
+        while True:
+            page = self.collection.get(
+                include=[field], limit=self.max_batch_size, offset=offset
+            )
+            if not page["ids"]:
+                return
+            yield from zip(page["ids"], page[field])
+            offset += len(page["ids"])
 
 
 class OllamaEmbeddingFunction(EmbeddingFunction):
-    def __init__(self, host: str, model: str):
-        self.host = host
-        self.model = model
+    """Hands Chroma the store's ``OllamaEmbedder``"""
+
+    def __init__(self, embedder: OllamaEmbedder):
+        self.embedder = embedder
 
     def __call__(self, texts: List[str]) -> List[List[float]]:
-        embeddings = []
-        for text in texts:
-            response = requests.post(
-                f"{self.host}/api/embeddings",
-                json={"model": self.model, "prompt": text},
-            )
-            response.raise_for_status()
-            embeddings.append(response.json()["embedding"])
-        return embeddings
+        return self.embedder(texts)
+
+    def embed_query(self, texts: List[str]) -> List[List[float]]:
+        return self.embedder.embed_query(texts)
@@ -0,0 +1,227 @@
+# Persistent embedding cache shared by the API and batch ingestion
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from functools import lru_cache
+from typing import List, Optional
+from ragoo.core.config import settings
+
+
+def content_hash(text: str) -> str:
+    """Returns the sha256 hex digest of a text"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """Two-tier embedding cache keyed by (embedding model, sha256 of text).
+
+    Recently used vectors are kept in an in-memory LRU of ``memory_size``
+    entries in front of a SQLite file. The file is bounded to
+    ``max_entries`` vectors, evicting the least recently used ones.
+
+    Disk hits only note their use time in memory; the notes are written
+    ``touch_batch`` at a time, or with the next insert, so reads do not
+    turn into a write each.
+
+    The two tiers have their own locks, so ``get_memory`` never waits on
+    SQLite and is safe to call from an event loop.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_entries: int = 500_000,
+        memory_size: int = 10_000,
+        touch_batch: int = 1000,
+    ):
+        self.path = path
+        self.max_entries = max_entries
+        self.memory_size = memory_size
+        self.touch_batch = touch_batch
+        self._memory: OrderedDict[tuple[str, str], List[float]] = OrderedDict()
+        self._touched: dict[tuple[str, str], float] = {}
+        self._memory_lock = threading.Lock()
+        self._lock = threading.Lock()  # the SQLite connection
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            ) WITHOUT ROWID""")
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)"
+        )
+        self._conn.commit()
+        self._disk_entries = self._conn.execute(
+            "SELECT COUNT(*) FROM embeddings"
+        ).fetchone()[0]
+
+    def get_memory(self, model: str, texts: List[str]) -> List[Optional[List[float]]]:
+        """Returns the vector of each text held in memory, or None; the disk
+        tier is not read"""
+        found, _ = self._get_memory([(model, content_hash(text)) for text in texts])
+        return found
+
+    def get_many(self, model: str, texts: List[str]) -> List[Optional[List[float]]]:
+        """Returns the cached vector for each text, or None on a miss"""
+        keys = [(model, content_hash(text)) for text in texts]
+        found, cold = self._get_memory(keys)
+        if not cold:
+            return found
+
+        with self._lock:
+            rows = {}
+            hashes = list({keys[i][1] for i in cold})
+            # Stay well below SQLite's bound-parameter limit
+            for start in range(0, len(hashes), 500):
+                part = hashes[start : start + 500]
+                placeholders = ",".join("?" * len(part))
+                for text_hash, blob in self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings "
+                    f"WHERE model = ? AND text_hash IN ({placeholders})",
+                    [model, *part],
+                ):
+                    rows[text_hash] = array("f", blob).tolist()
+
+            now = time.time()
+            for i in cold:
+                vector = rows.get(keys[i][1])
+                if vector is None:
+                    self.misses += 1
+                    continue
+                found[i] = vector
+                self.disk_hits += 1
+                self._touched[keys[i]] = now
+
+            if len(self._touched) >= self.touch_batch:
+                self._write_touches()
+                self._conn.commit()
+
+        with self._memory_lock:
+            for i in cold:
+                if found[i] is not None:
+                    self._remember(keys[i], found[i])
+        return found
+
+    def _get_memory(self, keys: list[tuple[str, str]]):
+        """Memory-tier lookup; returns the found vectors and the indices of
+        the keys it missed"""
+        found: List[Optional[List[float]]] = [None] * len(keys)
+        cold = []
+        with self._memory_lock:
+            for i, key in enumerate(keys):
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    found[i] = vector
+                    self.memory_hits += 1
+                else:
+                    cold.append(i)
+        return found, cold
+
+    def put_many(self, model: str, texts: List[str], embeddings: List[List[float]]):
+        """Stores freshly computed vectors in both tiers"""
+        now = time.time()
+        rows = []
+        with self._memory_lock:
+            for text, vector in zip(texts, embeddings):
+                key = (model, content_hash(text))
+                self._remember(key, vector)
+                rows.append((model, key[1], array("f", vector).tobytes(), now))
+
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (model, text_hash, vector, last_used) "
+                "VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            self._disk_entries += self._conn.total_changes - before
+            # Eviction goes by last_used, so it must see every recent hit
+            self._write_touches()
+            self._evict()
+            self._conn.commit()
+
+    def _remember(self, key: tuple[str, str], vector: List[float]):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def _write_touches(self):
+        if not self._touched:
+            return
+        self._conn.executemany(
+            "UPDATE embeddings SET last_used = ? WHERE model = ? AND text_hash = ?",
+            [
+                (used, model, text_hash)
+                for (model, text_hash), used in self._touched.items()
+            ],
+        )
+        self._touched.clear()
+
+    def _evict(self):
+        if self._disk_entries <= self.max_entries:
+            return
+        # Trim an extra 10% so a full cache does not evict on every insert
+        excess = self._disk_entries - int(self.max_entries * 0.9)
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE (model, text_hash) IN ("
+            "SELECT model, text_hash FROM embeddings ORDER BY last_used LIMIT ?)",
+            (excess,),
+        )
+        self.evictions += excess
+        self._disk_entries -= excess
+
+    def stats(self) -> dict:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (
+                round((self.memory_hits + self.disk_hits) / lookups, 4)
+                if lookups
+                else 0.0
+            ),
+            "memory_entries": len(self._memory),
+            "disk_entries": self._disk_entries,
+            "evictions": self.evictions,
+        }
+
+    def close(self):
+        with self._lock:
+            self._write_touches()
+            self._conn.commit()
+            self._conn.close()
+
+
+@lru_cache(maxsize=None)
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """Returns the process-wide embedding cache, or None when disabled"""
+    if not settings.EMBEDDING_CACHE_ENABLED:
+        return None
+    path = settings.EMBEDDING_CACHE_PATH or os.path.join(
+        settings.CHROMA_PERSIST_DIR, "embedding_cache.sqlite3"
+    )
+    return EmbeddingCache(
+        path,
+        max_entries=settings.EMBEDDING_CACHE_MAX_ENTRIES,
+        memory_size=settings.EMBEDDING_CACHE_MEMORY_SIZE,
+    )
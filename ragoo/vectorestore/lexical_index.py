@@ -0,0 +1,269 @@
+# BM25 inverted index kept alongside the vector collection
+import json
+import math
+import os
+import pickle
+import re
+import threading
+from array import array
+from collections import Counter
+from typing import Iterable, Optional
+import numpy as np
+
+# Runs of word characters, keeping joined codes such as "AB-1234/X" together
+TERM_PATTERN = re.compile(r"\w+(?:[-./:]\w+)*")
+_SEPARATORS = re.compile(r"[-./:]")
+
+
+def tokenize(text: str) -> list[str]:
+    """Lowercased terms of a text.
+
+    Joined codes are indexed whole and as their parts, so "E-1043" matches
+    both the exact code and a query for "1043".
+    """
+    terms = []
+    for match in TERM_PATTERN.finditer(text.lower()):
+        term = match.group()
+        terms.append(term)
+        if _SEPARATORS.search(term):
+            terms.extend(part for part in _SEPARATORS.split(term) if part)
+    return terms
+
+
+class LexicalIndex:
+    """In-memory BM25 index over chunk IDs, persisted as snapshot plus journal.
+
+    Posting lists are pairs of ``array`` objects (document numbers and term
+    frequencies), so each posting costs eight bytes. Additions and removals
+    are appended to a journal file and folded into the snapshot every
+    ``compact_every`` entries, so a write never rewrites the whole index.
+    Removed documents are tombstoned until that compaction drops them.
+    """
+
+    SNAPSHOT_VERSION = 1
+
+    def __init__(
+        self, path: str, k1: float = 1.2, b: float = 0.75, compact_every: int = 10_000
+    ):
+        self.path = path
+        self.journal_path = path + ".journal"
+        self.k1 = k1
+        self.b = b
+        self.compact_every = compact_every
+        self._lock = threading.Lock()
+        self._reset()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def _reset(self):
+        self.doc_ids: list[str | None] = []  # None marks a removed document
+        self._doc_numbers: dict[str, int] = {}
+        self._doc_lengths = array("I")
+        self._total_length = 0
+        self._postings: dict[str, tuple[array, array]] = {}
+        self._journal_entries = 0
+
+    def __len__(self) -> int:
+        return len(self._doc_numbers)
+
+    def __contains__(self, chunk_id: str) -> bool:
+        return chunk_id in self._doc_numbers
+
+    def add(self, ids: Iterable[str], documents: Iterable[str]):
+        """Indexes documents under their chunk IDs; known IDs are ignored"""
+        entries = []
+        with self._lock:
+            for chunk_id, document in zip(ids, documents):
+                if chunk_id in self._doc_numbers:
+                    continue
+                frequencies = Counter(tokenize(document))
+                self._insert(chunk_id, frequencies)
+                entries.append([chunk_id, frequencies])
+            if not entries:
+                return
+
+            self._append_journal(entries)
+
+    def remove(self, ids: Iterable[str]):
+        """Removes documents by chunk ID; unknown IDs are ignored"""
+        entries = []
+        with self._lock:
+            for chunk_id in ids:
+                number = self._doc_numbers.pop(chunk_id, None)
+                if number is None:
+                    continue
+                self._delete(number)
+                entries.append([chunk_id, None])
+            if entries:
+                self._append_journal(entries)
+
+    def _append_journal(self, entries: list):
+        with open(self.journal_path, "a", encoding="utf-8") as f:
+            for entry in entries:
+                f.write(json.dumps(entry) + "\n")
+        self._journal_entries += len(entries)
+        if self._journal_entries >= self.compact_every:
+            self._compact()
+
+    def _delete(self, number: int):
+        self.doc_ids[number] = None
+        self._total_length -= self._doc_lengths[number]
+        # A zero length marks the tombstone for search
+        self._doc_lengths[number] = 0
+
+    def _insert(self, chunk_id: str, frequencies: dict[str, int]):
+        number = len(self.doc_ids)
+        self.doc_ids.append(chunk_id)
+        self._doc_numbers[chunk_id] = number
+        length = sum(frequencies.values())
+        self._doc_lengths.append(length)
+        self._total_length += length
+        for term, count in frequencies.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = (array("I"), array("I"))
+            postings[0].append(number)
+            postings[1].append(count)
+
+    def search(
+        self, query: str, k: int = 4, ids: Optional[Iterable[str]] = None
+    ) -> list[tuple[str, float]]:
+        """Returns up to k (chunk_id, score) pairs, best first, optionally
+        among the given chunk IDs only"""
+        terms = set(tokenize(query))
+        with self._lock:
+            n_docs = len(self._doc_numbers)
+            if not n_docs:
+                return []
+            lengths = np.frombuffer(self._doc_lengths, dtype=np.uint32)
+            # Per-document BM25 length normalisation, shared by every term;
+            # documents without any token must not zero the average
+            avg_length = max(self._total_length / n_docs, 1)
+            norm = self.k1 * (1 - self.b + self.b * lengths / avg_length)
+            scores = np.zeros(len(self.doc_ids), dtype=np.float32)
+            for term in terms:
+                postings = self._postings.get(term)
+                if postings is None:
+                    continue
+                docs = np.frombuffer(postings[0], dtype=np.uint32)
+                tfs = np.frombuffer(postings[1], dtype=np.uint32).astype(np.float32)
+                idf = math.log(1 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+                scores[docs] += idf * tfs * (self.k1 + 1) / (tfs + norm[docs])
+
+            scores[lengths == 0] = 0  # removed documents
+            if ids is not None:
+                allowed = np.zeros(len(scores), dtype=bool)
+                allowed[
+                    [self._doc_numbers[i] for i in ids if i in self._doc_numbers]
+                ] = True
+                scores[~allowed] = 0
+            matched = np.flatnonzero(scores)
+            if len(matched) > k:
+                matched = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+            ranked = matched[np.argsort(-scores[matched], kind="stable")]
+            return [(self.doc_ids[i], float(scores[i])) for i in ranked]
+
+    def rebuild(self, documents: Iterable[tuple[str, str]]):
+        """Replaces the whole index with (chunk_id, document) pairs"""
+        with self._lock:
+            self._reset()
+            for chunk_id, document in documents:
+                if chunk_id not in self._doc_numbers:
+                    self._insert(chunk_id, Counter(tokenize(document)))
+            self._compact()
+
+    def flush(self):
+        """Folds the journal into the snapshot"""
+        with self._lock:
+            if self._journal_entries:
+                self._compact()
+
+    def _compact(self):
+        if len(self._doc_numbers) < len(self.doc_ids):
+            self._purge()
+        state = {
+            "version": self.SNAPSHOT_VERSION,
+            "doc_ids": self.doc_ids,
+            "doc_lengths": self._doc_lengths,
+            "postings": self._postings,
+        }
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.path)
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+        self._journal_entries = 0
+
+    def _purge(self):
+        """Drops tombstoned documents, renumbering the survivors"""
+        lengths = np.frombuffer(self._doc_lengths, dtype=np.uint32)
+        alive = np.array(
+            [chunk_id is not None for chunk_id in self.doc_ids], dtype=bool
+        )
+        renumber = np.cumsum(alive, dtype=np.int64) - 1
+        postings = {}
+        for term, (docs, tfs) in self._postings.items():
+            docs = np.frombuffer(docs, dtype=np.uint32)
+            keep = alive[docs]
+            if keep.any():
+                postings[term] = (
+                    array("I", renumber[docs[keep]].astype(np.uint32).tobytes()),
+                    array("I", np.frombuffer(tfs, dtype=np.uint32)[keep].tobytes()),
+                )
+        doc_lengths = array("I", lengths[alive].tobytes())
+        self.doc_ids = [chunk_id for chunk_id in self.doc_ids if chunk_id is not None]
+        self._doc_numbers = {chunk_id: i for i, chunk_id in enumerate(self.doc_ids)}
+        self._doc_lengths = doc_lengths
+        self._postings = postings
+
+    def _load(self):
+        if os.path.exists(self.path):
+            with open(self.path, "rb") as f:
+                state = pickle.load(f)
+            if state.get("version") == self.SNAPSHOT_VERSION:
+                self.doc_ids = state["doc_ids"]
+                self._doc_numbers = {
+                    chunk_id: i
+                    for i, chunk_id in enumerate(self.doc_ids)
+                    if chunk_id is not None
+                }
+                self._doc_lengths = state["doc_lengths"]
+                self._total_length = sum(self._doc_lengths)
+                self._postings = state["postings"]
+
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        chunk_id, frequencies = json.loads(line)
+                    except ValueError:
+                        break  # torn final write
+                    if frequencies is None:
+                        number = self._doc_numbers.pop(chunk_id, None)
+                        if number is not None:
+                            self._delete(number)
+                    elif chunk_id not in self._doc_numbers:
+                        self._insert(chunk_id, frequencies)
+                    self._journal_entries += 1
+
+    def stats(self) -> dict:
+        return {
+            "documents": len(self._doc_numbers),
+            "tombstones": len(self.doc_ids) - len(self._doc_numbers),
+            "terms": len(self._postings),
+            "journal_entries": self._journal_entries,
+        }
+
+
+def reciprocal_rank_fusion(
+    rankings: list[list[str]], k: int = 60
+) -> list[tuple[str, float]]:
+    """Merges ranked ID lists by summed 1 / (k + rank), best first"""
+    scores: dict[str, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
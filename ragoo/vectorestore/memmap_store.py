@@ -0,0 +1,882 @@
+# Embedded vector store: a memory-mapped embedding matrix searched with NumPy
+import json
+import math
+import operator
+import os
+import pickle
+import threading
+from typing import Iterator
+
+try:
+    import fcntl
+except ImportError:  # Windows: the directory is not locked
+    fcntl = None
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+from ragoo.core.config import settings
+from ragoo.services.ollama_service import OllamaEmbedder
+from ragoo.vectorestore.base import VectorStore
+from ragoo.vectorestore.embedding_cache import content_hash, get_embedding_cache
+
+DTYPES = {"float16": np.float16, "int8": np.int8}
+INDEX_TYPES = ("exact", "ivf")
+
+# Row-aligned columns, grown together with the vector matrix
+COLUMNS = {
+    "alive": np.bool_,
+    "scale": np.float32,  # int8 dequantisation factor
+    "ivf_list": np.int32,
+    "doc_offset": np.int64,
+    "doc_length": np.int32,
+    "source": np.int32,  # code into source_names, -1 when absent
+    "page": np.int32,  # -1 when absent
+}
+SEARCH_BLOCK_ROWS = 32_768
+WHERE_OPERATORS = {
+    "$eq": operator.eq,
+    "$ne": operator.ne,
+    "$gt": operator.gt,
+    "$gte": operator.ge,
+    "$lt": operator.lt,
+    "$lte": operator.le,
+    "$in": lambda values, options: np.isin(values, options),
+    "$nin": lambda values, options: ~np.isin(values, options),
+}
+
+
+class MemmapVectorStore(VectorStore):
+    """In-process vector store for corpora of up to a few million chunks.
+
+    Unit-normalised embeddings live in a memory-mapped ``.npy`` matrix,
+    stored as float16 or as int8 with a per-row scale. Search is exact
+    (blocked matrix products) or IVF (k-means lists, ``MEMMAP_IVF_PROBES``
+    of them scanned per query). Documents are appended to a blob file and
+    read back only for results. Metadata is kept column by column: sources
+    are dictionary-encoded and pages are an integer column, so filtering
+    on either is a vectorised comparison.
+
+    Like ``LexicalIndex``, writes are appended to a journal that is folded
+    into a pickled snapshot every ``compact_every`` entries; deleted rows
+    are tombstoned until then. Files that compaction rewrites carry a
+    generation number, so a crash mid-way leaves the previous state intact.
+
+    The store is single-process: its state is held in memory and written
+    back by the owning process only. Opening takes an exclusive lock on the
+    directory, so a second process (another server worker, say) fails
+    straight away instead of corrupting it. Run one worker, or use the
+    Chroma backend.
+    """
+
+    SNAPSHOT_VERSION = 1
+
+    def __init__(
+        self,
+        directory: str | None = None,
+        name: str | None = None,
+        dtype: str | None = None,
+        index: str | None = None,
+        compact_every: int = 10_000,
+    ):
+        super().__init__()
+        name = name or settings.CHROMA_COLLECTION_NAME
+        parent = directory or settings.MEMMAP_PERSIST_DIR or settings.CHROMA_PERSIST_DIR
+        self.path = os.path.join(parent, f"{name}.vec")
+        self.dtype = dtype or settings.MEMMAP_DTYPE
+        if self.dtype not in DTYPES:
+            raise ValueError(f"Unknown memmap dtype: {self.dtype}")
+        self.index = index or settings.MEMMAP_INDEX
+        if self.index not in INDEX_TYPES:
+            raise ValueError(f"Unknown memmap index: {self.index}")
+        self.compact_every = compact_every
+        self.embedding_function = OllamaEmbedder(
+            host=settings.OLLAMA_HOST,
+            model=settings.EMBEDDING_MODEL,
+            cache=get_embedding_cache(),
+        )
+        self._lock = threading.RLock()
+        os.makedirs(self.path, exist_ok=True)
+        self._lock_file = _lock_directory(self.path)
+        self._reset()
+        self._load()
+        self._open_lexical_index(parent, name)
+
+    def _reset(self):
+        self.generation = 0
+        self.dim: int | None = None
+        self._vectors: np.memmap | None = None
+        self._columns = {key: np.zeros(0, dtype=t) for key, t in COLUMNS.items()}
+        self._ids: list[str | None] = []  # None marks a deleted row
+        self._rows: dict[str, int] = {}
+        self._hashes: list[str | None] = []
+        self._extra: dict[str, dict[int, object]] = {}  # sparse metadata keys
+        self.source_names: list[str] = []
+        self._source_codes: dict[str, int] = {}
+        self._centroids: np.ndarray | None = None
+        self._lists: list[list[int]] = []
+        self._trained_rows = 0
+        self._journal_entries = 0
+        self._doc_size = 0
+        self._documents = None
+
+    # Files of the current generation
+
+    def _file(self, stem: str, suffix: str, generation: int | None = None) -> str:
+        generation = self.generation if generation is None else generation
+        return os.path.join(self.path, f"{stem}.{generation}{suffix}")
+
+    @property
+    def _snapshot_path(self) -> str:
+        return os.path.join(self.path, "snapshot.pkl")
+
+    def count(self) -> int:
+        return len(self._rows)
+
+    # Writes
+
+    def _existing_ids(self, ids: list[str]) -> set[str]:
+        return {chunk_id for chunk_id in ids if chunk_id in self._rows}
+
+    def _store(
+        self, ids: list[str], documents: list[str], metadatas: list[dict]
+    ) -> list[str]:
+        vectors = _normalize(np.asarray(self.embed(documents), dtype=np.float32))
+        with self._lock:
+            if self.dim is None:
+                self._create(vectors.shape[1])
+            if vectors.shape[1] != self.dim:
+                raise ValueError(
+                    f"Embedding dimension {vectors.shape[1]} does not match "
+                    f"the store's {self.dim}"
+                )
+            # A concurrent writer may have stored some of these since the
+            # unlocked _existing_ids check; appending them again would leave
+            # dead rows behind
+            keep = [i for i, chunk_id in enumerate(ids) if chunk_id not in self._rows]
+            if len(keep) < len(ids):
+                ids = [ids[i] for i in keep]
+                documents = [documents[i] for i in keep]
+                metadatas = [metadatas[i] for i in keep]
+                vectors = vectors[keep]
+            if not ids:
+                return []
+            start = len(self._ids)
+            self._ensure_capacity(start + len(ids))
+            stored, scales = _quantize(vectors, self.dtype)
+            self._vectors[start : start + len(ids)] = stored
+            self._vectors.flush()
+
+            entries = []
+            for i, (chunk_id, document, metadata) in enumerate(
+                zip(ids, documents, metadatas)
+            ):
+                encoded = document.encode("utf-8")
+                offset = self._doc_size
+                self._documents.write(encoded)
+                self._doc_size += len(encoded)
+                entry = {
+                    "row": start + i,
+                    "id": chunk_id,
+                    "offset": offset,
+                    "length": len(encoded),
+                    "scale": float(scales[i]),
+                    "metadata": metadata,
+                }
+                self._append_row(entry, vectors[i])
+                entries.append(entry)
+            self._documents.flush()
+            self._append_journal(entries)
+
+            if self._needs_training():
+                self._train()
+        return ids
+
+    def _remove(self, ids: list[str]):
+        with self._lock:
+            entries = []
+            for chunk_id in ids:
+                row = self._rows.pop(chunk_id, None)
+                if row is None:
+                    continue
+                self._delete_row(row)
+                entries.append({"delete": chunk_id})
+            if entries:
+                self._append_journal(entries)
+
+    def _create(self, dim: int):
+        self.dim = dim
+        self._vectors = open_memmap(
+            self._file("vectors", ".npy"),
+            mode="w+",
+            dtype=DTYPES[self.dtype],
+            shape=(1024, dim),
+        )
+        self._grow_columns(1024)
+        self._documents = open(self._file("documents", ".bin"), "ab")
+
+    def _ensure_capacity(self, rows: int):
+        capacity = len(self._vectors)
+        if rows <= capacity:
+            return
+        while capacity < rows:
+            capacity *= 2
+        # Copy into a larger file and swap it in; readers keep the old map
+        path = self._file("vectors", ".npy")
+        grown = open_memmap(
+            path + ".tmp",
+            mode="w+",
+            dtype=self._vectors.dtype,
+            shape=(capacity, self.dim),
+        )
+        used = len(self._ids)
+        grown[:used] = self._vectors[:used]
+        grown.flush()
+        del grown
+        os.replace(path + ".tmp", path)
+        self._vectors = open_memmap(path, mode="r+")
+        self._grow_columns(capacity)
+
+    def _grow_columns(self, capacity: int):
+        for key, column in self._columns.items():
+            grown = np.zeros(capacity, dtype=column.dtype)
+            used = min(len(column), capacity)
+            grown[:used] = column[:used]
+            self._columns[key] = grown
+
+    def _append_row(self, entry: dict, vector: np.ndarray | None = None):
+        row = entry["row"]
+        chunk_id = entry["id"]
+        self._ids.append(chunk_id)
+        self._rows[chunk_id] = row
+        columns = self._columns
+        columns["alive"][row] = True
+        columns["scale"][row] = entry["scale"]
+        columns["doc_offset"][row] = entry["offset"]
+        columns["doc_length"][row] = entry["length"]
+
+        metadata = dict(entry["metadata"] or {})
+        source = metadata.pop("source", None)
+        columns["source"][row] = -1 if source is None else self._source_code(source)
+        page = metadata.get("page")
+        if isinstance(page, int) and not isinstance(page, bool):
+            columns["page"][row] = page
+            del metadata["page"]
+        else:
+            columns["page"][row] = -1
+        self._hashes.append(metadata.pop("content_hash", None))
+        for key, value in metadata.items():
+            self._extra.setdefault(key, {})[row] = value
+
+        columns["ivf_list"][row] = -1
+        if self._centroids is not None:
+            if vector is None:
+                vector = self._dequantize(np.array([row]))[0]
+            self._assign(row, vector)
+
+    def _source_code(self, source: str) -> int:
+        code = self._source_codes.get(source)
+        if code is None:
+            code = self._source_codes[source] = len(self.source_names)
+            self.source_names.append(source)
+        return code
+
+    def _delete_row(self, row: int):
+        self._ids[row] = None
+        self._columns["alive"][row] = False
+        self._hashes[row] = None
+        for values in self._extra.values():
+            values.pop(row, None)
+
+    def _append_journal(self, entries: list[dict]):
+        with open(self._file("journal", ".jsonl"), "a", encoding="utf-8") as f:
+            for entry in entries:
+                f.write(json.dumps(entry) + "\n")
+        self._journal_entries += len(entries)
+        if self._journal_entries >= self.compact_every:
+            self._compact()
+
+    # IVF
+
+    def _needs_training(self) -> bool:
+        if self.index != "ivf" or self.count() < settings.MEMMAP_IVF_MIN_TRAIN:
+            return False
+        # Retrain whenever the corpus has doubled since the last training
+        return self._centroids is None or self.count() >= 2 * self._trained_rows
+
+    def _train(self, iterations: int = 10, seed: int = 0):
+        """Spherical k-means over a sample of the rows, then list assignment"""
+        alive = np.flatnonzero(self._columns["alive"][: len(self._ids)])
+        n_lists = settings.MEMMAP_IVF_LISTS or max(1, int(math.sqrt(len(alive))))
+        rng = np.random.default_rng(seed)
+        sample = np.sort(
+            rng.choice(alive, size=min(len(alive), n_lists * 64), replace=False)
+        )
+        points = self._dequantize(sample)
+        n_lists = min(n_lists, len(points))
+        centroids = points[rng.choice(len(points), size=n_lists, replace=False)]
+        for _ in range(iterations):
+            nearest = np.argmax(points @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, nearest, points)
+            empty = ~np.bincount(nearest, minlength=n_lists).astype(bool)
+            sums[empty] = centroids[empty]
+            centroids = _normalize(sums)
+
+        self._centroids = centroids
+        self._lists = [[] for _ in range(n_lists)]
+        self._columns["ivf_list"][: len(self._ids)] = -1
+        for start in range(0, len(alive), SEARCH_BLOCK_ROWS):
+            rows = alive[start : start + SEARCH_BLOCK_ROWS]
+            nearest = np.argmax(self._dequantize(rows) @ centroids.T, axis=1)
+            self._columns["ivf_list"][rows] = nearest
+            for row, list_id in zip(rows.tolist(), nearest.tolist()):
+                self._lists[list_id].append(row)
+        self._trained_rows = len(alive)
+        self._compact()
+
+    def _assign(self, row: int, vector: np.ndarray):
+        list_id = int(np.argmax(self._centroids @ vector))
+        self._columns["ivf_list"][row] = list_id
+        self._lists[list_id].append(row)
+
+    # Search
+
+    def _vector_candidates(
+        self,
+        query_embeddings: list[list[float]],
+        n: int,
+        with_embeddings: bool,
+        where: dict | None = None,
+        where_document: dict | None = None,
+    ) -> list[list[dict]]:
+        """Nearest chunks of each query; relevance is cosine similarity.
+
+        A filtered search scans only the matching rows, exactly, so its
+        cost follows the size of the filtered subset.
+        """
+        queries = _normalize(np.asarray(query_embeddings, dtype=np.float32))
+        # Compaction renumbers rows, so a search holds the lock throughout
+        with self._lock:
+            if not self._rows:
+                return [[] for _ in queries]
+            if queries.shape[1] != self.dim:
+                raise ValueError(
+                    f"Query dimension {queries.shape[1]} does not match "
+                    f"the store's {self.dim}"
+                )
+            if where or where_document:
+                rows = self._filter_rows(where, where_document)
+                ranked = self._exact_search(queries, n, rows)
+            elif self._centroids is None:
+                ranked = self._exact_search(queries, n)
+            else:
+                ranked = [
+                    self._rescore(query[None, :], self._probe(query), n)[0]
+                    for query in queries
+                ]
+            return [
+                self._candidates(rows, scores, with_embeddings)
+                for rows, scores in ranked
+            ]
+
+    def _probe(self, query: np.ndarray) -> np.ndarray:
+        """Rows of the IVF lists closest to a query"""
+        probes = min(settings.MEMMAP_IVF_PROBES, len(self._lists))
+        nearest = np.argpartition(-(self._centroids @ query), probes - 1)[:probes]
+        return np.array(
+            [row for list_id in nearest for row in self._lists[list_id]],
+            dtype=np.int64,
+        )
+
+    def _exact_search(self, queries: np.ndarray, n: int, rows=None):
+        """Blocked scan of every row, or of the given sorted rows, keeping
+        each query's running top n"""
+        best_rows = np.zeros((len(queries), 0), dtype=np.int64)
+        best_scores = np.zeros((len(queries), 0), dtype=np.float32)
+        total = len(self._ids) if rows is None else len(rows)
+        for start in range(0, total, SEARCH_BLOCK_ROWS):
+            stop = min(start + SEARCH_BLOCK_ROWS, total)
+            if rows is None:
+                block, numbers = slice(start, stop), np.arange(start, stop)
+            else:
+                block = numbers = rows[start:stop]
+            scores = self._scores(
+                queries,
+                self._vectors[block],
+                self._columns["scale"][block],
+                self._columns["alive"][block],
+            )
+            block_rows = np.broadcast_to(numbers, scores.shape).astype(np.int64)
+            best_rows = np.concatenate([best_rows, block_rows], axis=1)
+            best_scores = np.concatenate([best_scores, scores], axis=1)
+            best_rows, best_scores = _top_n(best_rows, best_scores, n)
+        return list(zip(best_rows, best_scores))
+
+    def _rescore(self, queries: np.ndarray, rows: np.ndarray, n: int):
+        """Scores the given rows against the queries and keeps the top n"""
+        if not len(rows):
+            empty = np.zeros(0)
+            return [(empty.astype(np.int64), empty.astype(np.float32))]
+        rows = np.sort(rows)
+        scores = self._scores(
+            queries,
+            self._vectors[rows],
+            self._columns["scale"][rows],
+            self._columns["alive"][rows],
+        )
+        top_rows, top_scores = _top_n(np.broadcast_to(rows, scores.shape), scores, n)
+        return list(zip(top_rows, top_scores))
+
+    def _scores(self, queries, block, scales, alive) -> np.ndarray:
+        scores = queries @ block.astype(np.float32).T
+        if self.dtype == "int8":
+            scores *= scales
+        scores[:, ~alive] = -np.inf
+        return scores
+
+    def _candidates(self, rows, scores, with_embeddings: bool) -> list[dict]:
+        keep = np.isfinite(scores)
+        rows, scores = rows[keep], scores[keep]
+        if not len(rows):
+            return []
+        embeddings = (
+            self._dequantize(rows).tolist() if with_embeddings else [None] * len(rows)
+        )
+        documents = self._read_documents(rows)
+        return [
+            {
+                "id": self._ids[row],
+                "content": document,
+                "metadata": self._metadata(row),
+                "distance": 1 - float(score),
+                "embedding": embedding,
+                "relevance": float(score),
+            }
+            for row, score, document, embedding in zip(
+                rows.tolist(), scores, documents, embeddings
+            )
+        ]
+
+    # Filters
+
+    def _filtered_ids(self, where: dict | None, where_document: dict | None):
+        with self._lock:
+            return {self._ids[row] for row in self._filter_rows(where, where_document)}
+
+    def _filter_rows(self, where: dict | None, where_document: dict | None):
+        """Sorted live rows matching a Chroma-style metadata and document
+        filter. Source and page conditions are vectorised comparisons on
+        their columns; other keys only visit the rows that have them."""
+        rows = len(self._ids)
+        mask = self._columns["alive"][:rows].copy()
+        if where:
+            mask &= self._where_mask(where, rows)
+        matches = np.flatnonzero(mask)
+        if where_document and len(matches):
+            documents = self._read_documents(matches)
+            matches = matches[
+                [_document_matches(where_document, text) for text in documents]
+            ]
+        return matches
+
+    def _where_mask(self, where: dict, rows: int) -> np.ndarray:
+        mask = np.ones(rows, dtype=bool)
+        for key, condition in where.items():
+            if key == "$and":
+                for clause in condition:
+                    mask &= self._where_mask(clause, rows)
+            elif key == "$or":
+                mask &= np.logical_or.reduce(
+                    [self._where_mask(clause, rows) for clause in condition]
+                )
+            else:
+                mask &= self._field_mask(key, condition, rows)
+        return mask
+
+    def _field_mask(self, key: str, condition, rows: int) -> np.ndarray:
+        """Rows whose metadata value for key satisfies the condition; rows
+        without the key never match"""
+        if isinstance(condition, dict):
+            ((op, value),) = condition.items()
+        else:
+            op, value = "$eq", condition
+        compare = WHERE_OPERATORS.get(op)
+        if compare is None:
+            raise ValueError(f"Unknown where operator: {op}")
+
+        mask = np.zeros(rows, dtype=bool)
+        if key == "source":
+            if op not in ("$eq", "$ne", "$in", "$nin"):
+                raise ValueError(f"{op} is not supported on source")
+            codes = self._columns["source"][:rows]
+            names = value if isinstance(value, list) else [value]
+            # Unknown sources get a code no row has
+            value = [self._source_codes.get(name, -2) for name in names]
+            if op in ("$eq", "$ne"):
+                value = value[0]
+            return compare(codes, value) & (codes >= 0)
+        if key == "page":
+            pages = self._columns["page"][:rows]
+            mask = compare(pages, value) & (pages >= 0)
+        if key == "content_hash":
+            sparse = enumerate(self._hashes[:rows])
+        else:
+            sparse = self._extra.get(key, {}).items()
+        for row, stored in sparse:
+            if stored is None:
+                continue
+            try:
+                mask[row] = bool(compare(stored, value))
+            except TypeError:
+                pass  # values of another type never match
+        return mask
+
+    # Reads
+
+    def _get_by_ids(self, ids: list[str], with_embeddings: bool = False) -> dict:
+        with self._lock:
+            found = [(i, self._rows[i]) for i in ids if i in self._rows]
+            if not found:
+                return {}
+            rows = np.array([row for _, row in found], dtype=np.int64)
+            embeddings = (
+                self._dequantize(rows).tolist()
+                if with_embeddings
+                else [None] * len(rows)
+            )
+            return {
+                chunk_id: {
+                    "id": chunk_id,
+                    "content": document,
+                    "metadata": self._metadata(row),
+                    "distance": None,
+                    "embedding": embedding,
+                }
+                for (chunk_id, row), document, embedding in zip(
+                    found, self._read_documents(rows), embeddings
+                )
+            }
+
+    def source_chunks(self, source: str) -> dict[str, str]:
+        """Maps the ID of every chunk of a source to its content hash.
+
+        A comparison on the dictionary-encoded source column.
+        """
+        with self._lock:
+            code = self._source_codes.get(source)
+            if code is None:
+                return {}
+            rows = len(self._ids)
+            matches = np.flatnonzero(
+                (self._columns["source"][:rows] == code) & self._columns["alive"][:rows]
+            )
+            hashes = [self._hashes[row] for row in matches.tolist()]
+            # Chunks stored without a hash are hashed as at ingest
+            legacy = [i for i, chunk_hash in enumerate(hashes) if chunk_hash is None]
+            if legacy:
+                documents = self._read_documents(matches[legacy])
+                for i, document in zip(legacy, documents):
+                    hashes[i] = content_hash(document or "")
+            return {
+                self._ids[row]: chunk_hash
+                for row, chunk_hash in zip(matches.tolist(), hashes)
+            }
+
+    def iter_stored(self, field: str = "metadatas") -> Iterator[tuple[str, object]]:
+        """Yields (id, document or metadata) for every stored chunk, one block
+        at a time"""
+        with self._lock:
+            ids = list(self._rows)
+        for start in range(0, len(ids), self.max_batch_size):
+            with self._lock:
+                # Rows are looked up per block as compaction renumbers them
+                found = [
+                    i
+                    for i in ids[start : start + self.max_batch_size]
+                    if i in self._rows
+                ]
+                rows = np.array([self._rows[i] for i in found], dtype=np.int64)
+                if field == "documents":
+                    values = self._read_documents(rows)
+                else:
+                    values = [self._metadata(row) for row in rows.tolist()]
+            yield from zip(found, values)
+
+    def _metadata(self, row: int) -> dict:
+        metadata = {}
+        code = self._columns["source"][row]
+        if code >= 0:
+            metadata["source"] = self.source_names[code]
+        page = self._columns["page"][row]
+        if page >= 0:
+            metadata["page"] = int(page)
+        if self._hashes[row] is not None:
+            metadata["content_hash"] = self._hashes[row]
+        for key, values in self._extra.items():
+            if row in values:
+                metadata[key] = values[row]
+        return metadata
+
+    def _read_documents(self, rows: np.ndarray) -> list[str]:
+        offsets = self._columns["doc_offset"][rows].tolist()
+        lengths = self._columns["doc_length"][rows].tolist()
+        documents = []
+        with self._lock, open(self._file("documents", ".bin"), "rb") as f:
+            for offset, length in zip(offsets, lengths):
+                f.seek(offset)
+                documents.append(f.read(length).decode("utf-8"))
+        return documents
+
+    def _dequantize(self, rows: np.ndarray) -> np.ndarray:
+        vectors = self._vectors[rows].astype(np.float32)
+        if self.dtype == "int8":
+            vectors *= self._columns["scale"][rows][:, None]
+        return vectors
+
+    # Persistence
+
+    def flush(self):
+        """Folds the journal into the snapshot"""
+        with self._lock:
+            if self._journal_entries:
+                self._compact()
+
+    def close(self):
+        """Releases the directory lock; writes are already in the journal"""
+        with self._lock:
+            self._lock_file.close()
+
+    def _compact(self):
+        if len(self._rows) < len(self._ids):
+            self._purge()
+        rows = len(self._ids)
+        state = {
+            "version": self.SNAPSHOT_VERSION,
+            "generation": self.generation,
+            "dtype": self.dtype,
+            "dim": self.dim,
+            "ids": self._ids,
+            "hashes": self._hashes,
+            "extra": self._extra,
+            "source_names": self.source_names,
+            "columns": {key: column[:rows] for key, column in self._columns.items()},
+            "centroids": self._centroids,
+            "trained_rows": self._trained_rows,
+            "doc_size": self._doc_size,
+        }
+        tmp_path = self._snapshot_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self._snapshot_path)
+        self._remove_stale_files()
+        journal = self._file("journal", ".jsonl")
+        if os.path.exists(journal):
+            os.remove(journal)
+        self._journal_entries = 0
+
+    def _purge(self):
+        """Rewrites the matrix and document blob without deleted rows, as
+        the next generation"""
+        keep = np.flatnonzero(self._columns["alive"][: len(self._ids)])
+        generation = self.generation + 1
+        capacity = max(1024, len(keep))
+        vectors = open_memmap(
+            self._file("vectors", ".npy", generation),
+            mode="w+",
+            dtype=DTYPES[self.dtype],
+            shape=(capacity, self.dim),
+        )
+        for start in range(0, len(keep), SEARCH_BLOCK_ROWS):
+            block = keep[start : start + SEARCH_BLOCK_ROWS]
+            vectors[start : start + len(block)] = self._vectors[block]
+        vectors.flush()
+
+        offsets = np.zeros(len(keep), dtype=np.int64)
+        size = 0
+        self._documents.close()
+        with open(self._file("documents", ".bin"), "rb") as source, open(
+            self._file("documents", ".bin", generation), "wb"
+        ) as target:
+            for i, row in enumerate(keep.tolist()):
+                source.seek(self._columns["doc_offset"][row])
+                data = source.read(self._columns["doc_length"][row])
+                offsets[i] = size
+                target.write(data)
+                size += len(data)
+
+        renumber = {int(row): i for i, row in enumerate(keep.tolist())}
+        columns = {key: column[keep] for key, column in self._columns.items()}
+        columns["doc_offset"] = offsets
+        self._ids = [self._ids[row] for row in keep.tolist()]
+        self._rows = {chunk_id: i for i, chunk_id in enumerate(self._ids)}
+        self._hashes = [self._hashes[row] for row in keep.tolist()]
+        self._extra = {
+            key: {renumber[row]: value for row, value in values.items()}
+            for key, values in self._extra.items()
+        }
+        self.generation = generation
+        self._vectors = vectors
+        self._columns = columns
+        self._grow_columns(capacity)
+        self._doc_size = size
+        self._documents = open(self._file("documents", ".bin"), "ab")
+        if self._centroids is not None:
+            self._lists = [[] for _ in self._centroids]
+            for row, list_id in enumerate(columns["ivf_list"][: len(keep)].tolist()):
+                if list_id >= 0:
+                    self._lists[list_id].append(row)
+
+    def _remove_stale_files(self):
+        current = f".{self.generation}."
+        for name in os.listdir(self.path):
+            if name.startswith(("vectors.", "documents.", "journal.")) and (
+                current not in name
+            ):
+                os.remove(os.path.join(self.path, name))
+
+    def _load(self):
+        if os.path.exists(self._snapshot_path):
+            with open(self._snapshot_path, "rb") as f:
+                state = pickle.load(f)
+            if state.get("version") == self.SNAPSHOT_VERSION:
+                if state["dtype"] != self.dtype:
+                    raise ValueError(
+                        f"{self.path} holds {state['dtype']} vectors, "
+                        f"not {self.dtype}"
+                    )
+                self._restore(state)
+        self._remove_stale_files()
+
+        journal = self._file("journal", ".jsonl")
+        if os.path.exists(journal):
+            self._replay(journal)
+        if self._documents is not None:
+            # Drop any bytes of a write the journal never recorded
+            self._documents.truncate(self._doc_size)
+
+    def _replay(self, journal: str):
+        with open(journal, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break  # torn final write
+                self._journal_entries += 1
+                if "delete" in entry:
+                    row = self._rows.pop(entry["delete"], None)
+                    if row is not None:
+                        self._delete_row(row)
+                    continue
+                if self.dim is None:
+                    # Rows were written to a matrix the snapshot never saw
+                    self.dim = open_memmap(
+                        self._file("vectors", ".npy"), mode="r"
+                    ).shape[1]
+                    self._open_files()
+                if entry["row"] < len(self._ids):
+                    continue  # already in the snapshot
+                if entry["row"] >= len(self._vectors):
+                    break
+                self._append_row(entry)
+                self._doc_size = max(self._doc_size, entry["offset"] + entry["length"])
+
+    def _restore(self, state: dict):
+        self.generation = state["generation"]
+        self.dim = state["dim"]
+        self._ids = state["ids"]
+        self._rows = {
+            chunk_id: row
+            for row, chunk_id in enumerate(self._ids)
+            if chunk_id is not None
+        }
+        self._hashes = state["hashes"]
+        self._extra = state["extra"]
+        self.source_names = state["source_names"]
+        self._source_codes = {name: i for i, name in enumerate(self.source_names)}
+        self._columns = state["columns"]
+        self._centroids = state["centroids"]
+        self._trained_rows = state["trained_rows"]
+        self._doc_size = state["doc_size"]
+        if self._centroids is not None:
+            self._lists = [[] for _ in self._centroids]
+            for row, list_id in enumerate(self._columns["ivf_list"].tolist()):
+                if list_id >= 0 and self._ids[row] is not None:
+                    self._lists[list_id].append(row)
+        if self.dim is not None:
+            self._open_files()
+
+    def _open_files(self):
+        self._vectors = open_memmap(self._file("vectors", ".npy"), mode="r+")
+        self._grow_columns(len(self._vectors))
+        self._documents = open(self._file("documents", ".bin"), "ab")
+
+    def stats(self) -> dict:
+        return {
+            "backend": "memmap",
+            "dtype": self.dtype,
+            "index": self.index,
+            "chunks": len(self._rows),
+            "tombstones": len(self._ids) - len(self._rows),
+            "dimensions": self.dim,
+            "ivf_lists": len(self._lists) if self._centroids is not None else 0,
+            "matrix_bytes": self._vectors.nbytes if self._vectors is not None else 0,
+            "journal_entries": self._journal_entries,
+        }
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _document_matches(where_document: dict, text: str) -> bool:
+    ((op, value),) = where_document.items()
+    if op == "$contains":
+        return value in text
+    if op == "$not_contains":
+        return value not in text
+    if op == "$and":
+        return all(_document_matches(clause, text) for clause in value)
+    if op == "$or":
+        return any(_document_matches(clause, text) for clause in value)
+    raise ValueError(f"Unknown where_document op: {op}")
+
+
+def _quantize(vectors: np.ndarray, dtype: str):
+    """Stored rows and their dequantisation scales"""
+    if dtype == "float16":
+        return vectors.astype(np.float16), np.ones(len(vectors), dtype=np.float32)
+    scales = np.abs(vectors).max(axis=1) / 127
+    scales[scales == 0] = 1.0
+    return np.round(vectors / scales[:, None]).astype(np.int8), scales
+
+
+def _top_n(rows: np.ndarray, scores: np.ndarray, n: int):
+    """The n best (row, score) columns of each query, best first"""
+    if scores.shape[1] > n:
+        part = np.argpartition(-scores, n - 1, axis=1)[:, :n]
+        rows = np.take_along_axis(rows, part, axis=1)
+        scores = np.take_along_axis(scores, part, axis=1)
+    order = np.argsort(-scores, axis=1, kind="stable")
+    return (
+        np.take_along_axis(rows, order, axis=1),
+        np.take_along_axis(scores, order, axis=1),
+    )
+
+
+def _lock_directory(path: str):
+    """Holds an exclusive lock on the store directory until closed"""
+    lock_file = open(os.path.join(path, "lock"), "a")
+    if fcntl is None:
+        return lock_file
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock_file.close()
+        raise RuntimeError(
+            f"Memmap store {path} is open in another process; "
+            "the memmap backend is single-process"
+        )
+    return lock_file
@@ -0,0 +1,505 @@
+# Compressed vector tier: coarse search on quantized codes, exact rescoring
+import json
+import os
+import sys
+import threading
+from typing import Iterable, Optional
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+QUANTIZATIONS = ("int8", "binary")
+# Shortlist sizes that keep recall@k near exact; sign bits need more
+DEFAULT_RESCORE_FACTORS = {"int8": 4, "binary": 32}
+SEARCH_BLOCK_ROWS = 32_768
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+class QuantizedIndex:
+    """Two-stage nearest-neighbour search over chunk embeddings.
+
+    Every vector is kept twice: unit-normalised float32 in ``full.npy``,
+    which stays on disk and is only read for shortlisted rows, and as a
+    compact code in ``codes.npy``, which is what a search scans. Codes are
+    int8 with a per-row scale, or one sign bit per dimension compared by
+    Hamming distance. With ``dimensions`` set, codes only keep that many
+    leading dimensions (Matryoshka truncation, for models trained for it).
+
+    A search takes the ``rescore_factor * k`` best rows by code and
+    reorders them by exact cosine similarity. Chunk IDs are recorded in a
+    journal; deleted rows are tombstoned and purged by ``compact``, which
+    writes a new generation of files. Opening an index with other settings
+    re-encodes the codes from ``full.npy``, which is the only copy of the
+    vectors when the tier backs a Chroma collection.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        quantization: str = "int8",
+        dimensions: int = 0,
+        rescore_factor: int = 0,
+    ):
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unknown quantization: {quantization}")
+        self.path = path
+        self.quantization = quantization
+        self.dimensions = dimensions
+        self.rescore_factor = rescore_factor or DEFAULT_RESCORE_FACTORS[quantization]
+        self._lock = threading.RLock()
+        os.makedirs(path, exist_ok=True)
+        self._reset()
+        self._load()
+
+    def _reset(self):
+        self.generation = 0
+        self.dim: int | None = None
+        self._full: np.memmap | None = None
+        self._codes: np.memmap | None = None
+        self._scales: np.memmap | None = None
+        self._ids: list[str | None] = []  # None marks a deleted row
+        self._rows: dict[str, int] = {}
+        self._alive = np.zeros(0, dtype=bool)
+
+    @classmethod
+    def from_path(cls, path: str) -> "QuantizedIndex":
+        """The index at path, opened with the settings it was written with"""
+        with open(os.path.join(path, "CURRENT")) as f:
+            stored = json.load(f)
+        return cls(path, stored["quantization"], stored["dimensions"])
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, chunk_id: str) -> bool:
+        return chunk_id in self._rows
+
+    def ids(self) -> list[str]:
+        with self._lock:
+            return list(self._rows)
+
+    def vectors(self, ids: list[str]) -> dict[str, np.ndarray]:
+        """Unit-normalised full-precision vectors of the known chunk IDs"""
+        with self._lock:
+            known = [chunk_id for chunk_id in ids if chunk_id in self._rows]
+            if not known:
+                return {}
+            rows = np.array([self._rows[chunk_id] for chunk_id in known])
+            return dict(zip(known, self._read_full(rows)))
+
+    def _file(self, name: str, generation: int | None = None) -> str:
+        generation = self.generation if generation is None else generation
+        return os.path.join(self.path, f"{name}.{generation}")
+
+    @property
+    def code_dim(self) -> int:
+        if self.dimensions and self.dimensions < self.dim:
+            return self.dimensions
+        return self.dim
+
+    @property
+    def bytes_per_vector(self) -> int:
+        """Memory a search touches per stored chunk"""
+        if self.dim is None:
+            return 0
+        if self.quantization == "binary":
+            return (self.code_dim + 7) // 8
+        return self.code_dim + 4  # int8 codes plus a float32 scale
+
+    @property
+    def id_map_bytes_per_vector(self) -> int:
+        """Estimated resident memory of the row-to-ID list and ID-to-row
+        dict per stored chunk, which outweighs the codes themselves"""
+        with self._lock:
+            if not self._rows:
+                return 0
+            sample = next(iter(self._rows))
+            containers = sys.getsizeof(self._ids) + sys.getsizeof(self._rows)
+            # Containers amortised over their rows, plus the ID string and
+            # the row number object each entry points at
+            return round(
+                containers / len(self._ids)
+                + sys.getsizeof(sample)
+                + sys.getsizeof(len(self._ids))
+            )
+
+    # Writes
+
+    def add(self, ids: list[str], embeddings: Iterable[list[float]]):
+        """Stores vectors under their chunk IDs; known IDs are ignored"""
+        vectors = _normalize(np.asarray(embeddings, dtype=np.float32))
+        with self._lock:
+            fresh = [i for i, chunk_id in enumerate(ids) if chunk_id not in self._rows]
+            if not fresh:
+                return
+            vectors = vectors[fresh]
+            if self.dim is None:
+                self._create(vectors.shape[1], 1024)
+            if vectors.shape[1] != self.dim:
+                raise ValueError(
+                    f"Embedding dimension {vectors.shape[1]} does not match "
+                    f"the index's {self.dim}"
+                )
+            start = len(self._ids)
+            stop = start + len(fresh)
+            self._ensure_capacity(stop)
+            codes, scales = self._encode(vectors)
+            self._full[start:stop] = vectors
+            self._codes[start:stop] = codes
+            self._scales[start:stop] = scales
+            for array in (self._full, self._codes, self._scales):
+                array.flush()
+
+            entries = []
+            for row, i in enumerate(fresh, start=start):
+                chunk_id = ids[i]
+                self._ids.append(chunk_id)
+                self._rows[chunk_id] = row
+                self._alive[row] = True
+                entries.append({"row": row, "id": chunk_id})
+            self._append_journal(entries)
+
+    def remove(self, ids: Iterable[str]):
+        """Tombstones vectors by chunk ID; unknown IDs are ignored"""
+        with self._lock:
+            entries = []
+            for chunk_id in ids:
+                row = self._rows.pop(chunk_id, None)
+                if row is None:
+                    continue
+                self._ids[row] = None
+                self._alive[row] = False
+                entries.append({"delete": chunk_id})
+            if entries:
+                self._append_journal(entries)
+            # Purge once most of the rows are dead
+            if len(self._ids) > 1024 and len(self._rows) < len(self._ids) // 2:
+                self.compact()
+
+    def rebuild(self, items: Iterable[tuple[str, list[float]]], batch_size=1024):
+        """Replaces the whole index with (chunk_id, embedding) pairs"""
+        with self._lock:
+            self._start_generation(self.generation + 1, 0, 0)
+            batch = []
+            for item in items:
+                batch.append(item)
+                if len(batch) >= batch_size:
+                    self.add(*zip(*batch))
+                    batch = []
+            if batch:
+                self.add(*zip(*batch))
+            self._commit_generation()
+
+    def _append_journal(self, entries: list[dict]):
+        with open(self._file("ids") + ".jsonl", "a", encoding="utf-8") as f:
+            for entry in entries:
+                f.write(json.dumps(entry) + "\n")
+
+    def _encode(self, vectors: np.ndarray):
+        """Codes and int8 scales of unit vectors"""
+        truncated = _normalize(vectors[:, : self.code_dim])
+        if self.quantization == "binary":
+            codes = np.packbits(truncated > 0, axis=1)
+            return codes, np.ones(len(vectors), dtype=np.float32)
+        scales = np.abs(truncated).max(axis=1) / 127
+        scales[scales == 0] = 1.0
+        return np.round(truncated / scales[:, None]).astype(np.int8), scales
+
+    # Files
+
+    def _create(self, dim: int, capacity: int):
+        self.dim = dim
+        width = self.bytes_per_vector - (0 if self.quantization == "binary" else 4)
+        code_type = np.uint8 if self.quantization == "binary" else np.int8
+        self._full = open_memmap(
+            self._file("full") + ".npy",
+            mode="w+",
+            dtype=np.float32,
+            shape=(capacity, dim),
+        )
+        self._codes = open_memmap(
+            self._file("codes") + ".npy",
+            mode="w+",
+            dtype=code_type,
+            shape=(capacity, width),
+        )
+        self._scales = open_memmap(
+            self._file("scales") + ".npy",
+            mode="w+",
+            dtype=np.float32,
+            shape=(capacity,),
+        )
+        self._alive = np.zeros(capacity, dtype=bool)
+
+    def _ensure_capacity(self, rows: int):
+        capacity = len(self._full)
+        if rows <= capacity:
+            return
+        while capacity < rows:
+            capacity *= 2
+        used = len(self._ids)
+        for name in ("full", "codes", "scales"):
+            current = getattr(self, f"_{name}")
+            path = self._file(name) + ".npy"
+            grown = open_memmap(
+                path + ".tmp",
+                mode="w+",
+                dtype=current.dtype,
+                shape=(capacity,) + current.shape[1:],
+            )
+            grown[:used] = current[:used]
+            grown.flush()
+            del grown
+            os.replace(path + ".tmp", path)
+            setattr(self, f"_{name}", open_memmap(path, mode="r+"))
+        alive = np.zeros(capacity, dtype=bool)
+        alive[:used] = self._alive[:used]
+        self._alive = alive
+
+    def compact(self):
+        """Rewrites the index without deleted rows, as a new generation"""
+        with self._lock:
+            if len(self._rows) == len(self._ids):
+                return
+            keep = np.flatnonzero(self._alive[: len(self._ids)])
+            ids = [self._ids[row] for row in keep.tolist()]
+            full, codes, scales = self._full, self._codes, self._scales
+            self._start_generation(self.generation + 1, self.dim, max(1024, len(keep)))
+            for start in range(0, len(keep), 65_536):
+                block = keep[start : start + 65_536]
+                stop = start + len(block)
+                self._full[start:stop] = full[block]
+                self._codes[start:stop] = codes[block]
+                self._scales[start:stop] = scales[block]
+            for array in (self._full, self._codes, self._scales):
+                array.flush()
+            self._ids = ids
+            self._rows = {chunk_id: row for row, chunk_id in enumerate(ids)}
+            self._alive[: len(ids)] = True
+            self._append_journal([{"row": row, "id": i} for row, i in enumerate(ids)])
+            self._commit_generation()
+
+    def _start_generation(self, generation: int, dim: int, capacity: int):
+        """Switches to empty files of a new generation; the old generation
+        stays current on disk until ``_commit_generation``"""
+        self.generation = generation
+        self._ids, self._rows = [], {}
+        self._alive = np.zeros(0, dtype=bool)
+        self.dim = None
+        self._full = self._codes = self._scales = None
+        if os.path.exists(self._file("ids") + ".jsonl"):
+            os.remove(self._file("ids") + ".jsonl")
+        if dim:
+            self._create(dim, capacity)
+
+    def _commit_generation(self):
+        """Points CURRENT at this generation and drops the files of others"""
+        current = os.path.join(self.path, "CURRENT")
+        with open(current + ".tmp", "w") as f:
+            json.dump(self._settings(), f)
+        os.replace(current + ".tmp", current)
+        self._remove_stale_files()
+
+    def _settings(self) -> dict:
+        return {
+            "generation": self.generation,
+            "quantization": self.quantization,
+            "dimensions": self.dimensions,
+        }
+
+    def _remove_stale_files(self):
+        suffix = f".{self.generation}"
+        for name in os.listdir(self.path):
+            stem, _ = os.path.splitext(name)
+            if name != "CURRENT" and not stem.endswith(suffix):
+                os.remove(os.path.join(self.path, name))
+
+    def _load(self):
+        current = os.path.join(self.path, "CURRENT")
+        if not os.path.exists(current):
+            self._commit_generation()
+            return
+        with open(current) as f:
+            stored = json.load(f)
+        self.generation = stored["generation"]
+        if stored != self._settings():
+            self._reencode(stored)
+            return
+        self._remove_stale_files()
+        self._load_generation()
+
+    def _reencode(self, stored: dict):
+        """Rebuilds the codes of a generation written with other settings
+        from its full-precision vectors"""
+        wanted = self.quantization, self.dimensions
+        self.quantization = stored["quantization"]
+        self.dimensions = stored["dimensions"]
+        self._load_generation()
+        self.quantization, self.dimensions = wanted
+        full = self._full
+        alive = [(row, i) for row, i in enumerate(self._ids) if i is not None]
+        self.rebuild((chunk_id, full[row]) for row, chunk_id in alive)
+
+    def _load_generation(self):
+        if not os.path.exists(self._file("full") + ".npy"):
+            return
+        self._full = open_memmap(self._file("full") + ".npy", mode="r+")
+        self._codes = open_memmap(self._file("codes") + ".npy", mode="r+")
+        self._scales = open_memmap(self._file("scales") + ".npy", mode="r+")
+        self.dim = self._full.shape[1]
+        self._alive = np.zeros(len(self._full), dtype=bool)
+        journal = self._file("ids") + ".jsonl"
+        if not os.path.exists(journal):
+            return
+        with open(journal, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break  # torn final write
+                if "delete" in entry:
+                    row = self._rows.pop(entry["delete"], None)
+                    if row is not None:
+                        self._ids[row] = None
+                        self._alive[row] = False
+                elif entry["row"] == len(self._ids):
+                    self._ids.append(entry["id"])
+                    self._rows[entry["id"]] = entry["row"]
+                    self._alive[entry["row"]] = True
+
+    # Search
+
+    def search(
+        self,
+        query_embeddings: list[list[float]],
+        k: int,
+        ids: Optional[Iterable[str]] = None,
+    ) -> list[list[tuple[str, float]]]:
+        """The k nearest chunks of each query as (chunk_id, cosine
+        similarity) pairs, best first.
+
+        With ``ids``, only those chunks are scored, so a filtered search
+        costs in proportion to the filtered subset.
+        """
+        queries = _normalize(np.asarray(query_embeddings, dtype=np.float32))
+        with self._lock:
+            if not self._rows:
+                return [[] for _ in queries]
+            if queries.shape[1] != self.dim:
+                raise ValueError(
+                    f"Query dimension {queries.shape[1]} does not match "
+                    f"the index's {self.dim}"
+                )
+            if ids is None:
+                rows = None
+                total = len(self._ids)
+            else:
+                rows = np.sort(
+                    np.array(
+                        [self._rows[i] for i in ids if i in self._rows],
+                        dtype=np.int64,
+                    )
+                )
+                if not len(rows):
+                    return [[] for _ in queries]
+                total = len(rows)
+            shortlist = min(total, k * self.rescore_factor)
+
+            # Blocked scan keeping each query's running shortlist, so only
+            # one block of decoded codes and scores is in memory at a time
+            best_rows = np.zeros((len(queries), 0), dtype=np.int64)
+            best_scores = np.zeros((len(queries), 0), dtype=np.float32)
+            for start in range(0, total, SEARCH_BLOCK_ROWS):
+                stop = min(start + SEARCH_BLOCK_ROWS, total)
+                if rows is None:
+                    block, numbers = slice(start, stop), np.arange(start, stop)
+                    scores = self._coarse_scores(queries, block)
+                    scores[:, ~self._alive[start:stop]] = -np.inf
+                else:
+                    block = numbers = rows[start:stop]
+                    scores = self._coarse_scores(queries, block)
+                block_rows = np.broadcast_to(numbers, scores.shape)
+                best_rows = np.concatenate([best_rows, block_rows], axis=1)
+                best_scores = np.concatenate([best_scores, scores], axis=1)
+                best_rows, best_scores = _best(best_rows, best_scores, shortlist)
+
+            results = []
+            for query, shortlisted, scores in zip(queries, best_rows, best_scores):
+                # Exact cosine from the full-precision rows on disk
+                shortlisted = np.sort(shortlisted[np.isfinite(scores)])
+                exact = self._read_full(shortlisted) @ query
+                order = np.argsort(-exact, kind="stable")[:k]
+                results.append(
+                    [
+                        (self._ids[shortlisted[i]], float(exact[i]))
+                        for i in order.tolist()
+                    ]
+                )
+            return results
+
+    def _read_full(self, rows: np.ndarray) -> np.ndarray:
+        """Full-precision rows, read from the file rather than through the
+        memory map: mapped pages of scattered rows (and their neighbours,
+        with readahead) would otherwise stay resident in the process"""
+        vectors = np.empty((len(rows), self.dim), dtype=np.float32)
+        row_bytes = self.dim * 4
+        with open(self._full.filename, "rb", buffering=0) as f:
+            for vector, row in zip(vectors, rows.tolist()):
+                f.seek(self._full.offset + row * row_bytes)
+                f.readinto(memoryview(vector).cast("B"))
+        return vectors
+
+    def _coarse_scores(self, queries: np.ndarray, rows) -> np.ndarray:
+        """Approximate similarities of the queries to the given rows"""
+        truncated = _normalize(queries[:, : self.code_dim])
+        codes = self._codes[rows]
+        if self.quantization == "binary":
+            packed = np.packbits(truncated > 0, axis=1)
+            scores = np.empty((len(queries), len(codes)), dtype=np.float32)
+            for i, query in enumerate(packed):
+                differing = np.bitwise_xor(codes, query)
+                scores[i] = -_popcount(differing).sum(axis=1, dtype=np.int32)
+            return scores
+        scores = truncated @ codes.astype(np.float32).T
+        scores *= self._scales[rows]
+        return scores
+
+    def stats(self) -> dict:
+        return {
+            "quantization": self.quantization,
+            "vectors": len(self._rows),
+            "tombstones": len(self._ids) - len(self._rows),
+            "dimensions": self.dim,
+            "code_dimensions": self.code_dim if self.dim else None,
+            "bytes_per_vector": self.bytes_per_vector,
+            "id_map_bytes_per_vector": self.id_map_bytes_per_vector,
+            "code_mb_per_million": round(self.bytes_per_vector * 1e6 / 2**20, 1),
+            "memory_per_million_mb": round(
+                (self.bytes_per_vector + self.id_map_bytes_per_vector) * 1e6 / 2**20,
+                1,
+            ),
+        }
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _best(rows: np.ndarray, scores: np.ndarray, n: int):
+    """The n best (row, score) columns of each query, unordered"""
+    if scores.shape[1] <= n:
+        return rows, scores
+    part = np.argpartition(-scores, n - 1, axis=1)[:, :n]
+    return (
+        np.take_along_axis(rows, part, axis=1),
+        np.take_along_axis(scores, part, axis=1),
+    )
+
+
+def _popcount(values: np.ndarray) -> np.ndarray:
+    bitwise_count = getattr(np, "bitwise_count", None)  # NumPy 2.0+
+    if bitwise_count is not None:
+        return bitwise_count(values)
+    return _POPCOUNT[values]
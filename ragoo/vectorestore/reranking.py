@@ -0,0 +1,83 @@
+# Post-retrieval diversification of search candidates
+import re
+from typing import Optional
+import numpy as np
+
+WORD_PATTERN = re.compile(r"\w+")
+
+
+def select_diverse(
+    candidates: list[dict],
+    k: int,
+    diversity: float = 0.3,
+    duplicate_similarity: float = 0.97,
+    text_overlap: float = 0.5,
+) -> list[dict]:
+    """Picks up to k candidates by maximal marginal relevance.
+
+    Each candidate carries a ``relevance`` in [0, 1] and optionally its
+    ``embedding``. Every step takes the candidate maximising
+    ``(1 - diversity) * relevance - diversity * max_similarity_to_picked``
+    and drops the remaining ones that are near-copies of it: cosine
+    similarity of at least ``duplicate_similarity``, or at least
+    ``text_overlap`` of their word trigrams shared with it. Both pairwise
+    matrices are computed once up front, an O(n^2) matrix product each,
+    after which every pick is O(n) array work.
+    """
+    n = len(candidates)
+    if n <= 1:
+        return candidates[:k]
+
+    relevance = np.array([c["relevance"] for c in candidates], dtype=np.float32)
+    similarity = _similarity_matrix([c.get("embedding") for c in candidates])
+    overlap = _overlap_matrix([_shingles(c["content"]) for c in candidates])
+
+    available = np.ones(n, dtype=bool)
+    max_similarity = np.zeros(n, dtype=np.float32)
+    picked = []
+    while len(picked) < k and available.any():
+        scores = (1 - diversity) * relevance - diversity * max_similarity
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        picked.append(best)
+        available[best] = False
+
+        if similarity is not None:
+            available &= similarity[best] < duplicate_similarity
+            np.maximum(max_similarity, similarity[best], out=max_similarity)
+        available &= overlap[best] < text_overlap
+
+    return [candidates[i] for i in picked]
+
+
+def _similarity_matrix(embeddings: list) -> Optional[np.ndarray]:
+    """Pairwise cosine similarities, or None if any embedding is missing"""
+    if any(embedding is None for embedding in embeddings):
+        return None
+    matrix = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    matrix = matrix / np.where(norms == 0, 1, norms)
+    return matrix @ matrix.T
+
+
+def _shingles(text: str) -> set:
+    words = WORD_PATTERN.findall(text.lower())
+    if len(words) < 3:
+        return {tuple(words)} if words else set()
+    return set(zip(words, words[1:], words[2:]))
+
+
+def _overlap_matrix(shingle_sets: list[set]) -> np.ndarray:
+    """Pairwise share of the smaller shingle set found in the other one"""
+    vocabulary = {}
+    rows, columns = [], []
+    for row, shingles in enumerate(shingle_sets):
+        for shingle in shingles:
+            rows.append(row)
+            columns.append(vocabulary.setdefault(shingle, len(vocabulary)))
+    incidence = np.zeros((len(shingle_sets), len(vocabulary)), dtype=np.float32)
+    incidence[rows, columns] = 1
+    shared = incidence @ incidence.T
+    sizes = incidence.sum(axis=1)
+    smaller = np.minimum(sizes[:, None], sizes[None, :])
+    return np.divide(shared, smaller, out=np.zeros_like(shared), where=smaller > 0)
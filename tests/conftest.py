@@ -2,15 +2,36 @@
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
 from ragoo.main import app
 from ragoo.core.config import settings
-from ragoo.database.database import Base, get_db
+from ragoo.core.security import token_cache
+from ragoo.database import models
+from ragoo.database.database import (
+    Base,
+    async_database_url,
+    create_db_engine,
+    get_async_db,
+    get_db,
+)
+from ragoo.services.ingestion_service import IngestionQueue, get_ingestion_queue
+from ragoo.services.rag_service import RAGService, get_rag_service
+from ragoo.services.source_catalog import SourceCatalog
+from ragoo.services.user_service import user_cache
 from ragoo.vectorestore.chroma_handler import ChromaHandler
+from ragoo.vectorestore.memmap_store import MemmapVectorStore
 
 TEST_DATABASE_URL = "sqlite:///./test.db"
-engine = create_engine(TEST_DATABASE_URL)
+engine = create_db_engine(TEST_DATABASE_URL)
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# TestClient runs each request on a fresh event loop, so async connections
+# must not be pooled across requests
+async_engine = create_async_engine(
+    async_database_url(TEST_DATABASE_URL), poolclass=NullPool
+)
+TestingAsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False)
 
 
 @pytest.fixture(scope="session")
@@ -39,9 +60,19 @@ def client(db_session):
         finally:
             db_session.close()
 
+    async def override_get_async_db():
+        async with TestingAsyncSessionLocal() as db:
+            yield db
+
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_async_db] = override_get_async_db
+    # Users only live for one test, in the database and in the caches
+    user_cache.clear()
+    token_cache.clear()
     yield TestClient(app)
     app.dependency_overrides.clear()
+    with engine.begin() as connection:
+        connection.execute(models.User.__table__.delete())
 
 
 @pytest.fixture
@@ -73,3 +104,81 @@ def test_chroma_client(scope="session"):
     settings.CHROMA_COLLECTION_NAME = "test_collection"
 
     return ChromaHandler()
+
+
+class FakeEmbeddingClient:
+    """Deterministic bag-of-letters embeddings, counting embedded texts"""
+
+    def __init__(self):
+        self.embedded = []
+
+    def embed(self, texts):
+        self.embedded.extend(texts)
+        return [self.vector(text) for text in texts]
+
+    @staticmethod
+    def vector(text):
+        counts = [0.0] * 26
+        for char in text.lower():
+            if "a" <= char <= "z":
+                counts[ord(char) - ord("a")] += 1.0
+        counts[0] += 0.01  # never the zero vector
+        return counts
+
+
+@pytest.fixture
+def fake_chroma_client(tmp_path, monkeypatch):
+    """ChromaHandler on a temporary directory with a fake embedding model"""
+    monkeypatch.setattr(settings, "CHROMA_PERSIST_DIR", str(tmp_path / "chroma"))
+    monkeypatch.setattr(settings, "CHROMA_COLLECTION_NAME", "fake_collection")
+    handler = ChromaHandler()
+    handler.embedding_function.client = FakeEmbeddingClient()
+    return handler
+
+
+@pytest.fixture
+def make_memmap_store(tmp_path):
+    """MemmapVectorStores on a temporary directory with a fake embedding model"""
+
+    def make(**kwargs):
+        store = MemmapVectorStore(directory=str(tmp_path / "memmap"), **kwargs)
+        store.embedding_function.client = FakeEmbeddingClient()
+        return store
+
+    return make
+
+
+@pytest.fixture
+def make_catalog(tmp_path):
+    """Catalogs on their own database, independent of the request session"""
+    catalog_engine = create_engine(f"sqlite:///{tmp_path / 'catalog.db'}")
+    Base.metadata.create_all(bind=catalog_engine)
+    session_factory = sessionmaker(
+        autocommit=False, autoflush=False, bind=catalog_engine
+    )
+    yield lambda name: SourceCatalog(name, session_factory=session_factory)
+    catalog_engine.dispose()
+
+
+@pytest.fixture
+def fake_rag_service(fake_chroma_client, make_catalog):
+    """A RAG service on the fake vectorstore and a fresh catalog, served to
+    the routes in place of the shared one"""
+    service = RAGService(
+        vectorstore=fake_chroma_client, source_catalog=make_catalog("fake")
+    )
+    app.dependency_overrides[get_rag_service] = lambda: service
+    yield service
+    app.dependency_overrides.pop(get_rag_service, None)
+
+
+@pytest.fixture
+def fake_ingestion_queue(fake_rag_service, test_db, tmp_path):
+    """An ingestion queue on the test database, spooling to a temporary
+    directory, served to the routes in place of the shared one"""
+    queue = IngestionQueue(fake_rag_service, session_factory=TestingSessionLocal)
+    queue.spool_dir = str(tmp_path / "spool")
+    app.dependency_overrides[get_ingestion_queue] = lambda: queue
+    yield queue
+    app.dependency_overrides.pop(get_ingestion_queue, None)
+    queue.shutdown()
@@ -0,0 +1,84 @@
+import asyncio
+
+import pytest
+
+from ragoo.services.admission import AdmissionController, AdmissionRejected
+
+
+def test_slots_are_bounded_and_shared_round_robin():
+    controller = AdmissionController(max_concurrency=1, max_queue=10, max_wait=5)
+    order = []
+
+    async def generate(user, n):
+        async with controller.slot(user):
+            order.append((user, n))
+            await asyncio.sleep(0.001)
+
+    async def main():
+        # alice bursts first, bob's single request must not wait behind it all
+        tasks = [generate("alice", n) for n in range(3)] + [generate("bob", 0)]
+        await asyncio.gather(*tasks)
+
+    asyncio.run(main())
+
+    assert order == [("alice", 0), ("alice", 1), ("bob", 0), ("alice", 2)]
+    stats = controller.stats()
+    assert stats["active"] == stats["queued"] == 0
+    assert stats["admitted"] == 4
+    assert stats["wait_ms"]["count"] == 4
+
+
+def test_full_queue_rejects_with_retry_after():
+    controller = AdmissionController(max_concurrency=1, max_queue=1, max_wait=5)
+
+    async def main():
+        release = asyncio.Event()
+
+        async def hold():
+            async with controller.slot("a"):
+                await release.wait()
+
+        holder = asyncio.ensure_future(hold())
+        waiter = asyncio.ensure_future(hold())
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as rejected:
+            await controller.acquire("b")
+        release.set()
+        await asyncio.gather(holder, waiter)
+        return rejected.value
+
+    error = asyncio.run(main())
+
+    assert error.reason == "queue_full"
+    assert error.retry_after >= 1
+    assert controller.stats()["rejected"]["queue_full"] == 1
+
+
+def test_queue_wait_times_out_and_user_quota_applies():
+    controller = AdmissionController(
+        max_concurrency=2,
+        max_queue=10,
+        max_wait=0.01,
+        user_max_concurrency=1,
+        user_max_queued=1,
+    )
+
+    async def main():
+        await controller.acquire("alice")
+        # A free slot exists, but alice is at her quota
+        with pytest.raises(AdmissionRejected) as timed_out:
+            await controller.acquire("alice")
+        waiter = asyncio.ensure_future(controller.acquire("alice"))
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as over_quota:
+            await controller.acquire("alice")
+        await controller.acquire("bob")  # other users are unaffected
+        waiter.cancel()
+        return timed_out.value, over_quota.value
+
+    timed_out, over_quota = asyncio.run(main())
+
+    assert timed_out.reason == "timeout"
+    assert over_quota.reason == "user_quota"
+    assert controller.stats()["queued"] == 0
+    assert controller.stats()["active"] == 2
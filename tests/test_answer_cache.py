@@ -0,0 +1,52 @@
+from ragoo.services.answer_cache import AnswerCache
+
+RESPONSE = {"answer": "42", "context": "ctx", "source": ["doc"]}
+
+
+def test_exact_hit_ignores_case_and_whitespace():
+    cache = AnswerCache()
+    cache.put("What is  the answer?", 1, RESPONSE)
+
+    assert cache.get("what is the answer?", 1) == RESPONSE
+    assert cache.get("something else", 1) is None
+    assert cache.stats()["exact_hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_semantic_hit_within_distance():
+    cache = AnswerCache(semantic_distance=0.05)
+    cache.put("first", 1, RESPONSE, embedding=[1.0, 0.0])
+
+    assert cache.get_similar([0.99, 0.05], 1) == RESPONSE
+    assert cache.get_similar([0.0, 1.0], 1) is None
+
+
+def test_new_collection_version_invalidates():
+    cache = AnswerCache()
+    cache.put("q", 1, RESPONSE)
+
+    assert cache.get("q", 2) is None
+    # Answers computed against an older collection are not stored
+    cache.put("q", 1, RESPONSE)
+    assert cache.get("q", 2) is None
+
+
+def test_ttl_and_size_bounds():
+    cache = AnswerCache(max_entries=2, ttl=-1)
+    cache.put("a", 1, RESPONSE)
+    assert cache.get("a", 1) is None
+
+    cache = AnswerCache(max_entries=2)
+    for query in ("a", "b", "c"):
+        cache.put(query, 1, RESPONSE)
+    assert cache.get("a", 1) is None
+    assert cache.get("c", 1) == RESPONSE
+
+
+def test_entries_only_match_within_their_scope():
+    cache = AnswerCache(semantic_distance=0.05)
+    cache.put("q", 1, RESPONSE, embedding=[1.0, 0.0], scope="lexical")
+
+    assert cache.get("q", 1, "vector") is None
+    assert cache.get_similar([1.0, 0.0], 1, "vector") is None
+    assert cache.get("q", 1, "lexical") == RESPONSE
+    assert cache.get_similar([1.0, 0.0], 1, "lexical") == RESPONSE
@@ -0,0 +1,58 @@
+from ragoo.services.chunking import TextChunker, count_tokens, iter_markdown_pages
+
+SENTENCES = " ".join(
+    f"Sentence number {n} talks about part E-{n:04d}." for n in range(200)
+)
+
+
+def test_chunks_end_on_sentence_boundaries():
+    chunks = TextChunker(chunk_size=200, overlap=40, unit="chars").split(SENTENCES)
+
+    assert len(chunks) > 10
+    assert all(len(chunk) <= 200 for chunk in chunks)
+    assert all(chunk.endswith(".") for chunk in chunks)
+    # Overlap starts on a word, so no chunk begins mid-word
+    words = set(SENTENCES.split())
+    assert all(chunk.split()[0] in words for chunk in chunks)
+
+
+def test_chunks_cover_the_whole_text():
+    chunks = TextChunker(chunk_size=200, overlap=0, unit="chars").split(SENTENCES)
+
+    assert " ".join(chunks) == SENTENCES
+
+
+def test_prefers_paragraphs_and_headings():
+    text = "# Intro\n\n" + "word " * 30 + "end.\n\n## Details\n\n" + "more " * 30
+    chunks = TextChunker(chunk_size=220, overlap=0, unit="chars").split(text)
+
+    assert chunks[0].endswith("end.")
+    assert chunks[1].startswith("## Details")
+
+
+def test_token_sizing():
+    chunker = TextChunker(chunk_size=50, overlap=10, unit="tokens")
+    chunks = chunker.split(SENTENCES)
+
+    assert all(count_tokens(chunk) <= 50 for chunk in chunks)
+    assert count_tokens(chunks[0]) > 25
+
+
+def test_pages_stream_with_page_numbers():
+    pages = [(n, f"Page {n} text. " * 40) for n in range(1, 30)]
+    chunker = TextChunker(chunk_size=300, overlap=50, unit="chars")
+
+    chunks = list(chunker.chunk_pages(pages))
+
+    page_numbers = [meta["page"] for _, meta in chunks]
+    assert page_numbers == sorted(page_numbers)
+    assert page_numbers[0] == 1 and page_numbers[-1] == 29
+    # A chunk's first line lies on the page it is attributed to
+    for chunk, meta in chunks:
+        assert chunk.split("\n")[0] in dict(pages)[meta["page"]]
+
+
+def test_markdown_pages():
+    text = "first page\n-----\n\n-----\nsecond page"
+
+    assert list(iter_markdown_pages(text)) == [(1, "first page"), (2, "second page")]
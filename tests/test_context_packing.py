@@ -0,0 +1,42 @@
+from ragoo.services.chunking import TextChunker, count_tokens
+from ragoo.services.context_packing import pack_context
+
+
+def result(content, source="manual.pdf"):
+    return {"content": content, "metadata": {"source": source}}
+
+
+def test_budget_is_filled_in_rank_order():
+    results = [
+        result("first " * 10),
+        result("second " * 30, "b.pdf"),
+        result("third " * 5, "c.pdf"),
+    ]
+
+    packed = pack_context(results, budget=20)
+
+    assert [c["content"].split()[0] for c in packed["chunks"]] == ["first", "third"]
+    assert packed["tokens_used"] == 15
+    assert packed["tokens_dropped"] == 30
+    assert packed["chunks_dropped"] == 1
+
+
+def test_top_chunk_is_truncated_not_dropped():
+    packed = pack_context([result("word " * 50)], budget=10)
+
+    assert count_tokens(packed["context"]) == 10
+    assert packed["tokens_used"] == 10 and packed["tokens_dropped"] == 40
+
+
+def test_overlap_between_adjacent_chunks_is_trimmed():
+    text = " ".join(f"sentence number {i} of the manual." for i in range(60))
+    first, second = TextChunker(chunk_size=400, overlap=120).split(text)[:2]
+
+    packed = pack_context([result(second), result(first)], budget=0)
+
+    assert packed["tokens_trimmed"] > 0
+    assert packed["context"].count("number 9 of the") == 1
+    assert (
+        pack_context([result(second), result(first, "other.pdf")], 0)["tokens_trimmed"]
+        == 0
+    )
@@ -0,0 +1,86 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from ragoo.core.config import settings
+from ragoo.database import models
+from ragoo.database.database import (
+    async_database_url,
+    create_async_db_engine,
+    create_db_engine,
+    get_async_sessionmaker,
+)
+
+
+def test_sqlite_engines_use_wal_and_a_busy_timeout(tmp_path):
+    url = f"sqlite:///{tmp_path / 'pragmas.db'}"
+    engine = create_db_engine(url)
+    with engine.connect() as connection:
+        pragmas = {
+            name: connection.execute(text(f"PRAGMA {name}")).scalar()
+            for name in ("journal_mode", "synchronous", "busy_timeout")
+        }
+    assert pragmas == {"journal_mode": "wal", "synchronous": 1, "busy_timeout": 5000}
+
+    async_url = async_database_url(url)
+    assert async_url.drivername == "sqlite+aiosqlite"
+
+    async def read_through_async_session():
+        async_engine = create_async_db_engine(async_url)
+        try:
+            async with AsyncSession(async_engine) as db:
+                mode = (await db.execute(text("PRAGMA journal_mode"))).scalar()
+                users = (await db.execute(select(models.User))).all()
+            return mode, users
+        finally:
+            await async_engine.dispose()
+
+    models.Base.metadata.create_all(bind=engine)
+    assert asyncio.run(read_through_async_session()) == ("wal", [])
+    engine.dispose()
+
+
+def test_concurrent_writers_wait_for_the_lock(tmp_path):
+    url = f"sqlite:///{tmp_path / 'writers.db'}"
+    setup = create_db_engine(url)
+    models.Base.metadata.create_all(bind=setup)
+
+    def write(worker: int):
+        # One engine per writer, as with separate uvicorn workers
+        engine = create_db_engine(url)
+        try:
+            for i in range(20):
+                with Session(engine) as db:
+                    db.add(
+                        models.User(
+                            username=f"w{worker}-{i}",
+                            email=f"w{worker}-{i}@example.com",
+                            hashed_password="x",
+                        )
+                    )
+                    db.commit()
+        finally:
+            engine.dispose()
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        list(pool.map(write, range(4)))
+
+    with Session(setup) as db:
+        assert db.query(models.User).count() == 80
+    setup.dispose()
+
+
+def test_async_engine_is_built_on_first_use(tmp_path, monkeypatch):
+    url = f"sqlite+aiosqlite:///{tmp_path / 'lazy.db'}"
+    monkeypatch.setattr(settings, "ASYNC_DATABASE_URL", url)
+    get_async_sessionmaker.cache_clear()
+    try:
+        factory = get_async_sessionmaker()
+        assert get_async_sessionmaker() is factory
+        assert str(factory.kw["bind"].url) == url
+        asyncio.run(factory.kw["bind"].dispose())
+    finally:
+        get_async_sessionmaker.cache_clear()
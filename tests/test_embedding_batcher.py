@@ -0,0 +1,69 @@
+import asyncio
+
+import pytest
+
+from ragoo.services.embedding_batcher import EmbeddingBatcher, Histogram
+
+
+def test_full_batches_flush_without_waiting():
+    batches = []
+
+    async def embed_batch(texts):
+        batches.append(texts)
+        return [[float(len(t))] for t in texts]
+
+    # A long wait proves full batches do not sit on the timer
+    batcher = EmbeddingBatcher(embed_batch, max_batch_size=2, max_wait=60)
+
+    async def main():
+        return await asyncio.wait_for(batcher.embed(["a", "bb", "ccc", "dddd"]), 1)
+
+    assert asyncio.run(main()) == [[1.0], [2.0], [3.0], [4.0]]
+    assert batches == [["a", "bb"], ["ccc", "dddd"]]
+
+
+def test_batch_errors_reach_every_caller():
+    async def embed_batch(texts):
+        raise RuntimeError("Ollama API error: down")
+
+    batcher = EmbeddingBatcher(embed_batch, max_batch_size=8, max_wait=0.001)
+
+    async def main():
+        return await asyncio.gather(
+            batcher.embed(["a"]), batcher.embed(["b"]), return_exceptions=True
+        )
+
+    assert all(isinstance(r, RuntimeError) for r in asyncio.run(main()))
+    assert batcher.stats()["batches"] == 1
+
+
+def test_close_cancels_batches_in_flight():
+    started = asyncio.Event()
+
+    async def embed_batch(texts):
+        started.set()
+        await asyncio.sleep(60)
+
+    batcher = EmbeddingBatcher(embed_batch, max_batch_size=1, max_wait=60)
+
+    async def main():
+        caller = asyncio.ensure_future(batcher.embed(["a"]))
+        await started.wait()
+        assert batcher.stats()["in_flight"] == 1
+        await batcher.aclose()
+        return await asyncio.gather(caller, return_exceptions=True)
+
+    (result,) = asyncio.run(main())
+    assert isinstance(result, asyncio.CancelledError)
+    assert batcher.stats()["in_flight"] == 0
+
+
+def test_histogram_buckets():
+    histogram = Histogram(4)
+    for value in [1, 2, 3, 9]:
+        histogram.observe(value)
+
+    stats = histogram.stats()
+    assert stats["buckets"] == {"<=1": 1, "<=2": 1, "<=4": 1, ">4": 1}
+    assert stats["count"] == 4
+    assert stats["mean"] == pytest.approx(3.75)
@@ -0,0 +1,58 @@
+from ragoo.vectorestore.embedding_cache import EmbeddingCache, content_hash
+
+
+def test_content_hash_is_sha256():
+    assert content_hash("abc") == (
+        "ba7816bf8f01cfea414140de5dae2223b00361a396177a9cb410ff61f20015ad"
+    )
+
+
+def test_cache_round_trip_and_counters(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite3"))
+    assert cache.get_many("m", ["a", "b"]) == [None, None]
+
+    cache.put_many("m", ["a"], [[0.5, 1.0]])
+
+    assert cache.get_many("m", ["a", "b"]) == [[0.5, 1.0], None]
+    assert cache.get_many("other-model", ["a"]) == [None]
+    stats = cache.stats()
+    assert stats["memory_hits"] == 1 and stats["misses"] == 4
+
+
+def test_cache_persists_to_disk(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = EmbeddingCache(path)
+    cache.put_many("m", ["a"], [[0.25]])
+    cache.close()
+
+    reopened = EmbeddingCache(path)
+    assert reopened.get_many("m", ["a"]) == [[0.25]]
+    assert reopened.stats()["disk_hits"] == 1
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    cache = EmbeddingCache(
+        str(tmp_path / "cache.sqlite3"), max_entries=10, memory_size=0
+    )
+    for i in range(10):
+        cache.put_many("m", [f"t{i}"], [[float(i)]])
+    cache.get_many("m", ["t0"])  # refresh the oldest entry
+
+    cache.put_many("m", ["t10"], [[10.0]])
+
+    assert cache.stats()["disk_entries"] <= 10
+    assert cache.get_many("m", ["t0"]) == [[0.0]]
+    assert cache.get_many("m", ["t1"]) == [None]
+
+
+def test_disk_hits_write_their_use_time_in_batches(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = EmbeddingCache(path, memory_size=0, touch_batch=2)
+    cache.put_many("m", ["a", "b"], [[1.0], [2.0]])
+    changes = cache._conn.total_changes
+
+    cache.get_many("m", ["a"])
+    assert cache._conn.total_changes == changes
+
+    cache.get_many("m", ["b"])
+    assert cache._conn.total_changes == changes + 2
@@ -0,0 +1,107 @@
+import pytest
+from chromadb.api.types import validate_where
+
+from ragoo.core.config import settings
+from ragoo.vectorestore.base import check_where, retrieval_filters
+from ragoo.vectorestore.chroma_handler import ChromaHandler
+from tests.conftest import FakeEmbeddingClient
+
+PAGES = [
+    ("pump.pdf", 1, "pump priming steps"),
+    ("pump.pdf", 2, "replace the pump seal"),
+    ("pump.pdf", 3, "pump error code reset"),
+    ("fan.pdf", 1, "fan bearing care for the pump room"),
+    ("fan.pdf", 2, "fan error code reset"),
+]
+
+
+@pytest.fixture(params=["chroma", "quantized", "memmap"])
+def store(request, tmp_path, monkeypatch, make_memmap_store):
+    monkeypatch.setattr(settings, "MMR_ENABLED", False)
+    if request.param == "memmap":
+        store = make_memmap_store()
+    else:
+        monkeypatch.setattr(settings, "CHROMA_PERSIST_DIR", str(tmp_path / "chroma"))
+        monkeypatch.setattr(settings, "CHROMA_COLLECTION_NAME", "filtered")
+        if request.param == "quantized":
+            monkeypatch.setattr(settings, "QUANTIZED_TIER", "int8")
+        store = ChromaHandler()
+        store.embedding_function.client = FakeEmbeddingClient()
+    store.add_documents(
+        [text for _, _, text in PAGES],
+        [{"source": source, "page": page, "lang": "en"} for source, page, _ in PAGES],
+    )
+    return store
+
+
+@pytest.mark.parametrize("mode", ["vector", "lexical", "hybrid"])
+def test_filters_restrict_every_retrieval_mode(store, mode):
+    results = store.query(
+        "pump error code reset",
+        k=3,
+        mode=mode,
+        **retrieval_filters(sources=["fan.pdf"], page_from=2),
+    )
+
+    assert [r["content"] for r in results] == ["fan error code reset"]
+
+
+def test_page_range_and_metadata_filters(store):
+    filters = retrieval_filters(
+        sources=["pump.pdf", "fan.pdf"],
+        page_from=2,
+        page_to=3,
+        where={"$or": [{"source": "fan.pdf"}, {"page": {"$ne": 2}}]},
+        where_document={"$contains": "reset"},
+    )
+
+    results = store.query("pump", k=5, mode="vector", **filters)
+
+    assert sorted(r["content"] for r in results) == [
+        "fan error code reset",
+        "pump error code reset",
+    ]
+    assert (
+        store.query("pump", k=5, mode="vector", where={"lang": {"$in": ["de", "fr"]}})
+        == []
+    )
+
+
+def test_malformed_filters_are_rejected():
+    with pytest.raises(ValueError):
+        retrieval_filters(where={"page": {"$between": [1, 2]}})
+    with pytest.raises(ValueError):
+        retrieval_filters(where_document={"$regex": 1})
+    assert retrieval_filters() == {}
+    assert retrieval_filters(sources=["a.pdf"]) == {"where": {"source": "a.pdf"}}
+    both = {"$and": [{"source": "a.pdf"}, {"page": {"$gte": 1}}]}
+    assert retrieval_filters(where=both) == {"where": both}
+
+
+@pytest.mark.parametrize(
+    "where",
+    [
+        {"$and": [{"source": "a.pdf"}]},
+        {"source": ["a.pdf", "b.pdf"]},
+        {"source": "a.pdf", "page": 3},
+        {"source": {"$in": []}},
+        {"source": {"$in": ["a.pdf", 3]}},
+        {"page": {"$gt": "2"}},
+        {"$or": []},
+    ],
+)
+def test_filters_chroma_rejects_are_rejected_up_front(where):
+    with pytest.raises(ValueError):
+        validate_where(where)
+    with pytest.raises(ValueError):
+        check_where(where)
+
+
+def test_invalid_where_is_a_bad_request(auth_client, fake_rag_service):
+    for where in ['{"$and": [{"source": "a.pdf"}]}', '{"source": ["a.pdf"]}']:
+        for stream in (False, True):
+            response = auth_client.post(
+                "/rag/query",
+                params={"query": "pump", "where": where, "stream": stream},
+            )
+            assert response.status_code == 400
@@ -0,0 +1,191 @@
+import json
+from datetime import datetime, timedelta
+
+from ragoo.database import models
+from ragoo.services.ingestion_service import IngestionQueue
+from ragoo.services.pdf_extraction import iter_pdf_pages
+from tests.conftest import TestingSessionLocal
+from tests.test_pdf_extraction import make_pdf
+
+
+class FakeRAGService:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.batches = []
+
+    def add_documents(self, documents):
+        if self.fail:
+            raise RuntimeError("embedding backend down")
+        self.batches.append(documents)
+        return {"ids": [], "new": len(documents), "skipped": 0}
+
+
+class FakePDFRAGService(FakeRAGService):
+    """One chunk per page; records the job's progress as each batch arrives"""
+
+    def __init__(self, source):
+        super().__init__()
+        self.source = source
+        self.progress = []
+
+    def iter_pdf_chunks(self, path):
+        return ((text, {"page": n}) for n, text in iter_pdf_pages(path))
+
+    def add_documents(self, documents):
+        with TestingSessionLocal() as db:
+            job = db.query(models.IngestionJob).filter_by(source=self.source).one()
+            self.progress.append((job.status, job.pages_done, job.pages_total))
+        return super().add_documents(documents)
+
+
+def make_queue(tmp_path, rag_service):
+    queue = IngestionQueue(rag_service, session_factory=TestingSessionLocal)
+    queue.spool_dir = str(tmp_path)
+    queue.batch_size = 2
+    return queue
+
+
+def wait(queue):
+    queue._executor.shutdown(wait=True)
+
+
+def test_documents_job_reports_progress(test_db, tmp_path):
+    rag_service = FakeRAGService()
+    queue = make_queue(tmp_path, rag_service)
+
+    job_id = queue.submit_documents([(f"doc {i}", {"source": "s"}) for i in range(5)])
+    wait(queue)
+
+    job = queue.get(job_id)
+    assert job.status == "completed"
+    assert (job.chunks_done, job.chunks_total, job.new_count) == (5, 5, 5)
+    assert [len(batch) for batch in rag_service.batches] == [2, 2, 1]
+    assert list(tmp_path.iterdir()) == []  # spooled payload removed
+
+
+def test_pdf_job_reports_pages_while_running(test_db, tmp_path):
+    path = tmp_path / "progress.pdf"
+    make_pdf(str(path), 4)
+    rag_service = FakePDFRAGService("progress.pdf")
+    queue = make_queue(tmp_path, rag_service)
+    queue.batch_size = 1
+
+    job_id = queue.submit_pdf(str(path), "progress.pdf")
+    wait(queue)
+
+    assert rag_service.progress == [("running", n, 4) for n in range(4)]
+    job = queue.get(job_id)
+    assert job.status == "completed"
+    assert (job.pages_done, job.pages_total, job.chunks_total) == (4, 4, 4)
+
+
+def test_failed_job_records_error(test_db, tmp_path):
+    queue = make_queue(tmp_path, FakeRAGService(fail=True))
+
+    job_id = queue.submit_documents([("doc", {"source": "s"})])
+    wait(queue)
+
+    job = queue.get(job_id)
+    assert job.status == "failed"
+    assert "embedding backend down" in job.error
+    assert list(tmp_path.iterdir()) == []  # failed jobs are not retried
+
+
+def test_resume_requeues_interrupted_jobs(test_db, tmp_path):
+    path = tmp_path / "interrupted.json"
+    path.write_text(json.dumps([["doc", {"source": "s"}]]))
+    with TestingSessionLocal() as db:
+        db.add(
+            models.IngestionJob(
+                id="interrupted", kind="documents", path=str(path), status="running"
+            )
+        )
+        db.commit()
+
+    queue = make_queue(tmp_path, FakeRAGService())
+    assert "interrupted" in queue.resume()
+    wait(queue)
+
+    assert queue.get("interrupted").status == "completed"
+
+
+def test_resume_leaves_jobs_with_a_live_lease(test_db, tmp_path):
+    with TestingSessionLocal() as db:
+        for job_id, expires in [
+            ("live-lease", datetime.utcnow() + timedelta(minutes=5)),
+            ("expired-lease", datetime.utcnow() - timedelta(minutes=5)),
+        ]:
+            path = tmp_path / f"{job_id}.json"
+            path.write_text(json.dumps([["doc", {"source": "s"}]]))
+            db.add(
+                models.IngestionJob(
+                    id=job_id,
+                    kind="documents",
+                    path=str(path),
+                    status="running",
+                    lease_owner="other-host:1:worker",
+                    lease_expires=expires,
+                )
+            )
+        db.commit()
+
+    queue = make_queue(tmp_path, FakeRAGService())
+    resumed = queue.resume()
+    wait(queue)
+
+    assert "expired-lease" in resumed and "live-lease" not in resumed
+    assert queue.get("expired-lease").status == "completed"
+    live = queue.get("live-lease")
+    assert (live.status, live.lease_owner) == ("running", "other-host:1:worker")
+    assert (tmp_path / "live-lease.json").exists()
+
+
+def test_job_taken_over_by_another_worker_stops(test_db, tmp_path):
+    class TakenOver(FakeRAGService):
+        def add_documents(self, documents):
+            # This worker stalled past its lease; another one resumed the job
+            with TestingSessionLocal() as db:
+                job = db.query(models.IngestionJob).filter_by(owner="stalled").one()
+                job.lease_owner = "other-host:1:worker"
+                db.commit()
+            return super().add_documents(documents)
+
+    rag_service = TakenOver()
+    queue = make_queue(tmp_path, rag_service)
+
+    job_id = queue.submit_documents(
+        [(f"doc {i}", {"source": "s"}) for i in range(5)], owner="stalled"
+    )
+    wait(queue)
+
+    job = queue.get(job_id)
+    assert len(rag_service.batches) == 1
+    assert (job.status, job.chunks_done) == ("running", 0)
+    assert len(list(tmp_path.iterdir())) == 1  # the payload is left to the new owner
+
+
+def test_job_failing_after_takeover_is_left_to_the_new_owner(test_db, tmp_path):
+    class TakenOverThenFails(FakeRAGService):
+        def add_documents(self, documents):
+            with TestingSessionLocal() as db:
+                job = (
+                    db.query(models.IngestionJob)
+                    .filter_by(owner="stalled-failing")
+                    .one()
+                )
+                job.lease_owner = "other-host:1:worker"
+                db.commit()
+            raise RuntimeError("embedding backend down")
+
+    queue = make_queue(tmp_path, TakenOverThenFails())
+
+    job_id = queue.submit_documents([("doc", {"source": "s"})], owner="stalled-failing")
+    wait(queue)
+
+    job = queue.get(job_id)
+    assert (job.status, job.error, job.lease_owner) == (
+        "running",
+        None,
+        "other-host:1:worker",
+    )
+    assert len(list(tmp_path.iterdir())) == 1  # the payload is left to the new owner
@@ -0,0 +1,122 @@
+import warnings
+
+from ragoo.vectorestore.lexical_index import (
+    LexicalIndex,
+    reciprocal_rank_fusion,
+    tokenize,
+)
+
+
+def test_tokenize_keeps_codes_whole_and_split():
+    assert tokenize("Error E-1043 on pump") == [
+        "error",
+        "e-1043",
+        "e",
+        "1043",
+        "on",
+        "pump",
+    ]
+
+
+def test_bm25_ranks_exact_code_first(tmp_path):
+    index = LexicalIndex(str(tmp_path / "index.bm25"))
+    index.add(
+        ["a", "b", "c"],
+        [
+            "Replace the filter when the pump shows error E-1043.",
+            "The pump manual covers errors and warnings in general.",
+            "Unrelated text about the cooling fan.",
+        ],
+    )
+
+    results = index.search("what does E-1043 mean", k=2)
+
+    assert [chunk_id for chunk_id, _ in results][0] == "a"
+    assert "c" not in [chunk_id for chunk_id, _ in results]
+    assert index.search("nothing matches", k=2) == []
+
+
+def test_index_survives_reload_from_journal_and_snapshot(tmp_path):
+    path = str(tmp_path / "index.bm25")
+    index = LexicalIndex(path, compact_every=2)
+    index.add(["a", "b"], ["alpha part AX-7", "beta part"])  # compacted
+    index.add(["c"], ["gamma part AX-7"])  # journal only
+    index.add(["a"], ["alpha part AX-7"])  # already indexed
+
+    reloaded = LexicalIndex(path)
+
+    assert len(reloaded) == 3
+    assert {i for i, _ in reloaded.search("ax-7", k=5)} == {"a", "c"}
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    fused = reciprocal_rank_fusion([["x", "y", "z"], ["y", "w"]])
+
+    assert fused[0][0] == "y"
+    assert {item for item, _ in fused} == {"x", "y", "z", "w"}
+
+
+def test_lexical_query_needs_no_embedding(fake_chroma_client):
+    fake_chroma_client.add_documents(
+        documents=["valve code V-220 leaks", "general maintenance notes"],
+        metadata=[{"source": "a.pdf"}, {"source": "b.pdf"}],
+    )
+    embedder = fake_chroma_client.embedding_function.client
+    embedded = len(embedder.embedded)
+
+    results = fake_chroma_client.query("V-220", k=1, mode="lexical")
+
+    assert results[0]["metadata"]["source"] == "a.pdf"
+    assert len(embedder.embedded) == embedded
+
+
+def test_hybrid_query_fuses_both_retrievers(fake_chroma_client):
+    fake_chroma_client.add_documents(
+        documents=["valve code V-220 leaks", "general maintenance notes"],
+        metadata=[{"source": "a.pdf"}, {"source": "b.pdf"}],
+    )
+
+    results = fake_chroma_client.query("V-220", k=2, mode="hybrid")
+
+    assert results[0]["metadata"]["source"] == "a.pdf"
+    assert len(results) == 2
+
+
+def test_lexical_index_rebuilt_when_out_of_sync(fake_chroma_client):
+    from ragoo.vectorestore.chroma_handler import ChromaHandler
+
+    fake_chroma_client.collection.add(
+        ids=["external"],
+        documents=["added by a batch script"],
+        embeddings=[[1.0] * 26],
+        metadatas=[{"source": "script"}],
+    )
+
+    handler = ChromaHandler()
+
+    assert "external" in handler.lexical_index
+
+
+def test_removed_documents_stay_removed_after_compaction(tmp_path):
+    path = str(tmp_path / "index.bm25")
+    index = LexicalIndex(path, compact_every=100)
+    index.add(["a", "b", "c"], ["pump seal", "pump motor", "fan blade"])
+    index.remove(["a", "missing"])
+
+    assert [i for i, _ in index.search("pump", k=5)] == ["b"]
+    assert len(LexicalIndex(path)) == 2  # replayed from the journal
+
+    index.flush()  # purges the tombstone
+    reloaded = LexicalIndex(path)
+    assert reloaded.stats()["tombstones"] == 0
+    assert [i for i, _ in reloaded.search("pump", k=5)] == ["b"]
+    assert [i for i, _ in reloaded.search("blade", k=5)] == ["c"]
+
+
+def test_documents_without_tokens_do_not_break_scoring(tmp_path):
+    index = LexicalIndex(str(tmp_path / "index.bm25"))
+    index.add(["a", "b"], ["", "..."])
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")  # no 0/0 in the length normalisation
+        assert index.search("pump") == []
@@ -0,0 +1,142 @@
+import subprocess
+import sys
+import threading
+
+import numpy as np
+import pytest
+
+from ragoo.core.config import settings
+from tests.conftest import FakeEmbeddingClient
+
+DOCS = [
+    "pump priming steps",
+    "replace the pump seal",
+    "fan bearing care",
+    "filter cleaning guide",
+    "error code reset",
+]
+
+
+def add_manual(store, source="manual.pdf"):
+    return store.add_documents(
+        documents=DOCS,
+        metadata=[{"source": source, "page": i} for i in range(len(DOCS))],
+    )
+
+
+@pytest.mark.parametrize("dtype", ["float16", "int8"])
+def test_vector_search_matches_brute_force(make_memmap_store, monkeypatch, dtype):
+    monkeypatch.setattr(settings, "MMR_ENABLED", False)
+    store = make_memmap_store(dtype=dtype)
+    add_manual(store)
+    query = "pump seal"
+
+    results = store.query(query, k=3, mode="vector")
+
+    vectors = np.array([FakeEmbeddingClient.vector(d) for d in DOCS])
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    q = np.array(FakeEmbeddingClient.vector(query))
+    expected = [DOCS[i] for i in np.argsort(-(vectors @ (q / np.linalg.norm(q))))[:3]]
+    assert [r["content"] for r in results] == expected
+    assert results[0]["metadata"]["source"] == "manual.pdf"
+    assert results[0]["metadata"]["page"] == DOCS.index(expected[0])
+    assert results[0]["distance"] == pytest.approx(
+        1 - float(vectors[DOCS.index(expected[0])] @ (q / np.linalg.norm(q))),
+        abs=0.01,
+    )
+
+
+def test_writes_survive_reopen_and_compaction(make_memmap_store):
+    store = make_memmap_store(compact_every=1_000)
+    ids = add_manual(store)["ids"]
+    store.add_documents(documents=["other text"], metadata=[{"source": "b.pdf"}])
+    store.delete(ids[:2])
+
+    # Journal replay
+    store.close()
+    reopened = make_memmap_store()
+    assert reopened.count() == 4
+    assert set(reopened.source_chunks("manual.pdf")) == set(ids[2:])
+    assert reopened.add_documents(DOCS, [{"source": "manual.pdf"}] * 5)["new"] == 2
+
+    # Snapshot with the deleted rows purged
+    reopened.delete([ids[4]])
+    reopened.flush()
+    assert reopened.stats()["tombstones"] == 0
+    reopened.close()
+    compacted = make_memmap_store()
+    assert compacted.count() == 5
+    assert dict(compacted.iter_stored("documents"))[ids[0]] == DOCS[0]
+    assert {"source": "b.pdf"} in [
+        {k: v for k, v in m.items() if k != "content_hash"}
+        for m in compacted.get_all_metadata()
+    ]
+    assert compacted.query("pump", k=2, mode="lexical")[0]["content"] in DOCS[:2]
+
+
+def test_directory_is_locked_while_open(make_memmap_store):
+    store = make_memmap_store()
+
+    with pytest.raises(RuntimeError, match="single-process"):
+        make_memmap_store()
+    store.close()
+    make_memmap_store()
+
+
+def test_ivf_search_finds_nearest_neighbours(make_memmap_store, monkeypatch):
+    monkeypatch.setattr(settings, "MMR_ENABLED", False)
+    monkeypatch.setattr(settings, "LEXICAL_INDEX_ENABLED", False)
+    monkeypatch.setattr(settings, "MEMMAP_IVF_MIN_TRAIN", 50)
+    monkeypatch.setattr(settings, "MEMMAP_IVF_PROBES", 3)
+    store = make_memmap_store(index="ivf")
+    rng = np.random.default_rng(1)
+    words = ["pump", "seal", "fan", "filter", "valve", "motor", "belt", "gear"]
+    docs = [" ".join(rng.choice(words, size=4)) + f" {i}" for i in range(200)]
+    store.add_documents(docs, [{"source": "s"}] * len(docs))
+
+    assert store.stats()["ivf_lists"] == int(np.sqrt(200))
+    query = "pump pump seal"
+    hits = store.query(query, k=5, mode="vector")
+
+    vectors = np.array([FakeEmbeddingClient.vector(d) for d in docs])
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    q = np.array(FakeEmbeddingClient.vector(query))
+    fifth_best = np.sort(vectors @ (q / np.linalg.norm(q)))[-5]
+    found = [1 - r["distance"] >= fifth_best - 1e-3 for r in hits]
+    assert len(hits) == 5 and sum(found) >= 4
+
+
+def test_concurrent_adds_store_each_chunk_once(make_memmap_store):
+    store = make_memmap_store()
+    both_embedding = threading.Barrier(2, timeout=10)
+    embed = store.embed
+
+    def embed_together(texts):
+        # Both writers are past the existence check before either stores
+        both_embedding.wait()
+        return embed(texts)
+
+    store.embed = embed_together
+    results = []
+    writers = [
+        threading.Thread(target=lambda: results.append(add_manual(store)))
+        for _ in range(2)
+    ]
+    for writer in writers:
+        writer.start()
+    for writer in writers:
+        writer.join()
+
+    assert store.count() == len(DOCS)
+    assert store.stats()["tombstones"] == 0
+    assert sorted(result["new"] for result in results) == [0, len(DOCS)]
+    stored = [chunk_id for chunk_id, _ in store.iter_stored()]
+    assert len(stored) == len(set(stored)) == len(DOCS)
+
+
+def test_importing_the_backend_does_not_load_chroma():
+    check = (
+        "import sys, ragoo.vectorestore.memmap_store; "
+        "assert 'chromadb' not in sys.modules"
+    )
+    subprocess.run([sys.executable, "-c", check], check=True)
@@ -0,0 +1,282 @@
+import asyncio
+import json
+import threading
+import time
+
+import httpx
+import pytest
+import requests
+
+from ragoo.core.config import settings
+from ragoo.services.ollama_service import AsyncOllamaHandler, OllamaEmbeddingClient
+from ragoo.vectorestore.embedding_cache import EmbeddingCache
+
+
+class FakeResponse:
+    def __init__(self, payload, status_code=200):
+        self.payload = payload
+        self.status_code = status_code
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(response=self)
+
+    def json(self):
+        return self.payload
+
+
+class FakeSession:
+    """Embeds each text as [len(text)] and fails the first `failures` calls"""
+
+    def __init__(self, failures=0, status_code=503):
+        self.failures = failures
+        self.status_code = status_code
+        self.batches = []
+
+    def post(self, url, json, timeout):
+        assert url.endswith("/api/embed")
+        assert timeout is not None
+        if self.failures:
+            self.failures -= 1
+            return FakeResponse({}, status_code=self.status_code)
+        self.batches.append(json["input"])
+        return FakeResponse({"embeddings": [[float(len(t))] for t in json["input"]]})
+
+
+def make_client(session, **kwargs):
+    client = OllamaEmbeddingClient(
+        host="http://ollama", model="test", retry_backoff=0, **kwargs
+    )
+    client.session = session
+    return client
+
+
+def test_embed_batches_preserve_order():
+    session = FakeSession()
+    client = make_client(session, batch_size=3, max_workers=2)
+    texts = ["a" * n for n in range(1, 11)]
+
+    embeddings = client.embed(texts)
+
+    assert embeddings == [[float(n)] for n in range(1, 11)]
+    assert sorted(len(batch) for batch in session.batches) == [1, 3, 3, 3]
+
+
+def test_embed_retries_failed_batch():
+    session = FakeSession(failures=2)
+    client = make_client(session, max_retries=3)
+
+    assert client.embed(["abc"]) == [[3.0]]
+
+
+def test_embed_gives_up_after_max_retries():
+    session = FakeSession(failures=5)
+    client = make_client(session, max_retries=1)
+
+    with pytest.raises(RuntimeError):
+        client.embed(["abc"])
+
+
+def test_embed_does_not_retry_client_errors():
+    session = FakeSession(failures=1, status_code=404)
+    client = make_client(session, max_retries=3)
+
+    with pytest.raises(RuntimeError):
+        client.embed(["abc"])
+    assert session.failures == 0 and session.batches == []
+
+
+def run_with_transport(handler, handler_func, coro_factory):
+    async def runner():
+        handler._client = httpx.AsyncClient(
+            base_url="http://ollama", transport=httpx.MockTransport(handler_func)
+        )
+        handler._loop = asyncio.get_running_loop()
+        try:
+            return await coro_factory()
+        finally:
+            await handler.aclose()
+
+    return asyncio.run(runner())
+
+
+def test_async_embed_batches_preserve_order():
+    def embed(request):
+        texts = json.loads(request.content)["input"]
+        return httpx.Response(200, json={"embeddings": [[len(t)] for t in texts]})
+
+    handler = AsyncOllamaHandler()
+    handler.batcher.max_batch_size = 2
+    texts = ["a" * n for n in range(1, 6)]
+
+    embeddings = run_with_transport(handler, embed, lambda: handler.embed(texts))
+
+    assert embeddings == [[n] for n in range(1, 6)]
+    assert handler.batcher.stats()["batches"] == 3
+
+
+def test_async_embed_merges_concurrent_callers():
+    requests = []
+
+    def embed(request):
+        texts = json.loads(request.content)["input"]
+        requests.append(texts)
+        return httpx.Response(200, json={"embeddings": [[len(t)] for t in texts]})
+
+    handler = AsyncOllamaHandler()
+
+    async def concurrent():
+        return await asyncio.gather(*(handler.embed([q]) for q in ["a", "bb", "a"]))
+
+    results = run_with_transport(handler, embed, concurrent)
+
+    assert results == [[[1]], [[2]], [[1]]]
+    assert requests == [["a", "bb"]]
+    stats = handler.batcher.stats()
+    assert stats["batch_size"]["buckets"]["<=2"] == 1
+    assert stats["queue_depth"] == 0
+
+
+def test_async_generate_completion_sends_options():
+    def generate(request):
+        data = json.loads(request.content)
+        assert data["options"] == {"temperature": 0.1, "num_predict": 50}
+        return httpx.Response(200, json={"response": "hello", "done": True})
+
+    handler = AsyncOllamaHandler()
+    answer = run_with_transport(
+        handler,
+        generate,
+        lambda: handler.generate_completion("hi", temperature=0.1, max_tokens=50),
+    )
+
+    assert answer == "hello"
+
+
+def test_async_stream_completion_yields_chunks():
+    lines = [
+        {"response": "Hel", "done": False},
+        {"response": "lo", "done": False},
+        {"response": "", "done": True, "eval_count": 2, "prompt_eval_count": 7},
+    ]
+
+    def generate(request):
+        assert json.loads(request.content)["stream"] is True
+        body = "\n".join(json.dumps(line) for line in lines) + "\n"
+        return httpx.Response(200, content=body.encode())
+
+    handler = AsyncOllamaHandler()
+
+    async def collect():
+        return [chunk async for chunk in handler.stream_completion("hi")]
+
+    chunks = run_with_transport(handler, generate, collect)
+
+    assert "".join(c["response"] for c in chunks) == "Hello"
+    assert chunks[-1]["done"] and chunks[-1]["eval_count"] == 2
+
+
+def test_embed_only_sends_cache_misses(tmp_path):
+    session = FakeSession()
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite3"))
+    cache.put_many("test", ["aa"], [[99.0]])
+    client = make_client(session, cache=cache)
+
+    embeddings = client.embed(["aa", "bbb", "bbb"])
+
+    assert embeddings == [[99.0], [3.0], [3.0]]
+    assert session.batches == [["bbb"]]
+
+
+def test_warm_up_loads_both_models_with_keep_alive(monkeypatch):
+    monkeypatch.setattr(settings, "OLLAMA_KEEP_ALIVE", "1h")
+    loaded = {}
+
+    def load(request):
+        data = json.loads(request.content)
+        loaded[request.url.path] = data
+        if request.url.path == "/api/embed":
+            return httpx.Response(200, json={"embeddings": [[0.0]]})
+        return httpx.Response(200, json={"response": "", "done": True})
+
+    handler = AsyncOllamaHandler(model="chat", embedding_model="embed")
+    timings = run_with_transport(handler, load, handler.warm_up)
+
+    assert set(timings) == {"chat", "embed"}
+    assert loaded["/api/generate"] == {
+        "model": "chat",
+        "stream": False,
+        "keep_alive": "1h",
+    }
+    assert loaded["/api/embed"]["keep_alive"] == "1h"
+
+
+def test_client_from_a_previous_loop_is_closed():
+    handler = AsyncOllamaHandler()
+
+    async def first():
+        return handler.client
+
+    async def second():
+        client = handler.client
+        await asyncio.sleep(0)
+        return client
+
+    old = asyncio.run(first())
+    new = asyncio.run(second())
+
+    assert new is not old
+    assert old.is_closed
+    assert not handler._closing
+    asyncio.run(handler.aclose())
+
+
+def test_async_embed_coalesces_texts_differing_in_whitespace():
+    requests = []
+
+    def embed(request):
+        texts = json.loads(request.content)["input"]
+        requests.append(texts)
+        return httpx.Response(200, json={"embeddings": [[len(t)] for t in texts]})
+
+    handler = AsyncOllamaHandler()
+
+    async def concurrent():
+        return await asyncio.gather(
+            handler.embed(["pump  seal"]), handler.embed([" pump seal\n"])
+        )
+
+    first, second = run_with_transport(handler, embed, concurrent)
+
+    assert first == second
+    assert len(requests) == 1
+
+
+def test_async_embed_reads_the_disk_cache_off_the_loop(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite3"), memory_size=1)
+    cache.put_many("embed", ["on disk"], [[1.0]])
+    cache.put_many("embed", ["in memory"], [[2.0]])  # evicts "on disk" from memory
+    handler = AsyncOllamaHandler(embedding_model="embed", embedding_cache=cache)
+    requests = []
+
+    def embed(request):
+        requests.append(request)
+        return httpx.Response(500)
+
+    async def while_sqlite_is_busy():
+        # An ingestion thread holding the connection for a slow write
+        cache._lock.acquire()
+        threading.Timer(0.3, cache._lock.release).start()
+        started = time.perf_counter()
+        from_disk = asyncio.create_task(handler.embed(["on disk"]))
+        from_memory = await handler.embed(["in memory"])
+        memory_ms = (time.perf_counter() - started) * 1000
+        return from_memory, memory_ms, await from_disk
+
+    from_memory, memory_ms, from_disk = run_with_transport(
+        handler, embed, while_sqlite_is_busy
+    )
+
+    assert from_memory == [[2.0]] and memory_ms < 100
+    assert from_disk == [[1.0]]
+    assert requests == []
@@ -0,0 +1,30 @@
+import pymupdf
+
+from ragoo.services.pdf_extraction import (
+    iter_pdf_pages,
+    iter_pdf_stream_pages,
+    shutdown_pool,
+)
+
+
+def make_pdf(path, page_count):
+    pdf_document = pymupdf.open()
+    for n in range(page_count):
+        page = pdf_document.new_page()
+        page.insert_text((72, 72), f"Page {n + 1} body")
+    pdf_document.save(path)
+    pdf_document.close()
+
+
+def test_parallel_extraction_keeps_page_order(tmp_path):
+    path = str(tmp_path / "doc.pdf")
+    make_pdf(path, 7)
+    try:
+        pages = list(iter_pdf_pages(path, pages_per_task=2))
+    finally:
+        shutdown_pool()
+
+    assert [n for n, _ in pages] == list(range(1, 8))
+    assert all(f"Page {n} body" in text for n, text in pages)
+    with open(path, "rb") as f:
+        assert list(iter_pdf_stream_pages(f.read())) == pages
@@ -0,0 +1,154 @@
+import shutil
+
+import numpy as np
+import pytest
+
+from ragoo.core.config import settings
+from ragoo.services.ollama_service import OllamaEmbeddingClient
+from ragoo.vectorestore.chroma_handler import ChromaHandler
+from ragoo.vectorestore import quantized_index
+from ragoo.vectorestore.quantized_index import QuantizedIndex
+from tests.conftest import FakeEmbeddingClient
+
+
+def clustered(n, dim=64, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(20, dim))
+    return centers[rng.integers(20, size=n)] + 0.5 * rng.normal(size=(n, dim))
+
+
+def recall_at(index, vectors, queries, k):
+    normed = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    truth = np.argsort(-(queries @ normed.T), axis=1)[:, :k]
+    hits = index.search(queries.tolist(), k)
+    return np.mean(
+        [
+            len({int(i) for i, _ in ranked} & set(expected.tolist())) / k
+            for ranked, expected in zip(hits, truth)
+        ]
+    )
+
+
+@pytest.mark.parametrize(
+    "quantization,dimensions,factor",
+    [("int8", 0, 0), ("binary", 0, 0), ("int8", 32, 8)],
+)
+def test_rescored_search_recall(tmp_path, quantization, dimensions, factor):
+    vectors = clustered(2000)
+    index = QuantizedIndex(
+        str(tmp_path / "q"),
+        quantization=quantization,
+        dimensions=dimensions,
+        rescore_factor=factor,
+    )
+    index.add([str(i) for i in range(len(vectors))], vectors.tolist())
+    # Queries near stored chunks, as real questions are near their answers
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.choice(len(vectors), 20)] + 0.3 * rng.normal(size=(20, 64))
+
+    assert recall_at(index, vectors, queries, 10) >= 0.9
+    ranked = index.search(queries[:1].tolist(), 3)[0]
+    # Similarities come from the full-precision rescoring
+    best = vectors[int(ranked[0][0])]
+    assert ranked[0][1] == pytest.approx(
+        float(best @ queries[0] / np.linalg.norm(best) / np.linalg.norm(queries[0])),
+        abs=1e-5,
+    )
+    expected_bytes = {"int8": 64 + 4, "binary": 8}[quantization]
+    if dimensions:
+        expected_bytes = dimensions + 4
+    stats = index.stats()
+    assert stats["bytes_per_vector"] == expected_bytes
+    assert stats["id_map_bytes_per_vector"] > expected_bytes
+    assert stats["memory_per_million_mb"] > stats["code_mb_per_million"]
+
+
+def test_deletes_compaction_and_reopen(tmp_path):
+    vectors = clustered(3000)
+    path = str(tmp_path / "q")
+    index = QuantizedIndex(path, quantization="binary")
+    ids = [str(i) for i in range(len(vectors))]
+    index.add(ids, vectors.tolist())
+    index.remove(ids[:1000])
+    assert len(index) == 2000
+
+    reopened = QuantizedIndex(path, quantization="binary")
+    assert len(reopened) == 2000
+    reopened.remove(ids[1000:2000])  # most rows dead: compacts
+    assert reopened.stats()["tombstones"] == 0
+    assert reopened.generation == 1
+
+    compacted = QuantizedIndex(path, quantization="binary")
+    assert len(compacted) == 1000
+    top = compacted.search([vectors[2500].tolist()], 1)[0]
+    assert top[0][0] == "2500"
+
+    # Codes written with other settings are re-encoded from the full vectors
+    reencoded = QuantizedIndex(path, quantization="int8")
+    assert len(reencoded) == 1000 and reencoded.stats()["code_dimensions"] == 64
+    assert reencoded.search([vectors[2500].tolist()], 1)[0][0][0] == "2500"
+    assert QuantizedIndex.from_path(path).quantization == "int8"
+
+
+@pytest.mark.parametrize("quantization", ["int8", "binary"])
+def test_blocked_scan_matches_a_single_pass(tmp_path, monkeypatch, quantization):
+    vectors = clustered(1500)
+    index = QuantizedIndex(str(tmp_path / "q"), quantization=quantization)
+    ids = [str(i) for i in range(len(vectors))]
+    index.add(ids, vectors.tolist())
+    index.remove(ids[::7])
+    queries = vectors[:5].tolist()
+    subset = ids[200:1200]
+    whole, filtered = index.search(queries, 5), index.search(queries, 5, subset)
+
+    monkeypatch.setattr(quantized_index, "SEARCH_BLOCK_ROWS", 100)
+
+    assert index.search(queries, 5) == whole
+    assert index.search(queries, 5, subset) == filtered
+    assert not any(i in ids[::7] for ranked in whole for i, _ in ranked)
+
+
+def open_handler():
+    handler = ChromaHandler()
+    handler.embedding_function.client = FakeEmbeddingClient()
+    return handler
+
+
+def test_chroma_dense_search_goes_through_the_tier(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "CHROMA_PERSIST_DIR", str(tmp_path / "chroma"))
+    monkeypatch.setattr(settings, "CHROMA_COLLECTION_NAME", "quantized")
+    monkeypatch.setattr(settings, "QUANTIZED_TIER", "int8")
+    monkeypatch.setattr(settings, "MMR_ENABLED", True)
+    handler = open_handler()
+    docs = ["pump priming steps", "fan bearing care", "filter cleaning guide"]
+    ids = handler.add_documents(docs, [{"source": "m.pdf"}] * 3)["ids"]
+    handler.delete(ids[2:])
+
+    results = handler.query("pump", k=2, mode="vector")
+
+    assert [r["content"] for r in results][0] == "pump priming steps"
+    assert len(results) == 2
+    assert handler.stats()["quantized_tier"]["vectors"] == 2
+    # The tier owns the vectors; Chroma only keeps placeholders
+    stored = handler.collection.get(include=["embeddings"])["embeddings"]
+    assert [len(embedding) for embedding in stored] == [1, 1]
+
+    # Turning the tier off moves the vectors back into Chroma, and on again
+    # into the tier, without embedding anything
+    monkeypatch.setattr(settings, "QUANTIZED_TIER", "")
+    plain = ChromaHandler()
+    stored = plain.collection.get(include=["embeddings"])["embeddings"]
+    assert [len(embedding) for embedding in stored] == [26, 26]
+    monkeypatch.setattr(settings, "QUANTIZED_TIER", "binary")
+    handler = open_handler()
+    assert handler.stats()["quantized_tier"]["vectors"] == 2
+    assert handler.query("pump", k=1, mode="vector")[0]["content"] == docs[0]
+
+    # Lost tier files are rebuilt by re-embedding the stored documents
+    shutil.rmtree(handler.quantized_index.path)
+    monkeypatch.setattr(
+        OllamaEmbeddingClient,
+        "embed",
+        lambda self, texts: FakeEmbeddingClient().embed(texts),
+    )
+    assert ChromaHandler().stats()["quantized_tier"]["vectors"] == 2
@@ -1 +1,302 @@
-# Test rag routes
\ No newline at end of file
+# Test rag routes
+import asyncio
+import json
+import os
+from pathlib import Path
+
+import pytest
+from fastapi import HTTPException, Request
+
+from ragoo.core.config import settings
+from ragoo.services.admission import AdmissionController, AdmissionRejected
+from ragoo.services.answer_cache import AnswerCache
+from ragoo.database import models
+from ragoo.routes.rag_routes import spool_upload
+from tests.conftest import FakeEmbeddingClient, TestingSessionLocal
+
+
+@pytest.fixture
+def spool_dir(fake_ingestion_queue):
+    os.makedirs(fake_ingestion_queue.spool_dir)
+    return Path(fake_ingestion_queue.spool_dir)
+
+
+def test_upload_spools_pdf_and_queues_job(
+    auth_client, spool_dir, fake_ingestion_queue, monkeypatch
+):
+    submitted = []
+    monkeypatch.setattr(
+        fake_ingestion_queue,
+        "submit_pdf",
+        lambda path, filename, replace, owner: submitted.append((path, filename, owner))
+        or "job-1",
+    )
+
+    response = auth_client.post(
+        "/rag/upload",
+        files={"file": ("manual.pdf", b"%PDF-1.4 body", "application/pdf")},
+    )
+
+    assert response.status_code == 202
+    assert response.json()["job_id"] == "job-1"
+    ((path, filename, owner),) = submitted
+    assert (filename, owner) == ("manual.pdf", "testuser")
+    with open(path, "rb") as f:
+        assert f.read() == b"%PDF-1.4 body"
+
+
+def test_upload_rejects_oversized_file(auth_client, spool_dir, monkeypatch):
+    monkeypatch.setattr(settings, "MAX_UPLOAD_BYTES", 4)
+
+    response = auth_client.post(
+        "/rag/upload",
+        files={"file": ("big.pdf", b"%PDF-1.4 body", "application/pdf")},
+    )
+
+    assert response.status_code == 413
+    assert list(spool_dir.iterdir()) == []
+
+
+def test_upload_rejects_non_pdf(auth_client, spool_dir):
+    response = auth_client.post(
+        "/rag/upload", files={"file": ("notes.txt", b"hello", "text/plain")}
+    )
+
+    assert response.status_code == 400
+
+
+def upload_request(chunks: list[bytes], headers: dict):
+    """A Request whose body arrives in the given chunks, recording how many
+    of them were read"""
+    received = []
+    pending = iter(chunks)
+
+    async def receive():
+        chunk = next(pending, None)
+        if chunk is None:
+            return {"type": "http.request", "body": b"", "more_body": False}
+        received.append(chunk)
+        return {"type": "http.request", "body": chunk, "more_body": True}
+
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "path": "/rag/upload",
+        "headers": [(k.encode(), v.encode()) for k, v in headers.items()],
+    }
+    return Request(scope, receive), received
+
+
+def test_upload_stops_reading_once_over_the_limit(spool_dir, fake_ingestion_queue):
+    boundary = "upload-boundary"
+    headers = {"content-type": f"multipart/form-data; boundary={boundary}"}
+    chunks = [
+        f"--{boundary}\r\n"
+        'Content-Disposition: form-data; name="file"; filename="big.pdf"\r\n'
+        "Content-Type: application/pdf\r\n\r\n".encode(),
+        *[b"x" * 1024] * 100,
+        f"\r\n--{boundary}--\r\n".encode(),
+    ]
+
+    request, received = upload_request(chunks, headers)
+    with pytest.raises(HTTPException) as raised:
+        asyncio.run(spool_upload(request, 2048, fake_ingestion_queue))
+    assert raised.value.status_code == 413
+    assert len(received) == 4  # the part headers and three 1 KiB chunks
+    assert list(spool_dir.iterdir()) == []
+
+    # A declared length over the limit is refused before reading anything
+    request, received = upload_request(
+        chunks, {**headers, "content-length": str(10**9)}
+    )
+    with pytest.raises(HTTPException) as raised:
+        asyncio.run(spool_upload(request, 2048, fake_ingestion_queue))
+    assert raised.value.status_code == 413
+    assert received == []
+
+
+class FakeAsyncLLM:
+    """Async LLM stand-in recording embedding calls"""
+
+    embedding_cache = None
+
+    def __init__(self):
+        self.embed_calls = []
+
+    async def embed(self, texts):
+        self.embed_calls.append(list(texts))
+        return [FakeEmbeddingClient.vector(text) for text in texts]
+
+    async def generate_completion(self, prompt, temperature, max_tokens):
+        if "explode" in prompt:
+            raise RuntimeError("model crashed")
+        return "answer"
+
+
+def test_batch_query_embeds_once_and_streams_every_result(
+    auth_client, fake_rag_service, monkeypatch
+):
+    llm = FakeAsyncLLM()
+    monkeypatch.setattr(fake_rag_service, "async_llm", llm)
+    monkeypatch.setattr(fake_rag_service, "answer_cache", None)
+    fake_rag_service.add_documents(
+        [("pump priming steps", {"source": "a.pdf"}), ("fan care", {"source": "b.pdf"})]
+    )
+    queries = ["pump priming", "fan", "explode"]
+
+    response = auth_client.post(
+        "/rag/query/batch", json={"queries": queries, "mode": "hybrid"}
+    )
+
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    by_index = {line["index"]: line for line in lines}
+    assert sorted(by_index) == [0, 1, 2]
+    assert by_index[0]["answer"] == "answer"
+    assert "a.pdf" in by_index[0]["source"]
+    assert by_index[2]["error"] == "model crashed"
+    assert llm.embed_calls == [queries]
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_generation_over_capacity_gets_429(
+    auth_client, fake_rag_service, monkeypatch, stream
+):
+    monkeypatch.setattr(fake_rag_service, "async_llm", FakeAsyncLLM())
+    monkeypatch.setattr(fake_rag_service, "answer_cache", None)
+    admission = AdmissionController(max_concurrency=1, max_queue=0, max_wait=1)
+    admission._start("someone else")  # the only slot is taken
+    monkeypatch.setattr(fake_rag_service, "admission", admission)
+
+    response = auth_client.post(
+        "/rag/query", params={"query": "pump", "mode": "lexical", "stream": stream}
+    )
+
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+    assert admission.stats()["rejected"]["queue_full"] == 1
+
+
+def test_coalesced_queries_are_admitted_per_user(fake_rag_service, monkeypatch):
+    monkeypatch.setattr(fake_rag_service, "async_llm", FakeAsyncLLM())
+    monkeypatch.setattr(fake_rag_service, "answer_cache", None)
+    admission = AdmissionController(
+        max_concurrency=2, max_queue=10, max_wait=0.05, user_max_concurrency=1
+    )
+    admission._start("alice")  # alice is at her quota, bob is not
+    monkeypatch.setattr(fake_rag_service, "admission", admission)
+    fake_rag_service.add_documents([("pump priming steps", {"source": "a.pdf"})])
+
+    async def ask_together():
+        return await asyncio.gather(
+            *(
+                fake_rag_service.aprocess_query("pump", "lexical", user)
+                for user in ("alice", "bob")
+            ),
+            return_exceptions=True,
+        )
+
+    alice, bob = asyncio.run(ask_together())
+
+    assert isinstance(alice, AdmissionRejected)
+    assert bob["answer"] == "answer"
+
+
+def test_query_filters_restrict_sources_and_scope_the_cache(
+    auth_client, fake_rag_service, monkeypatch
+):
+    monkeypatch.setattr(fake_rag_service, "async_llm", FakeAsyncLLM())
+    monkeypatch.setattr(fake_rag_service, "answer_cache", AnswerCache())
+    fake_rag_service.add_documents(
+        [
+            ("pump priming steps", {"source": "a.pdf", "page": 1}),
+            ("pump seal guide", {"source": "b.pdf", "page": 7}),
+        ]
+    )
+
+    unfiltered = auth_client.post(
+        "/rag/query", params={"query": "pump", "mode": "lexical"}
+    ).json()
+    filtered = auth_client.post(
+        "/rag/query",
+        params={"query": "pump", "mode": "lexical", "source": "b.pdf", "page_to": 9},
+    ).json()
+
+    assert sorted(unfiltered["source"]) == ["a.pdf", "b.pdf"]
+    assert filtered["source"] == ["b.pdf"] and not filtered["cached"]
+    bad = auth_client.post("/rag/query", params={"query": "pump", "where": "{page"})
+    assert bad.status_code == 400
+
+
+def test_cached_answers_keep_filter_values_exact(
+    auth_client, fake_rag_service, monkeypatch
+):
+    monkeypatch.setattr(fake_rag_service, "async_llm", FakeAsyncLLM())
+    monkeypatch.setattr(fake_rag_service, "answer_cache", AnswerCache())
+    fake_rag_service.add_documents(
+        [
+            ("pump priming steps", {"source": "Manual.pdf"}),
+            ("pump seal guide", {"source": "manual.pdf"}),
+        ]
+    )
+
+    def ask(query, source):
+        return auth_client.post(
+            "/rag/query", params={"query": query, "mode": "lexical", "source": source}
+        ).json()
+
+    assert ask("Pump", "Manual.pdf")["source"] == ["Manual.pdf"]
+    lower = ask("Pump", "manual.pdf")
+    assert lower["source"] == ["manual.pdf"] and not lower["cached"]
+    # The question itself is still normalised
+    assert ask("pump ", "manual.pdf")["cached"]
+
+
+def test_cached_answers_are_only_reused_for_their_retrieval_mode(
+    auth_client, fake_rag_service, monkeypatch
+):
+    monkeypatch.setattr(fake_rag_service, "async_llm", FakeAsyncLLM())
+    monkeypatch.setattr(
+        fake_rag_service, "answer_cache", AnswerCache(semantic_distance=0.5)
+    )
+    fake_rag_service.add_documents([("pump priming steps", {"source": "a.pdf"})])
+
+    def ask(mode):
+        return auth_client.post(
+            "/rag/query", params={"query": "pump", "mode": mode}
+        ).json()
+
+    assert not ask("lexical")["cached"]
+    assert not ask("vector")["cached"]
+    assert ask("lexical")["cached"] and ask("vector")["cached"]
+
+
+def test_jobs_are_only_visible_to_their_owner(auth_client, fake_ingestion_queue):
+    with TestingSessionLocal() as db:
+        for job_id, owner in [("own-job", "testuser"), ("other-job", "someone")]:
+            db.merge(
+                models.IngestionJob(
+                    id=job_id, kind="documents", owner=owner, status="completed"
+                )
+            )
+        db.commit()
+
+    assert auth_client.get("/rag/jobs/own-job").status_code == 200
+    assert auth_client.get("/rag/jobs/other-job").status_code == 404
+
+
+def test_stats_are_gathered_off_the_event_loop(
+    auth_client, fake_rag_service, monkeypatch
+):
+    def get_stats():
+        with pytest.raises(RuntimeError):
+            asyncio.get_running_loop()
+        return {"vectorstore": {"chunks": 0}}
+
+    monkeypatch.setattr(fake_rag_service, "get_stats", get_stats)
+
+    response = auth_client.get("/rag/stats")
+
+    assert response.status_code == 200
+    assert response.json()["vectorstore"] == {"chunks": 0}
+    assert "token_cache" in response.json()["auth"]
@@ -0,0 +1,79 @@
+import pytest
+
+from ragoo.core.config import settings
+from ragoo.vectorestore.reranking import _overlap_matrix, select_diverse
+
+
+def candidate(chunk_id, relevance, embedding, content=None):
+    return {
+        "id": chunk_id,
+        "relevance": relevance,
+        "embedding": embedding,
+        "content": content or chunk_id,
+    }
+
+
+def test_near_duplicate_embeddings_are_dropped():
+    candidates = [
+        candidate("a", 1.0, [1.0, 0.0]),
+        candidate("a-copy", 0.99, [1.0, 0.001]),
+        candidate("b", 0.6, [0.0, 1.0]),
+    ]
+
+    picked = select_diverse(candidates, k=3)
+
+    assert [c["id"] for c in picked] == ["a", "b"]
+
+
+def test_diversity_prefers_new_directions():
+    candidates = [
+        candidate("a", 1.0, [1.0, 0.0]),
+        candidate("close", 0.95, [0.8, 0.6]),
+        candidate("other", 0.8, [0.0, 1.0]),
+    ]
+
+    assert [c["id"] for c in select_diverse(candidates, k=2, diversity=0.5)] == [
+        "a",
+        "other",
+    ]
+    assert [c["id"] for c in select_diverse(candidates, k=2, diversity=0.0)] == [
+        "a",
+        "close",
+    ]
+
+
+def test_overlapping_text_spans_are_dropped_without_embeddings():
+    text = "the pump must be primed before the first start of the season"
+    candidates = [
+        candidate("a", 1.0, None, text),
+        candidate("b", 0.9, None, text + " and checked weekly"),
+        candidate("c", 0.5, None, "an unrelated note about the fan"),
+    ]
+
+    picked = select_diverse(candidates, k=3)
+
+    assert [c["id"] for c in picked] == ["a", "c"]
+
+
+def test_query_collapses_duplicate_uploads(fake_chroma_client, monkeypatch):
+    monkeypatch.setattr(settings, "MMR_ENABLED", True)
+    fake_chroma_client.add_documents(
+        documents=["pump priming steps", "pump priming steps", "fan cleaning"],
+        metadata=[{"source": "a.pdf"}, {"source": "a-copy.pdf"}, {"source": "b.pdf"}],
+    )
+
+    results = fake_chroma_client.query("pump priming", k=2, mode="vector")
+
+    assert [r["content"] for r in results] == ["pump priming steps", "fan cleaning"]
+    assert results[0]["distance"] is not None
+
+
+def test_overlap_matrix_is_containment_of_the_smaller_set():
+    sets = [{1, 2, 3, 4}, {3, 4}, {5}, set()]
+
+    overlap = _overlap_matrix(sets)
+
+    for i, a in enumerate(sets):
+        for j, b in enumerate(sets):
+            expected = len(a & b) / min(len(a), len(b)) if a and b else 0.0
+            assert overlap[i, j] == pytest.approx(expected)
@@ -1,4 +1,12 @@
+import asyncio
+import time
+
+from fastapi import HTTPException
+
+from ragoo.core import security
 from ragoo.core.security import (
+    PasswordHasher,
+    TokenCache,
     create_access_token,
     decode_token,
     get_password_hash,
@@ -22,3 +30,43 @@ def test_jwt_flow():
 
 def test_invalid_jwt():
     assert decode_token("invalid.token.here") is None
+
+
+def test_verified_tokens_are_cached_until_expiry(monkeypatch):
+    cache = TokenCache(max_entries=2)
+    monkeypatch.setattr(security, "token_cache", cache)
+    token = create_access_token({"sub": "cached"})
+    decode_token(token)
+    calls = []
+    monkeypatch.setattr(
+        security.jwt, "decode", lambda *args, **kwargs: calls.append(args)
+    )
+
+    assert decode_token(token)["sub"] == "cached"
+    assert calls == []
+    assert cache.stats()["hits"] == 1
+
+    # An entry goes once its token expires
+    cache.put("old", {"sub": "old", "exp": time.time() - 1})
+    assert cache.get("old") is None
+    # and the least recently used one once the cache is full
+    for name in ("a", "b", "c"):
+        cache.put(name, {"sub": name, "exp": time.time() + 60})
+    assert cache.get(token) is None and cache.get("c")["sub"] == "c"
+
+
+def test_password_hasher_sheds_load_beyond_its_queue():
+    hasher = PasswordHasher(max_workers=1, max_queue=0)
+    hashed = get_password_hash("secret")
+
+    async def check_twice():
+        return await asyncio.gather(
+            hasher.verify("secret", hashed),
+            hasher.verify("secret", hashed),
+            return_exceptions=True,
+        )
+
+    first, second = asyncio.run(check_twice())
+    assert first is True
+    assert isinstance(second, HTTPException) and second.status_code == 503
+    assert hasher.stats()["rejected"] == 1
@@ -0,0 +1,62 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from ragoo.services.single_flight import AsyncSingleFlight, SingleFlight
+
+
+def test_concurrent_identical_calls_run_once():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def work():
+        calls.append(1)
+        release.wait(5)
+        return "result"
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        futures = [pool.submit(flight.do, "key", work) for _ in range(4)]
+        while flight.executed + flight.coalesced < 4:
+            time.sleep(0.001)
+        release.set()
+        results = [future.result() for future in futures]
+
+    assert results == ["result"] * 4
+    assert len(calls) == 1
+    assert flight.stats() == {"executed": 1, "coalesced": 3}
+    # Completed calls are not cached
+    assert flight.do("key", lambda: "again") == "again"
+
+
+def test_errors_are_shared_and_not_remembered():
+    flight = SingleFlight()
+
+    with pytest.raises(RuntimeError):
+        flight.do("key", lambda: (_ for _ in ()).throw(RuntimeError("down")))
+
+    assert flight.do("key", lambda: "recovered") == "recovered"
+
+
+def test_async_callers_share_one_task():
+    flight = AsyncSingleFlight()
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return [1.0, 2.0]
+
+    async def main():
+        first = asyncio.ensure_future(flight.do("q", work))
+        others = [flight.do("q", work) for _ in range(3)]
+        await asyncio.sleep(0)
+        first.cancel()  # one caller giving up does not cancel the others
+        return await asyncio.gather(*others)
+
+    assert asyncio.run(main()) == [[1.0, 2.0]] * 3
+    assert len(calls) == 1
+    assert flight.stats() == {"executed": 1, "coalesced": 3}
@@ -0,0 +1,143 @@
+import threading
+
+from ragoo.vectorestore.embedding_cache import content_hash
+
+HASH_A = "a" * 64
+HASH_B = "b" * 64
+
+
+def test_record_keeps_counts_hashes_and_version(make_catalog):
+    catalog = make_catalog("record")
+    catalog.rebuild([])
+    start = catalog.version()
+
+    catalog.record([("a.pdf", HASH_A), ("b.pdf", HASH_B)])
+    catalog.record([("a.pdf", HASH_B)])
+
+    total, rows = catalog.page()
+    assert total == 2
+    assert [(row.name, row.chunk_count) for row in rows] == [("a.pdf", 2), ("b.pdf", 1)]
+    assert catalog.version() == start + 2
+    assert catalog.chunk_total() == 3
+
+    # The source hash does not depend on the order chunks arrived in
+    other = make_catalog("record-other")
+    other.rebuild([("a.pdf", HASH_B), ("a.pdf", HASH_A)])
+    assert other.page()[1][0].content_hash == rows[0].content_hash
+
+
+def test_sources_endpoint_pages_and_revalidates(
+    auth_client, fake_rag_service, make_catalog, monkeypatch
+):
+    catalog = make_catalog("route")
+    catalog.rebuild([(f"doc-{i}.pdf", HASH_A) for i in range(3)])
+    monkeypatch.setattr(fake_rag_service, "source_catalog", catalog)
+
+    response = auth_client.get("/rag/sources", params={"offset": 1, "limit": 1})
+    assert response.status_code == 200
+    assert response.json()["sources"] == ["doc-1.pdf"]
+    assert response.json()["total"] == 3
+    etag = response.headers["etag"]
+
+    cached = auth_client.get("/rag/sources", headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+
+    catalog.record([("doc-3.pdf", HASH_B)])
+    fresh = auth_client.get(
+        "/rag/sources", params={"detail": True}, headers={"If-None-Match": etag}
+    )
+    assert fresh.status_code == 200
+    assert fresh.json()["sources"][0]["chunk_count"] == 1
+
+
+def manual(*chunks):
+    return [(chunk, {"source": "manual.pdf"}) for chunk in chunks]
+
+
+def test_replace_keeps_unchanged_chunks_and_prunes_stale(fake_rag_service):
+    embedder = fake_rag_service.vectorstore.embedding_function.client
+    fake_rag_service.add_documents(manual("intro", "old step", "appendix"))
+    fake_rag_service.add_documents([("other", {"source": "other.pdf"})])
+    embedded = len(embedder.embedded)
+
+    result = fake_rag_service.add_documents(
+        manual("intro", "new step", "appendix"), replace=True
+    )
+
+    assert (result["new"], result["skipped"], result["removed"]) == (1, 2, 1)
+    assert embedder.embedded[embedded:] == ["new step"]
+    stored = fake_rag_service.vectorstore.source_chunks("manual.pdf")
+    assert set(stored) == set(result["ids"])
+    total, rows = fake_rag_service.source_catalog.page()
+    assert [(row.name, row.chunk_count) for row in rows] == [
+        ("manual.pdf", 3),
+        ("other.pdf", 1),
+    ]
+    results = fake_rag_service.vectorstore.query("old step", mode="lexical")
+    assert "old step" not in [r["content"] for r in results]
+
+
+def test_delete_source_endpoint(auth_client, fake_rag_service):
+    fake_rag_service.add_documents(manual("intro", "steps"))
+
+    response = auth_client.delete("/rag/sources/manual.pdf")
+
+    assert response.status_code == 200
+    assert response.json()["deleted_count"] == 2
+    assert fake_rag_service.vectorstore.collection.count() == 0
+    assert fake_rag_service.get_unique_sources() == []
+    assert len(fake_rag_service.vectorstore.lexical_index) == 0
+    assert auth_client.delete("/rag/sources/manual.pdf").status_code == 404
+
+
+def test_catalogs_of_other_collections_are_left_alone(make_catalog):
+    first, second = make_catalog("first"), make_catalog("second")
+    first.record([("a.pdf", HASH_A)])
+    second.record([("a.pdf", HASH_B), ("b.pdf", HASH_B)])
+
+    first.rebuild([("c.pdf", HASH_A)])
+
+    assert first.names() == ["c.pdf"]
+    assert second.names() == ["a.pdf", "b.pdf"]
+    assert second.page()[1][0].content_hash == HASH_B
+    assert (first.chunk_total(), second.chunk_total()) == (1, 2)
+
+
+def test_backfill_hashes_legacy_chunks_by_their_text(fake_rag_service, make_catalog):
+    # Written by the batch scripts: no content_hash in the metadata
+    fake_rag_service.vectorstore.collection.add(
+        ids=["legacy-1"],
+        documents=["pump priming steps"],
+        metadatas=[{"source": "old.pdf"}],
+    )
+    assert fake_rag_service.sync_source_catalog()
+
+    ingested = make_catalog("ingested")
+    ingested.record([("old.pdf", content_hash("pump priming steps"))])
+    assert (
+        fake_rag_service.source_catalog.page()[1][0].content_hash
+        == ingested.page()[1][0].content_hash
+    )
+    assert fake_rag_service.vectorstore.source_chunks("old.pdf") == {
+        "legacy-1": content_hash("pump priming steps")
+    }
+
+
+def test_writers_sharing_a_database_do_not_lose_updates(make_catalog):
+    # Separate catalogs stand in for separate processes: no shared lock
+    catalogs = [make_catalog("shared") for _ in range(4)]
+    catalogs[0].rebuild([])
+    start = catalogs[0].version()
+
+    def write(catalog):
+        for _ in range(10):
+            catalog.record([("a.pdf", HASH_A)])
+
+    threads = [threading.Thread(target=write, args=(c,)) for c in catalogs]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert catalogs[0].chunk_total() == 40
+    assert catalogs[0].version() == start + 40
@@ -0,0 +1,129 @@
+# Test lazy startup and readiness
+import asyncio
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from ragoo import main
+from ragoo.core.config import settings
+from ragoo.core.security import PasswordHasher
+from ragoo.database import models
+from ragoo.database.database import async_database_url, create_db_engine, get_async_db
+from ragoo.services import ingestion_service, rag_service
+
+
+def test_importing_the_app_builds_no_services():
+    code = (
+        "import sys\n"
+        "import ragoo.main\n"
+        "from ragoo.services import ingestion_service, rag_service\n"
+        "assert rag_service._rag_service is None\n"
+        "assert ingestion_service._ingestion_queue is None\n"
+        "assert 'chromadb' not in sys.modules\n"
+    )
+    subprocess.run([sys.executable, "-c", code], check=True)
+
+
+@pytest.fixture
+def started_services(fake_rag_service, fake_ingestion_queue, monkeypatch):
+    """The lifespan picks up the fake services as the shared ones"""
+    monkeypatch.setattr(rag_service, "_rag_service", fake_rag_service)
+    monkeypatch.setattr(ingestion_service, "_ingestion_queue", fake_ingestion_queue)
+    # Shutdown stops the hasher, which later tests still need
+    monkeypatch.setattr(main, "password_hasher", PasswordHasher())
+    monkeypatch.setattr(settings, "WARMUP_MODELS", True)
+    return fake_rag_service
+
+
+def wait_until_ready(client, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while (response := client.get("/ready")).status_code == 503:
+        assert response.json()["status"] != "failed"
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    return response
+
+
+def test_ready_waits_for_the_model_warm_up(started_services, monkeypatch):
+    release = threading.Event()
+
+    async def warm_up():
+        await asyncio.to_thread(release.wait, 5)
+        return {"chat": 12.5}
+
+    monkeypatch.setattr(started_services.async_llm, "warm_up", warm_up)
+
+    with TestClient(main.app) as client:
+        assert client.get("/health").status_code == 200
+        assert client.get("/ready").status_code == 503
+        release.set()
+        body = wait_until_ready(client).json()
+
+    assert body["status"] == "ready"
+    assert body["ready_ms"] is not None
+    assert [name for name in body["steps"]] == [
+        "database",
+        "rag_service",
+        "source_catalog",
+        "ingestion_queue",
+        "models",
+    ]
+    assert body["steps"]["models"]["status"] == "done"
+    assert body["steps"]["models"]["load_ms"] == {"chat": 12.5}
+
+
+def test_failed_warm_up_does_not_block_readiness(started_services, monkeypatch):
+    async def warm_up():
+        raise RuntimeError("Ollama API error: connection refused")
+
+    monkeypatch.setattr(started_services.async_llm, "warm_up", warm_up)
+
+    with TestClient(main.app) as client:
+        body = wait_until_ready(client).json()
+
+    assert body["status"] == "ready"
+    assert body["steps"]["models"]["status"] == "failed"
+    assert "connection refused" in body["steps"]["models"]["error"]
+
+
+def test_users_can_register_right_after_startup(
+    started_services, tmp_path, monkeypatch
+):
+    # A fresh database, so only the lifespan can have created the tables
+    url = f"sqlite:///{tmp_path / 'fresh.db'}"
+    fresh_engine = create_db_engine(url)
+    fresh_sessions = async_sessionmaker(
+        create_async_engine(async_database_url(url), poolclass=NullPool),
+        expire_on_commit=False,
+    )
+    create_all = models.Base.metadata.create_all
+
+    def slow_create_all(bind):
+        time.sleep(0.5)  # as with a large schema or a remote database
+        create_all(bind=bind)
+
+    async def fresh_async_db():
+        async with fresh_sessions() as db:
+            yield db
+
+    monkeypatch.setattr(main, "engine", fresh_engine)
+    monkeypatch.setattr(models.Base.metadata, "create_all", slow_create_all)
+    main.app.dependency_overrides[get_async_db] = fresh_async_db
+    try:
+        with TestClient(main.app) as client:
+            response = client.post(
+                "/users/register",
+                json={"username": "early", "email": "e@example.com", "password": "pw"},
+            )
+    finally:
+        main.app.dependency_overrides.clear()
+        fresh_engine.dispose()
+
+    assert response.status_code == 200
+    assert response.json()["username"] == "early"
@@ -46,3 +46,28 @@ def test_login_invalid_credentials(client):
         "/users/login", data={"username": "testuser", "password": "wrong"}
     )
     assert response.status_code == 401
+
+
+def test_repeated_login_skips_the_database(client, monkeypatch):
+    from ragoo.services import user_service
+
+    client.post(
+        "/users/register",
+        json={"username": "cached", "email": "c@example.com", "password": "pw"},
+    )
+    login = {"username": "cached", "password": "pw"}
+    assert client.post("/users/login", data=login).status_code == 200
+
+    queries = []
+    original = user_service.get_user_by_username
+    monkeypatch.setattr(
+        user_service,
+        "get_user_by_username",
+        lambda db, name: queries.append(name) or original(db, name),
+    )
+    assert client.post("/users/login", data=login).status_code == 200
+    assert (
+        client.post("/users/login", data={**login, "password": "no"}).status_code == 401
+    )
+    assert queries == []
+    assert user_service.user_cache.stats()["hits"] == 2
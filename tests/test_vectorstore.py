@@ -1,3 +1,6 @@
+import threading
+
+
 def test_add_and_query_document(test_chroma_client):
     test_doc = "Sample document text"
     # Add non-empty metadata
@@ -15,3 +18,86 @@ def test_empty_metadata_handling(test_chroma_client):
     test_chroma_client.add_documents(documents=[test_doc], metadata=[{}])
     results = test_chroma_client.query(test_doc)
     assert len(results) > 0
+
+
+def test_add_documents_is_idempotent(fake_chroma_client):
+    docs = ["alpha chunk", "beta chunk"]
+    meta = [{"source": "manual.pdf"}, {"source": "manual.pdf"}]
+
+    first = fake_chroma_client.add_documents(documents=docs, metadata=meta)
+    second = fake_chroma_client.add_documents(documents=docs, metadata=meta)
+
+    assert first["new"] == 2 and first["skipped"] == 0
+    assert second["new"] == 0 and second["skipped"] == 2
+    assert first["ids"] == second["ids"]
+    assert fake_chroma_client.collection.count() == 2
+    assert fake_chroma_client.embedding_function.client.embedded == docs
+
+
+def test_same_chunk_in_other_source_gets_own_id(fake_chroma_client):
+    result = fake_chroma_client.add_documents(
+        documents=["shared text", "shared text"],
+        metadata=[{"source": "a.pdf"}, {"source": "b.pdf"}],
+    )
+
+    assert result["new"] == 2
+    assert result["ids"][0] != result["ids"][1]
+
+
+def test_concurrent_adds_store_each_chunk_once(fake_chroma_client):
+    docs = ["alpha chunk", "beta chunk", "gamma chunk"]
+    meta = [{"source": "manual.pdf"}] * len(docs)
+    both_embedding = threading.Barrier(2, timeout=10)
+    embed = fake_chroma_client.embed
+
+    def embed_together(texts):
+        # Both writers are past the existence check before either stores
+        both_embedding.wait()
+        return embed(texts)
+
+    fake_chroma_client.embed = embed_together
+    results = []
+    writers = [
+        threading.Thread(
+            target=lambda: results.append(
+                fake_chroma_client.add_documents(documents=docs, metadata=meta)
+            )
+        )
+        for _ in range(2)
+    ]
+    for writer in writers:
+        writer.start()
+    for writer in writers:
+        writer.join()
+
+    assert fake_chroma_client.count() == len(docs)
+    assert sorted(result["new"] for result in results) == [0, len(docs)]
+    assert sorted(len(result["added"]) for result in results) == [0, len(docs)]
+
+
+def test_concurrent_adds_differing_in_whitespace_embed_their_own_text(
+    fake_chroma_client,
+):
+    embedder = fake_chroma_client.embedding_function.client
+    both_in_flight = threading.Barrier(2, timeout=10)
+    embed = embedder.embed
+
+    def embed_together(texts):
+        both_in_flight.wait()
+        return embed(texts)
+
+    embedder.embed = embed_together
+    writers = [
+        threading.Thread(
+            target=fake_chroma_client.add_documents,
+            args=([text], [{"source": "manual.pdf"}]),
+        )
+        for text in ("pump  seal", "pump seal")
+    ]
+    for writer in writers:
+        writer.start()
+    for writer in writers:
+        writer.join()
+
+    assert sorted(embedder.embedded) == ["pump  seal", "pump seal"]
+    assert fake_chroma_client.count() == 2